@@ -0,0 +1,109 @@
+# actors.py
+import queue, time
+
+
+class RoomActor:
+    __slots__ = ("rid", "mailbox", "busy", "processed", "errors", "max_depth", "wait_total", "wait_max", "run_total", "run_max")
+
+    def __init__(self, rid):
+        self.rid = rid
+        self.busy = False
+        self.mailbox = queue.Queue()    # monkey_patch 之后为 green 队列
+        self.processed = self.errors = self.max_depth = 0
+        self.wait_total = self.wait_max = self.run_total = self.run_max = 0.0
+
+    def stats(self):
+        n = self.processed or 1
+        return {
+            "depth": self.mailbox.qsize(), "max_depth": self.max_depth,
+            "processed": self.processed, "errors": self.errors,
+            "wait_avg_ms": self.wait_total / n * 1000, "wait_max_ms": self.wait_max * 1000,
+            "run_avg_ms": self.run_total / n * 1000, "run_max_ms": self.run_max * 1000,
+        }
+
+
+class ActorSystem:
+    """
+    每个房间一个 actor：一个邮箱 + 一个消费 greenthread，按到达顺序逐条执行命令
+    - 同一房间的所有修改 (玩家事件、定时器回调、广播) 都通过 tell 投递，互不交错，无需加锁
+    - 命令执行中即使让出 (emit 等)，同房间的下一条命令也要等它结束才开始
+    - actor 首次收到命令时创建，空闲 idle_timeout 秒后自动退出，下次 tell 重新创建
+    - 记录每个房间的队列深度、排队等待与执行耗时
+    - after(rid) 在每条命令之后调用 (如把房间写回共享状态后端)；tell_readonly 投递的命令不修改房间状态，执行后不调用
+    spawn 为 None 时不启动消费 greenthread，tell 在调用方中同步执行完邮箱 (回放 / 测试用，执行顺序完全确定)
+    """
+
+    def __init__(self, spawn, clock=time.perf_counter, idle_timeout=30.0, after=None):
+        self.spawn, self.clock, self.idle_timeout, self.after = spawn, clock, idle_timeout, after
+        self._actors = {}       # rid -> RoomActor
+        self.retired = {"processed": 0, "errors": 0}
+
+    def tell(self, rid, fn, *args):
+        """把命令 fn(*args) 投递到房间 rid 的邮箱，立即返回"""
+        self._put(rid, fn, args, True)
+
+    def tell_readonly(self, rid, fn, *args):
+        """同 tell，但命令只读取房间 (广播、补发快照、聊天分页等)，执行后不调用 after"""
+        self._put(rid, fn, args, False)
+
+    def _put(self, rid, fn, args, writes):
+        actor = self._actors.get(rid)
+        if actor is None:
+            actor = self._actors[rid] = RoomActor(rid)
+            if self.spawn: self.spawn(self._consume, actor)
+        actor.mailbox.put((fn, args, self.clock(), writes))
+        depth = actor.mailbox.qsize()
+        if depth > actor.max_depth: actor.max_depth = depth
+        if self.spawn is None and not actor.busy: self._drain(actor)
+
+    def _drain(self, actor):
+        # 命令中再向同一房间 tell 时只入队，由外层循环接着执行，不会重入
+        actor.busy = True
+        try:
+            while not actor.mailbox.empty(): self._run(actor, *actor.mailbox.get_nowait())
+        finally: actor.busy = False
+
+    def _consume(self, actor):
+        while True:
+            try: fn, args, queued, writes = actor.mailbox.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # 超时与 put 同时发生时邮箱里可能还有命令，继续消费
+                if not actor.mailbox.empty(): continue
+                if self._actors.get(actor.rid) is actor: del self._actors[actor.rid]
+                self.retired["processed"] += actor.processed
+                self.retired["errors"] += actor.errors
+                return
+            self._run(actor, fn, args, queued, writes)
+
+    def _run(self, actor, fn, args, queued, writes=True):
+        start = self.clock()
+        try: fn(*args)
+        except Exception as e:
+            actor.errors += 1
+            print(f"Actor error ({actor.rid}) {getattr(fn, '__name__', fn)}: {e}")
+        if writes and self.after and actor.rid is not None:
+            try: self.after(actor.rid)
+            except Exception as e: print(f"Actor after-hook error ({actor.rid}): {e}")
+        end = self.clock()
+        wait, run = start - queued, end - start
+        actor.processed += 1
+        actor.wait_total += wait; actor.run_total += run
+        if wait > actor.wait_max: actor.wait_max = wait
+        if run > actor.run_max: actor.run_max = run
+
+    def depth(self, rid):
+        actor = self._actors.get(rid)
+        return actor.mailbox.qsize() if actor else 0
+
+    def stats(self, rid=None):
+        if rid is not None:
+            actor = self._actors.get(rid)
+            return actor.stats() if actor else None
+        rooms = {r: a.stats() for r, a in self._actors.items()}
+        return {
+            "actors": len(rooms),
+            "depth": sum(s["depth"] for s in rooms.values()),
+            "processed": self.retired["processed"] + sum(s["processed"] for s in rooms.values()),
+            "errors": self.retired["errors"] + sum(s["errors"] for s in rooms.values()),
+            "rooms": rooms,
+        }
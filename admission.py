@@ -0,0 +1,101 @@
+# admission.py
+import collections, time
+
+# 事件优先级：过载时先丢弃 LOW (选择同步、聊天)，再丢弃 NORMAL；CRITICAL (部署、攻击等对局操作) 只受令牌桶限制
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = ("critical", "normal", "low")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp", "denied")
+
+    def __init__(self, burst, now):
+        self.tokens, self.stamp = float(burst), now
+        self.denied = False         # 上一次是否被拒绝：连续拒绝只通知客户端一次
+
+
+class LagMonitor:
+    """
+    事件循环延迟：后台任务每 interval 秒 sleep 一次，实际醒来比预期晚的时间即为延迟
+    lag 取最近一次与指数滑动平均中的较大者：突发的长阻塞立即生效，恢复时平滑下降
+    """
+
+    def __init__(self, sleep, interval=0.1, alpha=0.3, clock=time.perf_counter):
+        self.sleep, self.interval, self.alpha, self.clock = sleep, interval, alpha, clock
+        self.last = self.avg = self.max = 0.0
+        self._running = False
+
+    @property
+    def lag(self):
+        return max(self.last, self.avg)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            start = self.clock()
+            self.sleep(self.interval)
+            self.last = max(0.0, self.clock() - start - self.interval)
+            self.avg += self.alpha * (self.last - self.avg)
+            if self.last > self.max: self.max = self.last
+
+    def stop(self):
+        self._running = False
+
+
+class AdmissionController:
+    """
+    Socket.IO 事件的准入控制，在事件进入房间邮箱之前判定
+    - 每个 (sid, 事件) 一个令牌桶：每秒补充 rate 个，最多 burst 个，令牌不足时拒绝 ("limited")
+    - 事件循环延迟 lag() 超过 shed_low 时丢弃 LOW 事件，超过 shed_normal 时再丢弃 NORMAL 事件 ("shed")，
+      被丢弃的事件不消耗令牌
+    - policy: {事件名: (优先级, rate, burst)}，未列出的事件使用 default
+    - decisions[(事件, 结果)] 为累计次数，结果为 ok / limited / shed
+    """
+
+    def __init__(self, policy, default=(NORMAL, 10, 20), lag=lambda: 0.0, shed_low=0.05, shed_normal=0.2,
+                 clock=time.monotonic, enabled=True):
+        self.policy, self.default, self.lag = policy, default, lag
+        self.shed_low, self.shed_normal, self.clock, self.enabled = shed_low, shed_normal, clock, enabled
+        self._buckets = {}      # sid -> {事件: TokenBucket}
+        self.decisions = collections.Counter()
+
+    def level(self):
+        """当前丢弃的优先级下限：只接收优先级 < level 的事件 (3 表示全部接收)"""
+        lag = self.lag()
+        if lag >= self.shed_normal: return NORMAL
+        if lag >= self.shed_low: return LOW
+        return LOW + 1
+
+    def check(self, sid, event):
+        """返回 (结果, 是否为连续拒绝中的第一次)"""
+        if not self.enabled: return "ok", False
+        priority, rate, burst = self.policy.get(event, self.default)
+        now = self.clock()
+        buckets = self._buckets.get(sid)
+        if buckets is None: buckets = self._buckets[sid] = {}
+        b = buckets.get(event)
+        if b is None: b = buckets[event] = TokenBucket(burst, now)
+        else:
+            b.tokens = min(burst, b.tokens + (now - b.stamp) * rate)
+            b.stamp = now
+        if priority >= self.level(): decision = "shed"
+        elif b.tokens >= 1:
+            b.tokens -= 1
+            decision = "ok"
+        else: decision = "limited"
+        self.decisions[(event, decision)] += 1
+        if decision == "ok":
+            b.denied = False
+            return decision, False
+        first, b.denied = not b.denied, True
+        return decision, first
+
+    def drop(self, sid):
+        self._buckets.pop(sid, None)
+
+    def stats(self):
+        out = collections.Counter()
+        for (_, decision), n in self.decisions.items(): out[decision] += n
+        level = self.level()
+        return {"clients": len(self._buckets), "shedding": PRIORITY_NAMES[level] if level <= LOW else None,
+                "lag_ms": self.lag() * 1000, **out}
@@ -1,403 +1,908 @@
 import eventlet
 eventlet.monkey_patch()
 
-import time, random, uuid, io, os
+import time, random, io, os, multiprocessing, gc, atexit
+import greenlet
+from eventlet import tpool
 from flask import Flask, render_template, request, send_file, send_from_directory
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from PIL import Image 
-from game_logic import validate_defense, calculate_grade
+from flask_socketio import SocketIO, emit
+from game_logic import (validate_defense, calculate_grade, BoxSet, Match, ATTEMPTS, strategy_allowed,
+                        compare_outcome, guess_outcome, s4_found, s4_pick_limit, s4_pick_targets)
+from thumbnails import ThumbnailCache, negotiate_format, supported_formats
+from workers import PoolSaturated, pool_from_env
+from registry import Registry
+from state_channel import StateChannel, ClientSync, encode
+from scheduler import BroadcastScheduler
+from timers import TimerService
+from actors import ActorSystem
+from backends import backend_from_env, shard_for
+from bots import BotHub, POLICIES
+from metrics import Metrics, SamplingProfiler, SIZE_BUCKETS, metered_packet_class
+from lobby import LobbyIndex, BUCKETS, PAGE_LIMIT, MAX_PAGE_LIMIT, ROOM_CAPACITY
+from records import ChatLog, GameRecordLog
+from admission import AdmissionController, LagMonitor, CRITICAL, NORMAL, LOW
+from codec import STRINGS as PACKED_STRINGS, GRADES as PACKED_GRADES, pack
+from snapshots import RoomStore
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret_key_haff_arena_v2'
 
 # 配置 SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', ping_timeout=60, ping_interval=25)
+# 多进程部署时设置 SOCKETIO_MESSAGE_QUEUE (如 redis://localhost:6379/0)，任一进程的广播经消息队列扇出到所有进程的连接
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', ping_timeout=60, ping_interval=25,
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
 
-rooms = {}
-online_users = {}
-reset_timers = {}
+# --- 分片 ---
+# 多进程部署：每个进程以 SHARD_INDEX=k (0 <= k < SHARD_COUNT) 启动 (gunicorn -w 1 -k eventlet)，
+# 前端代理按连接 URL 上的 ?shard=k 粘性路由 (如 nginx 的 hash $arg_shard)。
+# 房间按 shard_for(房间号) 固定归属一个进程，只有该进程修改房间；
+# 发到其他分片的房间事件会收到 shard_redirect，前端带上 shard 重连后重发。
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
 
-def get_lobby_data():
-    active_rooms = []
-    for rid, r in rooms.items():
-        active_rooms.append({
-            "id": rid, "owner": r['owner'], "count": len(r['players']), "state": r['state']
-        })
-    return active_rooms
+def owns(rid):
+    return rid is None or SHARD_COUNT <= 1 or shard_for(rid, SHARD_COUNT) == SHARD_INDEX
+
+# --- 时钟与随机数 ---
+# 对局倒计时、定时器与推送时间戳都通过 clock() 取时间，开局配对与编号由 draw_seed(rid) 取的种子派生；
+# 回放 (bench/replay.py) 时替换为虚拟时钟与录制下来的种子，同一段录制每次回放的结果完全相同
+clock = time.time
+
+def draw_seed(rid):
+    return random.getrandbits(64)
+
+# --- 指标 ---
+# METRICS=1 时记录处理耗时与推送字节数，在 /metrics 以 Prometheus 文本格式导出；未开启时热路径上只多一次布尔判断
+metrics = Metrics(enabled=bool(os.environ.get('METRICS')), prefix='pig_')
+metrics.histogram('handler_seconds', 'Socket.IO 事件 / 房间命令的处理耗时', labels=('event',))
+metrics.histogram('function_seconds', '热点函数耗时', labels=('fn',))
+metrics.histogram('timer_seconds', '定时器回调的执行耗时', labels=('callback',))
+metrics.histogram('emit_bytes', '每次 emit 的负载字节数 (广播只计一次)', labels=('event',), buckets=SIZE_BUCKETS)
+socketio.server.packet_class = metered_packet_class(socketio.server.packet_class, metrics, 'emit_bytes')
+profiler = SamplingProfiler()
+
+# 默认为进程内状态；STATE_BACKEND=redis://... 时房间写回 Redis，大厅列表跨进程共享
+backend = backend_from_env(owns=owns)
+rooms = backend.rooms
+registry = Registry()
+
+def persist_room(rid):
+    room = rooms.get(rid)
+    if room: backend.save_room(rid, room)
+    else: backend.delete_room(rid)
+    if store: store.put(rid, room_record(rid, room) if room else None)
+    lobby.update(rid, room)
+
+# 每个房间一个 actor：玩家事件、定时器回调、tick 广播都投递到房间邮箱中串行执行，执行完写回状态后端；
+# 只读的命令 (ack 补发快照、重新同步、聊天、选择同步、tick 广播) 经 tell_readonly 投递，不做整房间序列化
+actors = ActorSystem(spawn=socketio.start_background_task, after=persist_room)
+# 所有回合倒计时与自动重置共用一个定时器后台任务；到期回调的第一个参数是房间号，投递到对应房间
+timers = TimerService(spawn=lambda fn, rid, *args: actors.tell(rid, metrics.timed('timer_seconds', fn.__name__)(fn), rid, *args),
+                      clock=lambda: clock())
+channels = {}        # rid -> {match_id: StateChannel}
+chats = {}           # rid -> ChatLog，只保留最近 CHAT_LIMIT 条
+CHAT_LIMIT = int(os.environ.get('CHAT_LIMIT', 200))
+# 结束的回合与游戏总结追加写入压缩日志 (GAME_LOG_DIR 设为空时关闭)；内存中只保留当前这一局的 history
+GAME_LOG_DIR = os.environ.get('GAME_LOG_DIR', os.path.join(app.root_path, 'cache', 'games'))
+game_log = GameRecordLog(GAME_LOG_DIR, prefix=f"games-s{SHARD_INDEX}") if GAME_LOG_DIR else None
+
+def record_game(record):
+    if not game_log: return
+    try: game_log.append(record)
+    except OSError as e: print(f"Game log error: {e}")
+
+# --- 录制 ---
+# 设置 RECORD_DIR 时把通过准入的入站事件 (连接 / 断开、大厅与房间事件、ack) 连同开局种子按到达顺序写入压缩日志，
+# 每条 {"ts", "sid", "event", "room", "data"}；bench/replay.py 按房间拆成会话离线回放
+RECORD_DIR = os.environ.get('RECORD_DIR')
+session_log = GameRecordLog(RECORD_DIR, prefix=f"sessions-s{SHARD_INDEX}", clock=lambda: clock()) if RECORD_DIR else None
+
+def record_event(event, sid, rid, data):
+    try: session_log.append({"sid": sid, "event": event, "room": rid, "data": data})
+    except (OSError, TypeError, ValueError) as e: print(f"Session log error: {e}")
+
+# --- 快照 ---
+# 设置 SNAPSHOT_DIR 时，每条修改房间的命令执行完把房间 (含防守部署) 与待触发的定时器写入本地 WAL，后台每 SNAPSHOT_INTERVAL 秒
+# 生成增量快照；进程重启后先恢复房间与倒计时，玩家通过 reconnect_user 回到对局 (聊天与观战关系不保存)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+store = RoomStore(os.path.join(SNAPSHOT_DIR, f"shard-{SHARD_INDEX}"), interval=float(os.environ.get('SNAPSHOT_INTERVAL', 30)),
+                  sleep=socketio.sleep, offload=tpool.execute) if SNAPSHOT_DIR else None
+client_sync = ClientSync()
+
+# --- 大厅 ---
+# 在大厅中的连接按筛选条件加入 Socket.IO 房间 :lobby:<state>:<free>；每条房间命令之后比对房间摘要，变化累积为增量，
+# 每 tick 为每个有观看者的筛选条件合并成一条 lobby_delta (只含与该条件有关的房间)；进入大厅 / 翻页 / 筛选时单独下发一页 lobby_update
+# 翻页不分组：增删房间会移动所有页的边界并改变总数，同一筛选条件下的各页收到相同的增量
+LOBBY_ROOM = ':lobby'
+def lobby_room(state, free): return f"{LOBBY_ROOM}:{state or ''}:{free}"
+LOBBY_BUCKETS = {lobby_room(*bucket): bucket for bucket in BUCKETS}
+lobby_views = {}     # sid -> 所在的大厅分组房间
+
+def lobby_buckets():
+    """当前有观看者的筛选条件；多进程时看不到其他进程的观看者，全部发送"""
+    if SHARED_ROOMS: return BUCKETS
+    live = socketio.server.manager.rooms.get('/', {})
+    return [bucket for name, bucket in LOBBY_BUCKETS.items() if name in live]
+
+lobby = LobbyIndex(emit=lambda bucket, data: socketio.emit('lobby_delta', data, room=lobby_room(*bucket)),
+                   sleep=socketio.sleep, tick=int(os.environ.get('LOBBY_TICK_MS', 500)) / 1000,
+                   remote=getattr(backend, 'remote_lobby', None), buckets=lobby_buckets)
+
+def lobby_query(data):
+    """客户端的筛选 / 分页参数 -> LobbyIndex.page 的参数，非法值回落为默认"""
+    def num(key, default, lo, hi):
+        try: return min(max(int(data.get(key, default)), lo), hi)
+        except (TypeError, ValueError): return default
+    return {"state": data.get('state') if data.get('state') in ("LOBBY", "GAME") else None,
+            "free": num('free', 0, 0, ROOM_CAPACITY), "offset": num('offset', 0, 0, 10 ** 6),
+            "limit": num('limit', PAGE_LIMIT, 1, MAX_PAGE_LIMIT)}
+
+def show_lobby(sid, query=None):
+    """sid 回到大厅：加入筛选条件对应的大厅分组房间，并发送一页房间列表 (离开房间后立即断开的连接直接跳过)"""
+    if not socketio.server.manager.is_connected(sid, '/'): return
+    query = lobby_query(query or {})
+    name = lobby_room(query['state'], query['free'])
+    if lobby_views.get(sid) != name:
+        leave_lobby(sid)
+        socketio.server.enter_room(sid, name, namespace='/')
+        lobby_views[sid] = name
+    socketio.emit('lobby_update', lobby.page(**query), to=sid)
+
+def leave_lobby(sid):
+    name = lobby_views.pop(sid, None)
+    if name: socketio.server.leave_room(sid, name, namespace='/')
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', packed_strings=PACKED_STRINGS, packed_grades=PACKED_GRADES)
 
 # === 缩略图生成路由 ===
+# 每张卡只渲染一次：磁盘缓存按源文件 mtime + 宽度 + 格式命名，内存 LRU 保存编码后的字节
+# 缩放/编码在独立进程池中执行，池满时按 THUMB_ON_SATURATED 返回 503 或原图
+THUMB_MAX_AGE = 30 * 24 * 3600
+THUMB_WIDTHS = (120, 250, 500)
+THUMB_ON_SATURATED = os.environ.get('THUMB_ON_SATURATED', '503')
+image_pool = pool_from_env('IMAGE')
+thumb_cache = ThumbnailCache(
+    os.path.join(app.root_path, 'static', 'cards'),
+    os.path.join(app.root_path, 'cache', 'thumbnails'),
+    width=250, max_bytes=int(os.environ.get('THUMB_CACHE_BYTES', 16 * 1024 * 1024)), pool=image_pool)
+
 @app.route('/thumbnail/<path:filename>')
+@metrics.timed('function_seconds', 'serve_thumbnail')
 def serve_thumbnail(filename):
+    width = request.args.get('w', 250, type=int)
+    if width not in THUMB_WIDTHS: return "Unsupported width", 400
+    fmt = negotiate_format(request.headers.get('Accept'))
     try:
-        file_path = os.path.join(app.root_path, 'static', 'cards', filename)
-        if not os.path.exists(file_path): return "File not found", 404
-        
-        img = Image.open(file_path)
-        if img.width <= 250: return send_from_directory(os.path.join(app.root_path, 'static', 'cards'), filename)
-
-        base_width = 250
-        w_percent = (base_width / float(img.size[0]))
-        h_size = int((float(img.size[1]) * float(w_percent)))
-        img = img.resize((base_width, h_size), Image.Resampling.LANCZOS)
-        
-        img_io = io.BytesIO()
-        save_format = img.format if img.format else 'PNG'
-        img.save(img_io, save_format, quality=85)
-        img_io.seek(0)
-        return send_file(img_io, mimetype=f'image/{save_format.lower()}')
+        thumb = thumb_cache.get(filename, width, fmt)
+        if not thumb: return "File not found", 404
+        resp = send_file(io.BytesIO(thumb.data), mimetype=thumb.mimetype, etag=thumb.etag,
+                         last_modified=thumb.mtime, max_age=THUMB_MAX_AGE, conditional=True)
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        resp.vary.add('Accept')
+        return resp
+    except PoolSaturated:
+        if THUMB_ON_SATURATED == 'original':
+            return send_from_directory(os.path.join(app.root_path, 'static', 'cards'), filename)
+        return "Busy", 503, {'Retry-After': '1'}
     except Exception as e:
         print(f"Thumbnail error: {e}")
         return send_from_directory(os.path.join(app.root_path, 'static', 'cards'), filename)
 # ===========================
 
+def greenthread_count():
+    """存活的 greenlet 数 (遍历 gc 对象，只在导出统计时调用)"""
+    return sum(1 for o in gc.get_objects() if isinstance(o, greenlet.greenlet) and not o.dead)
+
+# 压测 / 排障用的运行时统计 (bench/load.py 定时读取)，只在设置 DEBUG_STATS=1 时开放
+@app.route('/debug/stats')
+def debug_stats():
+    if not os.environ.get('DEBUG_STATS'): return "Not found", 404
+    a = actors.stats()
+    return {"rooms": len(rooms), "online": registry.online_count(), "greenthreads": greenthread_count(),
+            "actors": {k: a[k] for k in ("actors", "depth", "processed", "errors")},
+            "broadcast": broadcaster.stats(), "lobby": lobby.stats(), "thumbnails": thumb_cache.stats(),
+            "game_log": game_log.stats() if game_log else None, "session_log": session_log.stats() if session_log else None,
+            "admission": admission.stats(), "store": store.stats() if store else None,
+            "pools": {"image": image_pool.stats(), "bot": bot_pool.stats()}}
+
+# 导出时才读取的现成状态
+def _by_state():
+    out = {}
+    for room in list(rooms.values()): out[(room["state"],)] = out.get((room["state"],), 0) + 1
+    return out
+
+def _actor_commands():
+    a = actors.stats()
+    return {("ok",): a["processed"] - a["errors"], ("error",): a["errors"]}
+
+metrics.gauge('rooms', '房间数 (按状态)', _by_state, labels=('state',))
+metrics.gauge('matches', '进行中的对局数', lambda: sum(len(r["matches"]) for r in list(rooms.values()) if r["state"] == "GAME"))
+metrics.gauge('online_users', '在线用户数', registry.online_count)
+metrics.gauge('greenthreads', '存活的 greenthread 数', greenthread_count)
+metrics.gauge('timer_backlog', '尚未触发的定时器数', timers.backlog)
+metrics.gauge('timer_fired', '已触发的定时器数', lambda: timers.fired, kind='counter')
+metrics.gauge('timer_late_max_seconds', '定时器触发的最大延迟', lambda: timers.late_max)
+metrics.gauge('actors', '活动的房间 actor 数', lambda: actors.stats()["actors"])
+metrics.gauge('actor_queue_depth', '所有房间邮箱中排队的命令数', lambda: actors.stats()["depth"])
+metrics.gauge('actor_commands', '房间 actor 已执行的命令数 (按结果)', _actor_commands, labels=('result',), kind='counter')
+metrics.gauge('broadcast_flushed', '已执行的合并广播数', lambda: broadcaster.flushed, kind='counter')
+metrics.gauge('broadcast_saved', '被合并掉的广播数', lambda: broadcaster.saved, kind='counter')
+metrics.gauge('broadcast_dirty_rooms', '等待下一个 tick 广播的房间数', lambda: broadcaster.stats()["dirty_rooms"])
+metrics.gauge('pool_pending', '进程池中排队 + 执行中的任务数', lambda: {("image",): image_pool.stats()["pending"], ("bot",): bot_pool.stats()["pending"]}, labels=('pool',))
+metrics.gauge('pool_rejected', '进程池满被拒绝的任务数', lambda: {("image",): image_pool.rejected, ("bot",): bot_pool.rejected}, labels=('pool',), kind='counter')
+metrics.gauge('lobby_rooms', '大厅索引中的本进程房间数', lambda: len(lobby))
+metrics.gauge('lobby_deltas', '已推送的大厅增量数', lambda: lobby.deltas, kind='counter')
+metrics.gauge('thumbnail_cache_bytes', '缩略图内存缓存字节数', lambda: thumb_cache.stats()["bytes"])
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.enabled: return "Not found", 404
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# 采样剖析：GET /debug/profile?seconds=10 采样一段时间，返回折叠栈 (flamegraph.pl / speedscope 可直接读取)
+@app.route('/debug/profile')
+def debug_profile():
+    if not metrics.enabled: return "Not found", 404
+    if profiler.running: return "Profiler busy", 409
+    seconds = min(request.args.get('seconds', 10, type=float), 120)
+    profiler.interval = request.args.get('interval_ms', 5, type=float) / 1000
+    profiler.start()
+    try: socketio.sleep(seconds)
+    finally: stacks = profiler.stop()
+    return stacks, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+# --- 准入控制 ---
+# 每个连接的每种事件一个令牌桶；事件循环延迟升高时先丢弃低优先级事件 (选择同步、聊天)，对局操作照常处理
+# RATE_LIMIT=0 关闭限流与丢弃；LAG_SHED_LOW_MS / LAG_SHED_NORMAL_MS 为开始丢弃 LOW / NORMAL 事件的延迟
+lag_monitor = LagMonitor(sleep=socketio.sleep)
+ADMISSION_POLICY = {
+    # 对局操作与状态同步：只限速，不因过载丢弃
+    'submit_defense': (CRITICAL, 2, 5), 'lock_rule': (CRITICAL, 2, 5), 'select_strategy': (CRITICAL, 2, 5),
+    'execute_attack': (CRITICAL, 5, 10), 's4_submit_target': (CRITICAL, 5, 10), 's4_reveal': (CRITICAL, 5, 10),
+    's4_execute_pick': (CRITICAL, 5, 10), 'confirm_summary': (CRITICAL, 2, 5), 'reconnect_user': (CRITICAL, 2, 5),
+    'leave_room': (CRITICAL, 2, 5), 'game_ack': (CRITICAL, 20, 40), 'game_resync': (CRITICAL, 1, 5),
+    # 房间 / 大厅操作
+    'create_room': (NORMAL, 1, 3), 'join_room': (NORMAL, 2, 5), 'set_ready': (NORMAL, 3, 6), 'add_bots': (NORMAL, 1, 3),
+    'start_game': (NORMAL, 1, 3), 'enter_lobby': (NORMAL, 2, 5),
+    # 过载时最先丢弃 (选择同步本身也按 tick 合并，只保留最新一次)
+    'sync_selection_req': (LOW, 10, 20), 'send_chat': (LOW, 2, 5), 'chat_history_req': (LOW, 2, 5), 'lobby_query': (LOW, 5, 10),
+}
+QUIET_EVENTS = {'sync_selection_req', 'game_ack', 'game_resync', 'lobby_query', 'chat_history_req'}   # 客户端自动发出，被拒绝时不提示
+admission = AdmissionController(ADMISSION_POLICY, lag=lambda: lag_monitor.lag, enabled=os.environ.get('RATE_LIMIT', '1') != '0',
+                                shed_low=int(os.environ.get('LAG_SHED_LOW_MS', 50)) / 1000,
+                                shed_normal=int(os.environ.get('LAG_SHED_NORMAL_MS', 200)) / 1000)
+metrics.gauge('admission_decisions', '准入判定次数 (按事件与结果 ok / limited / shed)', lambda: dict(admission.decisions),
+              labels=('event', 'decision'), kind='counter')
+metrics.gauge('event_loop_lag_seconds', '事件循环延迟 (准入控制据此丢弃低优先级事件)', lambda: lag_monitor.lag)
+
+def admit(event):
+    """当前连接的 event 是否放行；连续被拒绝时只在第一次向客户端提示"""
+    decision, first = admission.check(request.sid, event)
+    if decision == "ok": return True
+    if first and event not in QUIET_EVENTS:
+        emit('error', {'msg': '服务器繁忙，请稍后再试' if decision == "shed" else '操作太频繁，请稍后再试'})
+    return False
+
+# --- 房间命令 ---
+# 与房间状态有关的事件都注册为命令：Socket.IO 处理函数只记录 sid 并把 (命令, sid, data) 投递到房间邮箱，
+# 命令在房间 actor 中执行，因此不能使用依赖请求上下文的 emit / join_room，改为显式指定 sid
+commands = {}   # 事件名 -> 命令函数 fn(sid, data)
+
+def room_command(event, route=None, readonly=False):
+    """
+    注册房间命令；route(data) 返回目标房间号，默认取 data['roomId']
+    readonly=True 的命令不修改房间 (及其定时器)，执行后不写回状态后端与快照
+    """
+    def deco(fn):
+        commands[event] = fn
+        timed = metrics.timed('handler_seconds', event)(fn)
+        def handler(data):
+            if not isinstance(data, dict) or not admit(event): return
+            rid = route(data) if route else data.get('roomId')
+            if not owns(rid):
+                return emit('shard_redirect', {'shard': shard_for(rid, SHARD_COUNT), 'event': event, 'data': data})
+            if session_log: record_event(event, request.sid, rid, data)
+            # 没有目标房间的命令 (如不在任何房间的用户重连) 不涉及房间状态，直接在事件处理中执行，不排进同一个 None actor
+            if rid is None: return timed(request.sid, data)
+            (actors.tell_readonly if readonly else actors.tell)(rid, timed, request.sid, data)
+        socketio.on(event)(handler)
+        return fn
+    return deco
+
+# --- 线上编码 ---
+# 连接时 auth={codec: 'packed'} 的客户端 (页面地址带 ?codec=packed) 收到 codec.pack 编码的二进制帧，其余连接仍为 JSON；
+# 只涉及对局与房间状态：game_update / game_delta / room_sync / sync_selection_ui / strat3_hint
+# 每个连接进入房间时同时进入按编码区分的镜像房间 (name#json / name#packed)，广播时每种编码只编码一次
+packed_sids = set()
+SHARED_ROOMS = bool(os.environ.get('SOCKETIO_MESSAGE_QUEUE'))    # 多进程时看不到其他进程的成员，两种编码都发
+
+def codec_room(sid, name): return f"{name}#packed" if sid in packed_sids else f"{name}#json"
+
+def enter_room(sid, rid):
+    socketio.server.enter_room(sid, rid, namespace='/')
+    socketio.server.enter_room(sid, codec_room(sid, rid), namespace='/')
+
+def emit_coded(event, data, *args, sid=None, room=None, json_data=None):
+    """
+    按编码发送 event 给 sid，或广播到 room 的两个镜像房间
+    JSON 连接收到 json_data (默认为 data 本身，由 Socket.IO 序列化)，packed 连接收到 pack(data)
+    """
+    plain = data if json_data is None else json_data
+    frame = lambda payload: (payload, *args) if args else payload
+    if sid is not None: return socketio.emit(event, frame(pack(data) if sid in packed_sids else plain), to=sid)
+    socketio.emit(event, frame(plain), to=f"{room}#json")
+    if SHARED_ROOMS or f"{room}#packed" in socketio.server.manager.rooms.get('/', ()):
+        socketio.emit(event, frame(pack(data)), to=f"{room}#packed")
+
+def room_wire(room, **extra):
+    """房间的线上格式：对局转成纯数据，不含防守部署与本局回合记录 (回合记录只在 show_game_summary 中下发)"""
+    return {**{k: v for k, v in room.items() if k != "history"},
+            "matches": {mid: m.to_wire(with_boxes=False) for mid, m in room["matches"].items()}, **extra}
+
+def exit_room(sid, rid):
+    socketio.server.leave_room(sid, rid, namespace='/')
+    socketio.server.leave_room(sid, codec_room(sid, rid), namespace='/')
+
 @socketio.on('connect')
-def on_connect(): pass
+@metrics.timed('handler_seconds', 'connect')
+def on_connect(auth=None):
+    if isinstance(auth, dict) and auth.get('codec') == 'packed': packed_sids.add(request.sid)
+    if session_log: record_event('connect', request.sid, None, auth)
 
 @socketio.on('disconnect')
+@metrics.timed('handler_seconds', 'disconnect')
 def on_disconnect():
-    if request.sid in online_users: del online_users[request.sid]
+    if session_log: record_event('disconnect', request.sid, registry.room_of(registry.uid_of(request.sid)), None)
+    uid = registry.unbind(request.sid)
+    rid = registry.room_of(uid)
+    # 观战者没有座位，最后一个连接断开即离开房间 (玩家保留座位等待重连)；投递到房间 actor，不与进行中的广播交错
+    if rid is not None and not registry.is_online(uid) and uid in registry.spectators(rid):
+        actors.tell_readonly(rid, drop_offline_spectator, rid, uid)
+    client_sync.drop(request.sid)
+    packed_sids.discard(request.sid)
+    lobby_views.pop(request.sid, None)
+    admission.drop(request.sid)
 
 @socketio.on('enter_lobby')
+@metrics.timed('handler_seconds', 'enter_lobby')
 def on_enter(data):
+    if not isinstance(data, dict) or not admit('enter_lobby'): return
+    if session_log: record_event('enter_lobby', request.sid, None, data)
     uid = data.get('userId')
     if uid:
-        online_users[request.sid] = uid
-        emit('lobby_update', get_lobby_data())
+        registry.bind(request.sid, uid)
+        show_lobby(request.sid, data)
+
+@socketio.on('lobby_query')
+@metrics.timed('handler_seconds', 'lobby_query')
+def on_lobby_query(data):
+    if not isinstance(data, dict) or not admit('lobby_query'): return
+    if session_log: record_event('lobby_query', request.sid, None, data)
+    show_lobby(request.sid, data)
 
-@socketio.on('reconnect_user')
-def on_reconnect(data):
+@room_command('reconnect_user', route=lambda data: data.get('roomId') or registry.room_of(data.get('userId')), readonly=True)
+def on_reconnect(sid, data):
     uid = data.get('userId')
     if not uid: return
-    online_users[request.sid] = uid
-    found_room = None
-    for rid, room in rooms.items():
-        if uid in room["players"]: found_room = room; break
-    if found_room:
+    registry.bind(sid, uid)
+    found_room = rooms.get(registry.room_of(uid))
+    if found_room and uid in found_room["players"]:
         rid = found_room["id"]
-        join_room(rid)
+        enter_room(sid, rid)
         is_spectator = (found_room["state"] == "GAME" and uid not in found_room["players"])
-        emit('join_success', {**found_room, "is_spectator": is_spectator, "is_reconnect": True})
+        socketio.emit('join_success', room_wire(found_room, is_spectator=is_spectator, is_reconnect=True), to=sid)
         if found_room["state"] == "GAME":
-            socketio.sleep(0.5)
             broadcast_game_state(rid, target_uid=uid)
-            emit('reconnect_result', {'success': True, 'msg': f'已重连至房间 {rid}'})
+            socketio.emit('reconnect_result', {'success': True, 'msg': f'已重连至房间 {rid}'}, to=sid)
         else:
-            emit('room_sync', found_room)
-            emit('reconnect_result', {'success': True, 'msg': '已回到准备大厅'})
+            emit_coded('room_sync', room_wire(found_room), sid=sid)
+            socketio.emit('reconnect_result', {'success': True, 'msg': '已回到准备大厅'}, to=sid)
     else:
-        emit('reconnect_result', {'success': True, 'msg': '欢迎回来'})
-        emit('lobby_update', get_lobby_data())
+        socketio.emit('reconnect_result', {'success': True, 'msg': '欢迎回来', 'roomId': None}, to=sid)     # 前端据此清除保存的房间号
+        show_lobby(sid)
 
-@socketio.on('create_room')
-def on_create(data):
+@room_command('create_room')
+def on_create(sid, data):
     rid, uid = data.get('roomId'), data.get('userId')
     if not rid or not uid: return
-    if rid in rooms: return emit('error', {'msg': '房间已存在'})
+    if rid in rooms: return socketio.emit('error', {'msg': '房间已存在'}, to=sid)
     rooms[rid] = {
         "id": rid, "players": [uid], "ready": {uid: False}, "owner": uid,
         "state": "LOBBY", "scores": {uid: 10000}, "matches": {}, "bye_player": None,
-        "chat_history": [], "history": [], "summary_confirms": []
+        "game_id": None, "history": [], "summary_confirms": []
     }
-    join_room(rid)
-    emit('join_success', rooms[rid])
-    socketio.emit('lobby_update', get_lobby_data())
+    enter_room(sid, rid)
+    leave_lobby(sid)
+    registry.enter_room(uid, rid)
+    socketio.emit('join_success', room_wire(rooms[rid]), to=sid)
 
-@socketio.on('join_room')
-def on_join(data):
+@room_command('join_room')
+def on_join(sid, data):
     rid, uid = data.get('roomId'), data.get('userId')
-    if rid not in rooms: return emit('error', {'msg': '房间不存在'})
+    if rid not in rooms: return socketio.emit('error', {'msg': '房间不存在'}, to=sid)
     room = rooms[rid]
-    join_room(rid)
+    enter_room(sid, rid)
     if uid in room["players"]: pass
     elif room["state"] == "GAME":
-        emit('join_success', {**room, "is_spectator": True})
+        registry.enter_room(uid, rid, spectator=True)
+        leave_lobby(sid)
+        socketio.emit('join_success', room_wire(room, is_spectator=True), to=sid)
         broadcast_game_state(rid, target_uid=uid)
         return
     else:
-        if len(room["players"]) >= 10: return emit('error', {'msg': '房间满员'})
+        if len(room["players"]) >= 10: return socketio.emit('error', {'msg': '房间满员'}, to=sid)
         room["players"].append(uid)
         room["ready"][uid] = False
         room["scores"][uid] = 10000
-    emit('join_success', {**room, "is_spectator": False})
-    socketio.emit('lobby_update', get_lobby_data())
-    emit('room_sync', room, room=rid)
+    registry.enter_room(uid, rid)
+    leave_lobby(sid)
+    socketio.emit('join_success', room_wire(room, is_spectator=False), to=sid)
+    emit_coded('room_sync', room_wire(room), room=rid)
 
-@socketio.on('leave_room')
-def on_leave(data):
+@room_command('leave_room')
+def on_leave(sid, data):
     rid, uid = data.get('roomId'), data.get('userId')
     if rid in rooms and uid in rooms[rid]["players"]:
         room = rooms[rid]
-        leave_room(rid)
+        exit_room(sid, rid)
         if room["state"] == "LOBBY":
             room["players"].remove(uid)
             if uid in room["ready"]: del room["ready"][uid]
             if uid in room["scores"]: del room["scores"][uid]
-            if len(room["players"]) == 0: del rooms[rid]
+            registry.leave_room(uid)
+            if len(room["players"]) == 0:
+                del rooms[rid]; registry.drop_room(rid); channels.pop(rid, None); chats.pop(rid, None); timers.cancel_room(rid)
             elif uid == room["owner"]: room["owner"] = room["players"][0]
-            socketio.emit('lobby_update', get_lobby_data())
-            if rid in rooms: emit('room_sync', room, room=rid)
-            emit('leave_success')
-        else: emit('leave_success')
+            if rid in rooms: emit_coded('room_sync', room_wire(room), room=rid)
+        socketio.emit('leave_success', to=sid)
+        show_lobby(sid)
+    elif rid in rooms and drop_spectator(rid, uid):
+        socketio.emit('leave_success', to=sid)
+        show_lobby(sid)
 
-@socketio.on('set_ready')
-def on_ready(data):
+def drop_spectator(rid, uid):
+    """观战者离开房间：移出成员与观战索引，在线的连接退出房间与受众子房间；uid 不是该房间的观战者时返回 False"""
+    if uid not in registry.spectators(rid): return False
+    name = registry.audience_of(uid)
+    for s in registry.sids(uid):
+        exit_room(s, rid)
+        if name: exit_room(s, name)
+    registry.leave_room(uid)
+    return True
+
+def drop_offline_spectator(rid, uid):
+    if not registry.is_online(uid): drop_spectator(rid, uid)      # 排队期间又连上的不移除
+
+@room_command('set_ready')
+def on_ready(sid, data):
     rid, uid = data.get('roomId'), data.get('userId')
     if rid in rooms and uid in rooms[rid]["ready"]:
         rooms[rid]["ready"][uid] = not rooms[rid]["ready"][uid]
-        emit('room_sync', rooms[rid], room=rid)
+        emit_coded('room_sync', room_wire(rooms[rid]), room=rid)
+
+# 机器人玩家：与真人走相同的事件处理；决策在独立进程池中执行 (BOT_WORKERS / BOT_QUEUE)
+bot_pool = pool_from_env('BOT')
+bots = BotHub(socketio, app, pool=bot_pool, think=float(os.environ.get('BOT_THINK', 1.5)))
 
-@socketio.on('send_chat')
-def on_chat(data):
+@room_command('add_bots')
+def on_add_bots(sid, data):
+    rid, uid = data.get('roomId'), data.get('userId')
+    room = rooms.get(rid)
+    if not room or room["owner"] != uid or room["state"] != "LOBBY": return
+    policy = data.get('policy', 'heuristic')
+    if policy not in POLICIES: return socketio.emit('error', {'msg': '未知的机器人策略'}, to=sid)
+    count = min(int(data.get('count', 1)), 10 - len(room["players"]))
+    if count <= 0: return socketio.emit('error', {'msg': '房间满员'}, to=sid)
+    bots.fill(rid, count, policy)
+
+@room_command('send_chat', readonly=True)
+def on_chat(sid, data):
     rid, uid, msg = data.get('roomId'), data.get('userId'), data.get('msg')
     if rid in rooms and msg:
-        payload = {'user': uid, 'msg': msg, 'type': 'chat'}
-        rooms[rid]['chat_history'].append(payload)
-        socketio.emit('chat_message', payload, room=rid)
+        socketio.emit('chat_message', get_chat(rid).append({'user': uid, 'msg': msg, 'type': 'chat'}), room=rid)
+
+def get_chat(rid):
+    chat = chats.get(rid)
+    if chat is None: chat = chats[rid] = ChatLog(CHAT_LIMIT)
+    return chat
+
+@room_command('chat_history_req', readonly=True)
+def on_chat_history(sid, data):
+    """分页拉取聊天记录：before 为客户端已有的最早一条的 seq (为空时取最新的一页)"""
+    rid = data.get('roomId')
+    if rid not in rooms or registry.room_of(registry.uid_of(sid)) != rid: return
+    try:
+        before = int(data['before']) if data.get('before') is not None else None
+        limit = min(max(int(data.get('limit', 50)), 1), 100)
+    except (TypeError, ValueError): return
+    messages, more = get_chat(rid).page(before, limit)
+    socketio.emit('chat_history', {'messages': messages, 'has_more': more}, to=sid)
 
 # --- Game Logic ---
 
-def game_timer_task(rid, match_id, round_num, duration, timer_stamp):
-    socketio.sleep(duration)
+# --- 对局状态机 ---
+# step: SETUP -> ATTACK_SELECT -> ATTACKING -> FINISHING -> (下一回合 SETUP)
+# 任一进行中的阶段都可以因超时直接进入 FINISHING。
+# 带时限的迁移 (展示结果 3 秒、回合总结 4 秒、攻击结束 1 秒) 都是定时器上的续延，
+# 以 (rid, 'flow', match_id) 为键，事件处理函数中不再 sleep。
+# hold=True 表示正在展示结果，此时忽略玩家操作。
+TRANSITIONS = {
+    "SETUP": ("ATTACK_SELECT", "FINISHING"),
+    "ATTACK_SELECT": ("ATTACKING", "FINISHING"),
+    "ATTACKING": ("FINISHING",),
+    "FINISHING": (),
+}
+
+def advance(match, step):
+    """按 TRANSITIONS 迁移 step，不合法 (例如重复结算) 时返回 False"""
+    gd = match.game_data
+    if step not in TRANSITIONS.get(gd.step, ()): return False
+    gd.step = step
+    return True
+
+def acting_match(rid, uid, role, *steps):
+    """
+    uid 以 role (attacker / defender) 身份所在、step 属于 steps 且未在展示结果 (hold) 的对局，否则返回 None
+    攻守双方的对局操作都先经过这里：结算后的回合总结窗口、超时之后到达的重复操作一律忽略
+    """
+    match = get_match(rid, uid)
+    if not match or getattr(match, role) != uid: return None
+    gd = match.game_data
+    return match if gd.step in steps and not gd.hold else None
+
+def schedule_transition(rid, match, delay, fn, *args):
+    """delay 秒后以 fn(rid, match, *args) 继续对局流程；同一对局同时只有一个待执行的续延"""
+    timers.schedule((rid, 'flow', match.id), delay, run_transition, rid, match.id, match.round, fn, args)
+
+def run_transition(rid, match_id, round_num, fn, args):
+    room = rooms.get(rid)
+    match = room["matches"].get(match_id) if room else None
+    # 房间已重置或对局已进入下一回合：续延作废
+    if not match or match.round != round_num: return
+    fn(rid, match, *args)
+
+def arm_match_timer(rid, match, duration):
+    """设置 (或重设) 对局倒计时；game_data 中的 deadline 与定时器到期时间一致"""
+    deadline = clock() + duration
+    match.game_data.deadline = deadline
+    timers.schedule_at((rid, 'match', match.id), deadline, on_match_deadline, rid, match.id, match.round)
+
+def on_match_deadline(rid, match_id, round_num):
     room = rooms.get(rid)
     if not room: return
     match = room["matches"].get(match_id)
     if not match: return
-    if match.get("timer_stamp") != timer_stamp: return 
 
-    gd = match["game_data"]
-    if match["round"] == round_num and gd["step"] == "SETUP":
-        defender, attacker = match["defender"], match["attacker"]
+    gd = match.game_data
+    if match.round == round_num and gd.step == "SETUP":
+        defender, attacker = match.defender, match.attacker
         penalty = 3000
         room["scores"][defender] -= penalty
         room["scores"][attacker] += penalty
         socketio.emit('chat_message', {'user': '裁判', 'msg': f'⏱️ 防守方超时！扣除 {penalty}。', 'type': 'info'}, room=rid)
         finish_round(rid, match, reason="DEF_TIMEOUT", penalty_data={'def_delta': -penalty, 'atk_delta': penalty})
-    elif match["round"] == round_num and gd["step"] in ["ATTACK_SELECT", "ATTACKING"]:
+    elif match.round == round_num and gd.step in ["ATTACK_SELECT", "ATTACKING"]:
         socketio.emit('chat_message', {'user': '裁判', 'msg': '⏳ 攻方思考超时！本轮结束。', 'type': 'info'}, room=rid)
         finish_round(rid, match, reason="ATK_TIMEOUT")
 
-@socketio.on('start_game')
-def on_start(data):
+@room_command('start_game')
+def on_start(sid, data):
     rid = data.get('roomId')
     room = rooms.get(rid)
-    if not room or len(room["players"]) < 2: return emit('error', {'msg': '人数不足'})
+    if not room or len(room["players"]) < 2: return socketio.emit('error', {'msg': '人数不足'}, to=sid)
     room["state"] = "GAME"
+    channels.pop(rid, None)
     players = room["players"][:]
-    random.shuffle(players)
+    # 配对与编号全部由一个种子派生：录制时记下种子，回放时还原出相同的对局
+    seed = draw_seed(rid)
+    if session_log: record_event(':seed', None, rid, seed)
+    rng = random.Random(seed)
+    rng.shuffle(players)
     room["matches"] = {}
     room["history"] = []
+    room["game_id"] = f"{rng.getrandbits(48):012x}"
     room["bye_player"] = players.pop() if len(players) % 2 != 0 else None
     
     for i in range(0, len(players), 2):
-        match_id = str(uuid.uuid4())[:8]
-        t_stamp = str(uuid.uuid4())
-        room["matches"][match_id] = {
-            "id": match_id, "p1": players[i], "p2": players[i+1],
-            "defender": players[i], "attacker": players[i+1], "round": 1,
-            "timer_stamp": t_stamp,
-            "game_data": { "step": "SETUP", "boxes": [], "rule": 0, "strategy": 0, "deadline": time.time() + 300 }
-        }
-        socketio.start_background_task(game_timer_task, rid, match_id, 1, 300, t_stamp)
-    socketio.emit('lobby_update', get_lobby_data())
-    broadcast_game_state(rid)
-
-def broadcast_game_state(rid, target_uid=None):
+        match_id = f"{rng.getrandbits(32):08x}"
+        match = room["matches"][match_id] = Match(match_id, players[i], players[i+1])
+        registry.set_match(players[i], rid, match_id)
+        registry.set_match(players[i+1], rid, match_id)
+        arm_match_timer(rid, match, 300)
+    broadcast_game_state(rid, regroup=True)
+
+def get_channel(rid, match_id):
+    room_channels = channels.setdefault(rid, {})
+    chan = room_channels.get(match_id)
+    if chan is None: chan = room_channels[match_id] = StateChannel()
+    return chan
+
+def match_view(match, role):
+    """对局的对外视图：只有防守方能看到 boxes 中的真实部署"""
+    return match.to_wire(with_boxes=(role == "defender")) if match else None
+
+# --- 受众视图 ---
+# 每个对局只有三种视角：防守方 / 攻方 / 观战 (轮空玩家额外带 is_bye)
+# 每种视角每次状态变化只构建、序列化一次，发往对应的 Socket.IO 子房间:
+#   rid:match_id:defender  rid:match_id:attacker  rid:spectator  rid:bye
+
+def audience_of(room, uid):
+    """返回 uid 在房间中的 (受众子房间名, role_info, 观看的对局)；非对局状态返回 None"""
+    if room["state"] != "GAME": return None
+    rid = room["id"]
+    first = next(iter(room["matches"].values()), None)
+    if uid == room["bye_player"]:
+        return f"{rid}:bye", {"role": "spectator", "match_id": None, "is_bye": True}, first
+    m = get_match(rid, uid)
+    if m:
+        role = "defender" if uid == m.defender else "attacker"
+        return f"{rid}:{m.id}:{role}", {"role": role, "match_id": m.id}, m
+    return f"{rid}:spectator", {"role": "spectator", "match_id": None}, first
+
+def room_audiences(room):
+    rid = room["id"]
+    for m in room["matches"].values():
+        yield f"{rid}:{m.id}:defender", {"role": "defender", "match_id": m.id}, m
+        yield f"{rid}:{m.id}:attacker", {"role": "attacker", "match_id": m.id}, m
+    first = next(iter(room["matches"].values()), None)
+    yield f"{rid}:spectator", {"role": "spectator", "match_id": None}, first
+    yield f"{rid}:bye", {"role": "spectator", "match_id": None, "is_bye": True}, first
+
+def regroup_audience(room, uid):
+    """把 uid 的所有连接移到它当前应在的受众子房间；返回新子房间名 (没有变化时返回 None)"""
+    aud = audience_of(room, uid) if room else None
+    name = aud[0] if aud else None
+    old = registry.set_audience(uid, name)
+    if old == name: return None
+    if old:
+        for sid in registry.sids(uid): exit_room(sid, old)
+    return name
+
+def join_audience(uid, name):
+    for sid in registry.sids(uid): enter_room(sid, name)
+
+def send_snapshot(rid, uid, sid=None):
+    """向 uid 的连接 (或指定 sid) 发送其受众视图的完整快照"""
     room = rooms.get(rid)
-    if not room: return
-    match_list = [{"id": m["id"], "p1": m["p1"], "p2": m["p2"], "round": m["round"], "step": m["game_data"]["step"]} for m in room["matches"].values()]
+    aud = audience_of(room, uid) if room else None
+    if not aud: return
+    name, _, match = aud
+    chan = get_channel(rid, match.id if match else None)
+    if chan.rev_of(name) is None: return
+    now = clock()
+    for s in ([sid] if sid else registry.sids(uid)):
+        socketio.emit('game_update', (chan.snapshot(name, packed=s in packed_sids), now), to=s)
+        client_sync.follow(s, chan, name, chan.rev_of(name))
+
+@metrics.timed('function_seconds', 'broadcast_game_state')
+def broadcast_game_state(rid, target_uid=None, regroup=False):
+    """
+    推送对局状态：每个对局一个版本号递增的状态通道，按受众发布
+    - 已同步的客户端通过受众子房间收到 game_delta (相对上一版本的差量)
+    - regroup=True (开局/换边) 时重新划分受众；换了受众的用户与 target_uid (加入/重连)
+      在差量发出之后单独收到完整的 game_update 快照
+    序列化次数只与受众数 (对局数 x 2 + 2) 有关，与观战人数无关
+    """
+    room = rooms.get(rid)
+    broadcaster.discard(rid)
+    if not room or room["state"] != "GAME": return
+    moved = {}
+    for uid in (registry.members(rid) if regroup else ()):
+        name = regroup_audience(room, uid)
+        if name: moved[uid] = name
+    if target_uid:
+        regroup_audience(room, target_uid)
+        moved[target_uid] = registry.audience_of(target_uid)
+
+    match_list = [{"id": m.id, "p1": m.p1, "p2": m.p2, "round": m.round, "step": m.game_data.step} for m in room["matches"].values()]
     common_data = {"match_list": match_list, "scores": room["scores"]}
-    target_users = [target_uid] if target_uid else room["players"] + list(online_users.values())
-    target_users = list(set(target_users))
-
-    for p in target_users:
-        sid = next((k for k,v in online_users.items() if v == p), None)
-        if not sid: continue
-        my_match = None
-        role_info = {"role": "spectator", "match_id": None}
-        if room["state"] == "GAME":
-            if p == room["bye_player"]: role_info["is_bye"] = True
-            else:
-                for m in room["matches"].values():
-                    if p == m["p1"] or p == m["p2"]:
-                        my_match = m
-                        role_info = {"role": "defender" if p == m["defender"] else "attacker", "match_id": m["id"]}
-                        break
-        if role_info["role"] == "spectator" and not my_match and len(room["matches"]) > 0:
-            my_match = list(room["matches"].values())[0]
-        deadline = my_match["game_data"].get("deadline", 0) if my_match else 0
-        socketio.emit('game_update', {**common_data, "role_info": role_info, "match_data": my_match, "server_time": time.time(), "round_deadline": deadline}, room=sid)
-
-@socketio.on('lock_rule')
-def on_lock_rule(data):
-    match = get_match(data['roomId'], data['userId'])
-    if match and match["defender"] == data['userId']:
-        match["game_data"]["rule"] = int(data['rule'])
-        broadcast_game_state(data['roomId'])
-
-@socketio.on('submit_defense')
-def on_submit_def(data):
+    for mid in list(room["matches"]) + [None]: get_channel(rid, mid).bump()
+    now = clock()
+
+    for name, role_info, match in room_audiences(room):
+        if not registry.audience_members(name): continue
+        deadline = match.game_data.deadline if match else 0
+        view = {**common_data, "role_info": role_info, "match_data": match_view(match, role_info["role"]), "round_deadline": deadline}
+        base, rev, ops = get_channel(rid, match.id if match else None).publish(name, view)
+        if ops:
+            delta = {"base": base, "rev": rev, "ops": ops}
+            emit_coded('game_delta', delta, now, room=name, json_data=encode(delta))
+
+    # 新进入受众的连接在差量之后才加入子房间，直接从快照开始
+    for uid, name in moved.items():
+        if not name: continue
+        join_audience(uid, name)
+        send_snapshot(rid, uid)
+
+def emit_selection(rid, payload):
+    emit_coded('sync_selection_ui', payload, room=rid)
+
+# 高频事件 (揭示/攻击/选规则) 只标记房间，每个 tick 最多推送一次 (tick 刷新同样投递到房间 actor)；
+# 回合结算、游戏结束等关键节点调用 broadcaster.flush 立即推送
+broadcaster = BroadcastScheduler(broadcast_game_state, emit_selection, socketio.sleep,
+                                 tick=int(os.environ.get('BROADCAST_TICK_MS', 40)) / 1000, dispatch=actors.tell_readonly)
+
+@socketio.on('game_ack')
+@metrics.timed('handler_seconds', 'game_ack')
+def on_game_ack(data):
+    if not isinstance(data, dict) or not admit('game_ack'): return
+    sid = request.sid
+    if session_log: record_event('game_ack', sid, registry.room_of(registry.uid_of(sid)), data)
+    if client_sync.ack(sid, data.get('rev')):
+        uid = registry.uid_of(sid)
+        rid = registry.room_of(uid)
+        if rid: actors.tell_readonly(rid, send_snapshot, rid, uid, sid)
+
+@room_command('game_resync', readonly=True)
+def on_game_resync(sid, data):
+    rid, uid = data.get('roomId'), data.get('userId')
+    if rid in rooms and registry.room_of(uid) == rid: send_snapshot(rid, uid, sid=sid)
+
+@room_command('lock_rule')
+def on_lock_rule(sid, data):
+    # 只能在部署之前选规则：提交部署后再改规则会让已校验的部署与规则不一致
+    match = acting_match(data['roomId'], data['userId'], "defender", "SETUP")
+    if match:
+        match.game_data.rule = int(data['rule'])
+        broadcaster.mark(data['roomId'])
+
+@room_command('submit_defense')
+def on_submit_def(sid, data):
     rid, uid = data['roomId'], data['userId']
     room = rooms.get(rid)
-    match = get_match(rid, uid)
-    if not match or match["defender"] != uid: return
-    boxes = data['boxes']
-    rule = match["game_data"]["rule"]
-    if rule == 0: return emit('error', {'msg': '请先选择规则'})
-    valid, msg = validate_defense(rule, boxes, room["scores"][uid])
-    if not valid: return emit('error', {'msg': msg})
+    match = acting_match(rid, uid, "defender", "SETUP")
+    if not match: return
+    gd = match.game_data
+    if gd.rule == 0: return socketio.emit('error', {'msg': '请先选择规则'}, to=sid)
+    try: boxes = BoxSet.from_wire(data['boxes'])
+    except ValueError as e: return socketio.emit('error', {'msg': str(e)}, to=sid)
+    valid, msg = validate_defense(gd.rule, boxes, room["scores"][uid])
+    if not valid: return socketio.emit('error', {'msg': msg}, to=sid)
     
-    room["scores"][uid] -= sum([b['c10']*10 + b['c100']*100 for b in boxes])
-    match["game_data"].update({"boxes": boxes, "step": "ATTACK_SELECT", "deadline": time.time() + 180})
-    new_t = str(uuid.uuid4()); match["timer_stamp"] = new_t
-    socketio.start_background_task(game_timer_task, rid, match["id"], match["round"], 180, new_t)
+    if not advance(match, "ATTACK_SELECT"): return
+    room["scores"][uid] -= boxes.total()
+    gd.boxes = boxes
+    arm_match_timer(rid, match, 180)
     
-    public_boxes = [{"id": i, "grade": calculate_grade(b['c10']+b['c100']), "revealed": False, "real_c10": 0, "real_c100": 0, "taken": False} for i, b in enumerate(boxes)]
-    match["game_data"]["public_boxes"] = public_boxes
-    broadcast_game_state(rid)
+    gd.public_boxes = [{"id": i, "grade": calculate_grade(boxes.c10[i] + boxes.c100[i]), "revealed": False, "real_c10": 0, "real_c100": 0, "taken": False} for i in range(len(boxes))]
+    broadcaster.mark(rid)
 
-@socketio.on('sync_selection_req')
-def on_sync_selection(data):
+@room_command('sync_selection_req', readonly=True)
+def on_sync_selection(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
-    if match and match["attacker"] == uid:
-        socketio.emit('sync_selection_ui', {'match_id': match['id'], 'indices': data['indices']}, room=rid)
+    match = acting_match(rid, uid, "attacker", "ATTACK_SELECT", "ATTACKING")
+    if match:
+        # 连续点击只保留最新的选择，随下一个 tick 发出
+        broadcaster.mark_selection(rid, match.id, {'match_id': match.id, 'indices': data['indices']})
 
-@socketio.on('select_strategy')
-def on_select_strat(data):
+@room_command('select_strategy')
+def on_select_strat(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
-    if not match or match["attacker"] != uid: return
+    match = acting_match(rid, uid, "attacker", "ATTACK_SELECT")
+    if not match: return
     strat = int(data['strategy'])
-    rule = match["game_data"]["rule"]
-    if (strat==2 and rule!=1) or (strat==3 and rule!=2) or (strat==4 and rule!=3): return emit('error', {'msg': '策略不匹配'})
-    gd = match["game_data"]
+    gd = match.game_data
+    if not strategy_allowed(gd.rule, strat): return socketio.emit('error', {'msg': '策略不匹配'}, to=sid)
     # 策略2 8次，策略1 8次
-    gd.update({"strategy": strat, "step": "ATTACKING", "attempts": 8})
-    if strat == 3: gd["guesses"] = 0
-    elif strat == 4: gd["s4"] = {"stage": 0, "target_x": 0, "target_y": 0, "revealed_phase1": [], "revealed_phase2": [], "wins": 0}
-    broadcast_game_state(rid)
+    if not advance(match, "ATTACKING"): return
+    gd.strategy, gd.attempts = strat, ATTEMPTS
+    if strat == 3: gd.guesses = 0
+    elif strat == 4: gd.s4 = {"stage": 0, "target_x": 0, "target_y": 0, "revealed_phase1": [], "revealed_phase2": [], "wins": 0}
+    broadcaster.mark(rid)
 
 # --- S4 Logic ---
-@socketio.on('s4_submit_target')
-def on_s4_submit_target(data):
+@room_command('s4_submit_target')
+def on_s4_submit_target(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
+    match = acting_match(rid, uid, "attacker", "ATTACKING") or acting_match(rid, uid, "defender", "ATTACKING")
     if not match: return
-    s4 = match["game_data"].get("s4")
+    s4 = match.game_data.s4
     target = int(data['targetNum'])
     if not s4 or not (1 <= target <= 22): return
-    if s4["stage"] == 0 and match["attacker"] == uid:
+    if s4["stage"] == 0 and match.attacker == uid:
         s4.update({"target_x": target, "stage": 1})
         socketio.emit('chat_message', {'user': '系统', 'msg': f'攻方寻找 {target}。', 'type': 'info'}, room=rid)
-        broadcast_game_state(rid)
-    elif s4["stage"] == 2 and match["defender"] == uid:
+        broadcaster.mark(rid)
+    elif s4["stage"] == 2 and match.defender == uid:
         s4.update({"target_y": target, "stage": 3})
-        for pb in match["game_data"]["public_boxes"]: pb["revealed"]=False; pb["real_c10"]=0; pb["real_c100"]=0
+        for pb in match.game_data.public_boxes: pb["revealed"]=False; pb["real_c10"]=0; pb["real_c100"]=0
         socketio.emit('chat_message', {'user': '系统', 'msg': f'守方反击寻找 {target}。', 'type': 'info'}, room=rid)
-        broadcast_game_state(rid)
+        broadcaster.mark(rid)
 
-@socketio.on('s4_reveal')
-def on_s4_reveal(data):
+@room_command('s4_reveal')
+def on_s4_reveal(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
-    if not match or match["attacker"] != uid: return
-    gd = match["game_data"]
-    s4 = gd.get("s4")
+    # 展示结果期间 (hold) 的多余点击直接忽略
+    match = acting_match(rid, uid, "attacker", "ATTACKING")
+    if not match: return
+    gd = match.game_data
+    s4 = gd.s4
     box_idx = int(data['boxId'])
-    
-    # 防止在 sleep 期间的多余点击
-    if (s4["stage"] == 1 and len(s4["revealed_phase1"]) >= 7) or (s4["stage"] == 3 and len(s4["revealed_phase2"]) >= 7):
-        return
+    if not s4 or not 0 <= box_idx < len(gd.boxes): return
+    if s4["stage"] == 1: revealed = s4["revealed_phase1"]
+    elif s4["stage"] == 3: revealed = s4["revealed_phase2"]
+    else: return
+    if box_idx in revealed or len(revealed) >= 7: return
 
-    def reveal(idx_list):
-        if box_idx in idx_list: return False
-        idx_list.append(box_idx)
-        real = gd["boxes"][box_idx]
-        gd["public_boxes"][box_idx].update({"revealed": True, "real_c10": real['c10'], "real_c100": real['c100']})
-        return True
-
-    # 1. 执行揭示并立即广播
-    updated = False
-    if s4["stage"] == 1: updated = reveal(s4["revealed_phase1"])
-    elif s4["stage"] == 3: updated = reveal(s4["revealed_phase2"])
-    
-    if updated:
-        broadcast_game_state(rid)
-        
-        # 2. 如果达到了7个，暂停3秒展示结果，然后清空桌面进入下一阶段
-        if s4["stage"] == 1 and len(s4["revealed_phase1"]) >= 7:
-            socketio.sleep(3) # 暂停等待用户看清
-            
-            found = any(gd["boxes"][i]['c10'] == s4["target_x"] for i in s4["revealed_phase1"])
-            if found: s4["wins"] += 1
-            socketio.emit('chat_message', {'user': '系统', 'msg': f"{'✅' if found else '❌'} 目标[{s4['target_x']}] {'找到' if found else '未找到'}", 'type': 'info'}, room=rid)
-            
-            # 隐藏所有盒子进入下一阶段
-            for pb in gd["public_boxes"]: pb["revealed"] = False
-            s4["stage"] = 2
-            broadcast_game_state(rid)
-            
-        elif s4["stage"] == 3 and len(s4["revealed_phase2"]) >= 7:
-            socketio.sleep(3) # 暂停等待用户看清
-            
-            found = any(gd["boxes"][i]['c10'] == s4["target_y"] for i in s4["revealed_phase2"])
-            if found: s4["wins"] += 1
-            socketio.emit('chat_message', {'user': '系统', 'msg': f"{'✅' if found else '❌'} 目标[{s4['target_y']}] {'找到' if found else '未找到'}", 'type': 'info'}, room=rid)
-            
-            # 隐藏所有盒子进入结算阶段
-            for pb in gd["public_boxes"]: pb["revealed"] = False
-            s4["stage"] = 4
-            broadcast_game_state(rid)
-
-@socketio.on('s4_execute_pick')
-def on_s4_execute_pick(data):
+    # 1. 执行揭示并广播
+    revealed.append(box_idx)
+    reveal(gd, box_idx)
+
+    # 2. 如果达到了7个，保持 3 秒展示结果，之后由定时迁移清空桌面进入下一阶段
+    if len(revealed) >= 7:
+        gd.hold = True
+        schedule_transition(rid, match, 3, s4_phase_done, s4["stage"])
+    broadcaster.mark(rid)
+
+def is_box(boxes, i):
+    """客户端传来的盒子下标是否合法 (翻开任何盒子之前检查，非法的操作不消耗出手次数也不泄露内容)"""
+    return type(i) is int and 0 <= i < len(boxes)
+
+def reveal(gd, i, take=False):
+    """翻开盒子 i 展示真实内容；take=True 时同时取走，返回取得的金额"""
+    boxes = gd.boxes
+    pb = gd.public_boxes[i]
+    pb["revealed"], pb["real_c10"], pb["real_c100"] = True, boxes.c10[i], boxes.c100[i]
+    if not take: return 0
+    pb["taken"] = True
+    return boxes.take(i)
+
+def s4_phase_done(rid, match, stage):
+    gd = match.game_data
+    s4 = gd.s4
+    if not s4 or s4["stage"] != stage: return
+    target = s4["target_x"] if stage == 1 else s4["target_y"]
+    revealed = s4["revealed_phase1"] if stage == 1 else s4["revealed_phase2"]
+    found = s4_found(gd.boxes, revealed, target)
+    if found: s4["wins"] += 1
+    socketio.emit('chat_message', {'user': '系统', 'msg': f"{'✅' if found else '❌'} 目标[{target}] {'找到' if found else '未找到'}", 'type': 'info'}, room=rid)
+
+    # 隐藏所有盒子进入下一阶段 (1 -> 2 守方出题，3 -> 4 结算)
+    for pb in gd.public_boxes: pb["revealed"] = False
+    s4["stage"] = stage + 1
+    gd.hold = False
+    broadcaster.mark(rid)
+
+@room_command('s4_execute_pick')
+def on_s4_execute_pick(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
-    if not match or match["attacker"] != uid: return
-    s4 = match["game_data"].get("s4")
+    match = acting_match(rid, uid, "attacker", "ATTACKING")
+    if not match: return
+    gd = match.game_data
+    s4 = gd.s4
     if not s4 or s4["stage"] != 4: return
     indices = data['pickIndices']
-    limit = 22 if s4["wins"] == 2 else (7 if s4["wins"] == 1 else 5)
-    if limit != 22 and len(indices) != limit: return emit('error', {'msg': f'请选择 {limit} 个盒子'})
+    limit = s4_pick_limit(s4["wins"])
+    if limit != 22 and len(indices) != limit: return socketio.emit('error', {'msg': f'请选择 {limit} 个盒子'}, to=sid)
     
-    profit = 0
-    for idx in indices:
-        if idx < 0 or idx >= 22: continue
-        raw = match["game_data"]["boxes"][idx]
-        if raw.get('taken', False): continue
-        profit += raw['c10']*10 + raw['c100']*100
-        match["game_data"]["public_boxes"][idx].update({"revealed": True, "taken": True, "real_c10": raw['c10'], "real_c100": raw['c100']})
-        raw.update({'c10': 0, 'c100': 0, 'taken': True})
+    profit = sum(reveal(gd, idx, take=True) for idx in s4_pick_targets(gd.boxes, indices))
     
-    rooms[rid]["scores"][match["attacker"]] += profit
+    rooms[rid]["scores"][match.attacker] += profit
     socketio.emit('chat_message', {'user': '系统', 'msg': f'方案D结算：掠夺获得 {profit}', 'type': 'info'}, room=rid)
     finish_round(rid, match, reason="NORMAL", penalty_data={'atk_delta': profit})
 
-@socketio.on('execute_attack')
-def on_attack(data):
+@room_command('execute_attack')
+def on_attack(sid, data):
     rid, uid = data['roomId'], data['userId']
-    match = get_match(rid, uid)
-    if not match or match["attacker"] != uid: return
-    gd = match["game_data"]; boxes = gd["boxes"]; strat = gd["strategy"]
+    match = acting_match(rid, uid, "attacker", "ATTACKING")
+    if not match: return
+    gd = match.game_data; boxes = gd.boxes; strat = gd.strategy
     profit = 0; done = False
     
     if strat == 1:
         idx = data['boxId']
-        raw = boxes[idx]
-        profit = raw['c10']*10 + raw['c100']*100
-        gd["public_boxes"][idx].update({"revealed":True, "taken":True, "real_c10":raw['c10'], "real_c100":raw['c100']})
-        raw.update({'c10':0, 'c100':0, 'taken':True})
-        gd["attempts"] -= 1
-        if gd["attempts"] <= 0: done = True
+        if not is_box(boxes, idx): return
+        profit = reveal(gd, idx, take=True)
+        gd.attempts -= 1
+        if gd.attempts <= 0: done = True
         
     elif strat == 2:
         iA, iB, guess = data['boxA'], data['boxB'], data['guess']
-        valA, valB = boxes[iA]['c10']*10+boxes[iA]['c100']*100, boxes[iB]['c10']*10+boxes[iB]['c100']*100
-        win = (guess == 'more' and valB >= valA) or (guess == 'less' and valB < valA)
+        if not is_box(boxes, iA) or not is_box(boxes, iB) or iA == iB: return
+        win, valA, valB = compare_outcome(boxes, iA, iB, guess)
         
         # 优化：明确反馈比大小结果
         res_text = "成功" if win else "失败"
@@ -406,83 +911,78 @@ def on_attack(data):
         
         if win:
             # 猜对：掠夺资金
-            for i in [iA, iB]:
-                gd["public_boxes"][i].update({"revealed":True, "taken":True, "real_c10":boxes[i]['c10'], "real_c100":boxes[i]['c100']})
-                boxes[i].update({'c10':0, 'c100':0, 'taken':True})
+            for i in [iA, iB]: reveal(gd, i, take=True)
             profit = valA + valB
         else:
             # 猜错：仅展示，不销毁，资金保留用于回合退款
-            for i in [iA, iB]:
-                gd["public_boxes"][i].update({"revealed":True, "real_c10":boxes[i]['c10'], "real_c100":boxes[i]['c100']})
+            for i in [iA, iB]: reveal(gd, i)
         
-        gd["attempts"] -= 1
-        if gd["attempts"] <= 0: done = True
+        gd.attempts -= 1
+        if gd.attempts <= 0: done = True
         
     elif strat == 3:
-        g = int(data['guessIdx']); gd["guesses"] = gd.get("guesses", 0) + 1
-        spec = next((i for i, b in enumerate(boxes) if b['c100'] > 0), 0)
-        if g == spec:
-            if gd["guesses"] in [1,2,3,7,8]:
-                for i in range(22):
-                    profit += boxes[i]['c10']*10 + boxes[i]['c100']*100
-                    gd["public_boxes"][i].update({"revealed":True, "taken":True, "real_c10":boxes[i]['c10'], "real_c100":boxes[i]['c100']})
-                    boxes[i].update({'c10':0, 'c100':0, 'taken':True})
-            else:
-                gd["public_boxes"][spec].update({"revealed":True, "taken":True, "real_c10":boxes[spec]['c10'], "real_c100":boxes[spec]['c100']})
-                boxes[spec].update({'c10':0, 'c100':0, 'taken':True})
+        g = int(data['guessIdx']); gd.guesses = (gd.guesses or 0) + 1
+        hint, taken = guess_outcome(boxes, g, gd.guesses)
+        if hint is None:
+            profit = sum(reveal(gd, i, take=True) for i in taken)
             done = True
-        else: socketio.emit('strat3_hint', {'hint': "大了" if g > spec else "小了", 'count': gd["guesses"]}, room=rid)
+        else: emit_coded('strat3_hint', {'hint': hint, 'count': gd.guesses, 'match_id': match.id}, room=rid)
     
-    if profit > 0: rooms[rid]["scores"][match["attacker"]] += profit
+    if profit > 0: rooms[rid]["scores"][match.attacker] += profit
     
     if done:
-        broadcast_game_state(rid)
-        socketio.sleep(1) # 短暂延迟确保前端渲染完最后一帧
-        finish_round(rid, match, reason="NORMAL", penalty_data={'atk_delta': profit})
-    else:
-        broadcast_game_state(rid)
+        # 保持 1 秒让前端渲染完最后一帧，再进入回合结算
+        gd.hold = True
+        timers.cancel((rid, 'match', match.id))
+        schedule_transition(rid, match, 1, finish_round, "NORMAL", {'atk_delta': profit})
+    broadcaster.mark(rid)
 
+@metrics.timed('function_seconds', 'finish_round')
 def finish_round(rid, match, reason="NORMAL", penalty_data=None):
     room = rooms.get(rid)
     if not room: return
     
-    # 增加状态锁：防止Race Condition导致双重退款
-    gd = match["game_data"]
-    if gd.get("step") == "FINISHING": return
-    gd["step"] = "FINISHING"
-
-    refund = sum([b['c10']*10 + b['c100']*100 for b in match["game_data"]["boxes"] if not b.get('taken', False)])
-    room["scores"][match["defender"]] += refund
-    room["history"].append({
-        "round": match["round"], "defender": match["defender"], "attacker": match["attacker"],
-        "rule": match["game_data"]["rule"], "strat": match["game_data"]["strategy"],
-        "result": reason, "pnl_atk": penalty_data['atk_delta'] if penalty_data else 0, "pnl_def": penalty_data['def_delta'] if penalty_data else 0
-    })
-    socketio.emit('round_summary', {"round": match["round"], "refund": refund, "reason": reason}, room=rid)
-    socketio.sleep(4)
-    if match["round"] >= 6: handle_game_over(rid)
+    # 状态锁：防止超时与结算同时到达导致双重退款
+    gd = match.game_data
+    if not advance(match, "FINISHING"): return
+    gd.hold = False
+    timers.cancel((rid, 'match', match.id))
+
+    penalty_data = penalty_data or {}
+    refund = gd.boxes.refund() if gd.boxes else 0
+    room["scores"][match.defender] += refund
+    entry = {
+        "round": match.round, "defender": match.defender, "attacker": match.attacker,
+        "rule": gd.rule, "strat": gd.strategy,
+        "result": reason, "pnl_atk": penalty_data.get('atk_delta', 0), "pnl_def": penalty_data.get('def_delta', 0)
+    }
+    room["history"].append(entry)
+    record_game({"type": "round", "room": rid, "game": room.get("game_id"), "match": match.id, "refund": refund, **entry})
+    broadcaster.flush(rid)
+    socketio.emit('round_summary', {"round": match.round, "refund": refund, "reason": reason}, room=rid)
+    # 回合总结展示 4 秒后进入下一回合 (或结束游戏)
+    schedule_transition(rid, match, 4, next_round)
+
+def next_round(rid, match):
+    if match.game_data.step != "FINISHING": return
+    if match.round >= 6: handle_game_over(rid)
     else:
-        match["defender"], match["attacker"] = match["attacker"], match["defender"]
-        match["round"] += 1
-        new_t = str(uuid.uuid4()); match["timer_stamp"] = new_t
-        match["game_data"] = { "step": "SETUP", "boxes": [], "rule": 0, "strategy": 0, "deadline": time.time() + 300 }
-        socketio.start_background_task(game_timer_task, rid, match["id"], match["round"], 300, new_t)
-        broadcast_game_state(rid)
+        match.next_round()
+        arm_match_timer(rid, match, 300)
+        broadcast_game_state(rid, regroup=True)
 
 def handle_game_over(rid):
     room = rooms.get(rid)
     if not room: return
     winner = max(room["scores"], key=room["scores"].get)
+    broadcaster.flush(rid)
     socketio.emit('show_game_summary', {"history": room["history"], "scores": room["scores"], "winner": winner}, room=rid)
-    tid = str(uuid.uuid4()); reset_timers[rid] = tid
-    socketio.start_background_task(auto_reset_task, rid, tid)
+    record_game({"type": "summary", "room": rid, "game": room.get("game_id"), "players": room["players"],
+                 "rounds": len(room["history"]), "scores": room["scores"], "winner": winner})
+    timers.schedule((rid, 'reset'), 180, reset_room_logic, rid)
 
-def auto_reset_task(rid, tid):
-    socketio.sleep(180)
-    if rid in reset_timers and reset_timers[rid] == tid: reset_room_logic(rid)
-
-@socketio.on('confirm_summary')
-def on_confirm_summary(data):
+@room_command('confirm_summary')
+def on_confirm_summary(sid, data):
     rid, uid = data.get('roomId'), data.get('userId')
     room = rooms.get(rid)
     if room:
@@ -494,20 +994,72 @@ def on_confirm_summary(data):
 def get_match(rid, uid):
     room = rooms.get(rid)
     if not room: return None
-    for m in room["matches"].values():
-        if uid in [m["p1"], m["p2"]]: return m
-    return None
+    ref = registry.match_of(uid)
+    if not ref or ref[0] != rid: return None
+    return room["matches"].get(ref[1])
 
 def reset_room_logic(rid):
     room = rooms.get(rid)
     if not room: return
-    if rid in reset_timers: del reset_timers[rid]
-    room['state'] = "LOBBY"; room['matches'] = {}; room['history'] = []
+    timers.cancel_room(rid)
+    room['state'] = "LOBBY"
+    for uid in list(registry.members(rid)): regroup_audience(room, uid)
+    registry.end_game(rid); channels.pop(rid, None)
+    room['matches'] = {}; room['history'] = []
     room['summary_confirms'] = []; room['scores'] = {p: 10000 for p in room['players']}
     room['ready'] = {p: False for p in room['players']}
     socketio.emit('reset_to_lobby', room=rid)
-    socketio.emit('lobby_update', get_lobby_data())
-    socketio.emit('room_sync', room, room=rid)
+    emit_coded('room_sync', room_wire(room), room=rid)
+
+# --- 崩溃恢复 ---
+# 定时器回调 (以及 run_transition 参数中的续延函数) 按函数名持久化，恢复时从这里取回
+RESUMABLE = {fn.__name__: fn for fn in (run_transition, on_match_deadline, reset_room_logic, finish_round, next_round, s4_phase_done)}
+RESTORE_GRACE = float(os.environ.get('RESTORE_GRACE', 15))
+
+def room_record(rid, room):
+    """房间的持久化记录：房间本身 (对局对象原样保存) + 尚未触发的定时器 (key, deadline, 回调名, 参数)"""
+    return {"room": room,
+            "timers": [(key, deadline, fn.__name__, [{"fn": a.__name__} if callable(a) else a for a in args])
+                       for key, deadline, fn, args in timers.export(rid)]}
+
+def restore_rooms():
+    """从快照 + WAL 恢复本进程负责的房间：重建对局对象与成员索引，按存储的到期时间重新挂上定时器"""
+    start, now, restored = time.perf_counter(), clock(), 0
+    records = store.load()
+    gc.freeze()     # 恢复出的大量房间对象移入永久代，之后的分代 GC 不再反复扫描它们 (房间删除时仍按引用计数释放)
+    for rid, rec in records.items():
+        if not owns(rid) or rid in rooms: continue
+        room = rooms[rid] = rec["room"]
+        for uid in room["players"]: registry.enter_room(uid, rid)
+        for m in room["matches"].values():
+            registry.set_match(m.p1, rid, m.id); registry.set_match(m.p2, rid, m.id)
+        for key, deadline, name, args in rec["timers"]:
+            # 停机期间到期 (或即将到期) 的定时器顺延到 RESTORE_GRACE 秒后，给玩家重连的时间；对局倒计时同步改写 deadline
+            deadline = max(deadline, now + RESTORE_GRACE)
+            if key[1] == 'match' and key[2] in room["matches"]: room["matches"][key[2]].game_data.deadline = deadline
+            args = [RESUMABLE[a["fn"]] if isinstance(a, dict) and set(a) == {"fn"} else a for a in args]
+            timers.schedule_at(key, deadline, RESUMABLE[name], *args)
+        backend.save_room(rid, room)
+        lobby.update(rid, room)
+        restored += 1
+    print(f"Restored {restored} rooms from {store.directory} in {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"(load {store.last_load_ms:.0f} ms)")
+
+# 启动后在后台预渲染全部缩略图，首批进房的玩家直接命中缓存
+# (进程池子进程会重新导入主模块，此时进程名已不是 MainProcess，不再重复启动)
+if multiprocessing.current_process().name == 'MainProcess':
+    socketio.start_background_task(broadcaster.run)
+    socketio.start_background_task(timers.run)
+    socketio.start_background_task(lobby.run)
+    socketio.start_background_task(lag_monitor.run)
+    if game_log: atexit.register(game_log.close)
+    if session_log: atexit.register(session_log.close)
+    if store:
+        restore_rooms()
+        socketio.start_background_task(store.run)
+        atexit.register(store.close)
+    socketio.start_background_task(thumb_cache.warm_up, socketio.sleep,
+                                   [(250, None)] + [(250, f) for f in supported_formats()])
 
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
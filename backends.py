@@ -0,0 +1,74 @@
+# backends.py
+import json, os, zlib
+
+
+def shard_for(rid, count):
+    """房间号 -> 分片序号；crc32 在所有进程中结果一致 (不受 PYTHONHASHSEED 影响)"""
+    if count <= 1 or rid is None: return 0
+    return zlib.crc32(str(rid).encode('utf-8')) % count
+
+
+def room_summary(room):
+    return {"id": room["id"], "owner": room["owner"], "count": len(room["players"]), "state": room["state"]}
+
+
+class MemoryBackend:
+    """
+    进程内状态后端 (默认)：rooms 就是权威数据，save/delete 无需额外操作
+    只适合单进程部署
+    """
+
+    def __init__(self):
+        self.rooms = {}
+
+    def save_room(self, rid, room): pass
+
+    def delete_room(self, rid): pass
+
+
+class RedisBackend:
+    """
+    Redis 协议状态后端，用于多进程 / 多机部署
+    - 每个进程只在本地 rooms 中持有自己分片的房间 (owns(rid) 为 True)，是这些房间的唯一写入者，本地数据即权威状态
+    - 每条房间命令执行完后写回 Redis：{prefix}rooms 保存完整房间 JSON (供运维查看与外部工具读取)，{prefix}lobby 保存大厅摘要
+    - 进程之间共享的只有大厅：remote_lobby() 读出其他分片的房间摘要；进程重启后的房间恢复走 SNAPSHOT_DIR 快照
+    client 只要求 hget/hset/hdel/hvals/pipeline，可传入 redis.Redis 或 fakeredis.FakeRedis
+    """
+
+    def __init__(self, client, prefix='haff:', owns=None):
+        self.client, self.prefix = client, prefix
+        self.owns = owns or (lambda rid: True)
+        self.rooms = {}
+        self._rooms_key, self._lobby_key = prefix + 'rooms', prefix + 'lobby'
+        self._written = {}      # rid -> 上次写入的 JSON，内容不变时跳过写入
+
+    def save_room(self, rid, room):
+        # 对局等运行时对象通过 to_wire() 转为纯数据 (含防守部署，仅服务端可见)
+        raw = json.dumps(room, ensure_ascii=False, separators=(',', ':'), default=lambda o: o.to_wire())
+        if self._written.get(rid) == raw: return
+        pipe = self.client.pipeline()
+        pipe.hset(self._rooms_key, rid, raw)
+        pipe.hset(self._lobby_key, rid, json.dumps(room_summary(room), ensure_ascii=False))
+        pipe.execute()
+        self._written[rid] = raw
+
+    def delete_room(self, rid):
+        if self._written.pop(rid, None) is None and self.client.hget(self._lobby_key, rid) is None: return
+        pipe = self.client.pipeline()
+        pipe.hdel(self._rooms_key, rid)
+        pipe.hdel(self._lobby_key, rid)
+        pipe.execute()
+
+    def remote_lobby(self):
+        """其他进程负责的房间摘要 (本进程的房间由 LobbyIndex 在本地维护)"""
+        items = (json.loads(raw) for raw in self.client.hvals(self._lobby_key))
+        return [item for item in items if not self.owns(item["id"])]
+
+
+def backend_from_env(owns=None):
+    """STATE_BACKEND 为空或 'memory' 时使用进程内后端，为 redis:// URL 时使用 RedisBackend"""
+    url = os.environ.get('STATE_BACKEND', 'memory')
+    if url == 'memory': return MemoryBackend()
+    try: import redis
+    except ImportError: raise RuntimeError("STATE_BACKEND 使用 Redis 需要安装 redis 包 (pip install redis)")
+    return RedisBackend(redis.Redis.from_url(url), prefix=os.environ.get('STATE_PREFIX', 'haff:'), owns=owns)
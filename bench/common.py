@@ -0,0 +1,28 @@
+# bench/common.py
+import datetime, json, os, platform, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'bench', 'results')
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
+
+
+def git_commit():
+    """当前提交号；工作区有未提交修改时带 -dirty"""
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return (rev or 'unknown') + ('-dirty' if dirty else '')
+    except OSError: return 'unknown'
+
+
+def write_result(kind, data, out_dir=None, commit=None):
+    """写出 {kind}-{提交号}-{时间}.json，返回路径；附带提交号、时间与运行环境，便于跨提交对比"""
+    out_dir = out_dir or RESULTS
+    os.makedirs(out_dir, exist_ok=True)
+    now = datetime.datetime.now()
+    commit = commit or git_commit()
+    doc = {"bench": kind, "commit": commit, "time": now.isoformat(timespec='seconds'),
+           "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(), **data}
+    path = os.path.join(out_dir, f"{kind}-{commit}-{now:%Y%m%d-%H%M%S}.json")
+    with open(path, 'w', encoding='utf-8') as f: json.dump(doc, f, ensure_ascii=False, indent=2)
+    return path
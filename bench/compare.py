@@ -0,0 +1,51 @@
+# bench/compare.py
+"""
+对比两次基准结果 (load / micro / replay 的 JSON)
+    python bench/compare.py bench/results/micro-abc1234-....json bench/results/micro-def5678-....json
+逐项列出两边都有的数值字段与变化百分比；--threshold 只显示变化超过该百分比的项
+"""
+import argparse, json
+
+# 越大越好的字段 (其余数值字段按越小越好处理：延迟、耗时、内存)
+HIGHER_IS_BETTER = ("ops_per_sec", "sent_per_sec", "received_per_sec", "games_per_sec", "sent", "received",
+                    "events_per_sec", "outbound_per_sec")
+# 描述性字段：不参与对比
+SKIP = ("params", "cpus", "number", "repeat", "n", "bots", "audiences", "events", "sessions", "processes", "timers", "outbound")
+
+
+def leaves(doc, prefix=""):
+    """展开嵌套 dict 中的数值叶子：{'a': {'b': 1}} -> {'a.b': 1}"""
+    out = {}
+    for k, v in doc.items():
+        if k in SKIP: continue
+        key = f"{prefix}{k}"
+        if isinstance(v, dict): out.update(leaves(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool): out[key] = v
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="对比两次基准结果")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.0, help="只显示变化超过该百分比的项")
+    args = ap.parse_args()
+
+    with open(args.base, encoding='utf-8') as f: base = json.load(f)
+    with open(args.new, encoding='utf-8') as f: new = json.load(f)
+    if base.get("bench") != new.get("bench"): print(f"注意：基准类型不同 ({base.get('bench')} vs {new.get('bench')})")
+    print(f"{base.get('commit')} ({base.get('time')})  ->  {new.get('commit')} ({new.get('time')})")
+
+    a, b = leaves(base), leaves(new)
+    width = max((len(k) for k in a if k in b), default=10)
+    for key in sorted(k for k in a if k in b):
+        old, cur = a[key], b[key]
+        pct = (cur - old) / abs(old) * 100 if old else (0.0 if cur == old else float('inf'))
+        if abs(pct) < args.threshold: continue
+        better = pct > 0 if key.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else pct < 0
+        mark = "" if abs(pct) < 1 else ("  better" if better else "  WORSE")
+        print(f"{key:<{width}}  {old:>14,.2f}  {cur:>14,.2f}  {pct:>+8.1f}%{mark}")
+
+
+if __name__ == "__main__":
+    main()
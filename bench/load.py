@@ -0,0 +1,253 @@
+# bench/load.py
+"""
+Socket.IO 端到端压测：在本机启动 app.py，用大量 websocket 客户端跑完整对局
+    python bench/load.py --rooms 100 --per-room 10          (1000 个客户端)
+    python bench/load.py --rooms 20 --policy random --games 2
+- 客户端复用 bots.py 的 Bot (决策、视图维护、ack/resync 与浏览器一致)，连接换成真实的 websocket
+- 每个客户端：enter_lobby -> create/join_room -> set_ready -> start_game -> 6 回合攻防 -> confirm_summary
+- 记录 操作 -> game_update/game_delta 的延迟分位数、事件吞吐、服务端每房间内存与 greenthread 数
+- 结果写入 bench/results/load-<提交号>-<时间>.json，用 bench/compare.py 对比
+服务端以 DEBUG_STATS=1 启动，压测期间定时读取 /debug/stats 与 /proc/<pid>/status
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse, base64, json, os, queue, resource, socket, struct, subprocess, sys, time, urllib.parse, urllib.request
+from socketio import packet
+from common import ROOT, git_commit, write_result
+from bots import BotHub, POLICIES
+
+SERVER = ("import sys, app; app.socketio.run(app.app, host='127.0.0.1', port=int(sys.argv[1]), "
+          "debug=False, use_reloader=False, log_output=False)")
+
+
+class WebSocket:
+    """最小的 websocket 客户端 (RFC 6455)：握手、带掩码的发送帧、未分片的收帧；足够对接本机的 eventlet 服务端"""
+
+    def __init__(self, url, timeout=10):
+        u = urllib.parse.urlsplit(url)
+        self.sock = socket.create_connection((u.hostname, u.port or 80), timeout=timeout)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET {u.path}?{u.query} HTTP/1.1\r\nHost: {u.netloc}\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        self.buf = b''
+        while b'\r\n\r\n' not in self.buf:
+            chunk = self.sock.recv(4096)
+            if not chunk: raise ConnectionError("websocket 握手时连接被关闭")
+            self.buf += chunk
+        head, self.buf = self.buf.split(b'\r\n\r\n', 1)
+        if b' 101 ' not in head.split(b'\r\n', 1)[0]: raise ConnectionError(f"websocket 握手失败: {head[:80]!r}")
+        self.sock.settimeout(None)
+
+    def send(self, data):
+        if isinstance(data, str): self.sock.sendall(self._frame(0x1, data.encode()))
+        else: self.sock.sendall(self._frame(0x2, data))
+
+    @staticmethod
+    def _frame(opcode, payload):
+        n = len(payload)
+        head = bytes([0x80 | opcode]) + (bytes([0x80 | n]) if n < 126 else
+                                         struct.pack('!BH', 0x80 | 126, n) if n < 65536 else struct.pack('!BQ', 0x80 | 127, n))
+        mask = os.urandom(4)
+        # 客户端帧必须加掩码；整数异或比逐字节快得多
+        masked = (int.from_bytes(payload, 'big') ^ int.from_bytes((mask * (n // 4 + 1))[:n], 'big')).to_bytes(n, 'big')
+        return head + mask + masked
+
+    def _exact(self, n):
+        while len(self.buf) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk: raise ConnectionError("websocket 连接已关闭")
+            self.buf += chunk
+        out, self.buf = self.buf[:n], self.buf[n:]
+        return out
+
+    def receive(self):
+        """返回 str / bytes；收到关闭帧或连接断开时返回 None"""
+        while True:
+            try:
+                b0, b1 = self._exact(2)
+                n = b1 & 0x7f
+                if n == 126: n = struct.unpack('!H', self._exact(2))[0]
+                elif n == 127: n = struct.unpack('!Q', self._exact(8))[0]
+                payload = self._exact(n)
+            except (ConnectionError, OSError, EOFError): return None
+            opcode = b0 & 0x0f
+            if opcode == 0x1: return payload.decode()
+            if opcode == 0x2: return payload
+            if opcode == 0x8: return None
+            if opcode == 0x9: self._control(0xA, payload)    # ping -> pong
+
+    def _control(self, opcode, payload=b''):
+        try: self.sock.sendall(self._frame(opcode, payload))
+        except OSError: pass
+
+    def close(self):
+        self._control(0x8)
+        self.sock.close()
+
+
+class NetLink:
+    """
+    最小的 Socket.IO 客户端 (Engine.IO v4，只用 websocket 传输)，接口与 bots.LocalLink 相同：emit / inbox / close
+    只依赖标准库 socket 与 python-socketio 的包编解码，不需要 requests / websocket-client
+    """
+
+    def __init__(self, url):
+        self.ws = WebSocket(url.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket')
+        self.inbox = queue.Queue()
+        self._partial = None
+        opening = self.ws.receive()
+        if not isinstance(opening, str) or not opening.startswith('0'): raise ConnectionError(f"Engine.IO 握手失败: {opening!r}")
+        self.ws.send('40')
+        eventlet.spawn(self._read)
+
+    def emit(self, event, *args):
+        encoded = packet.Packet(packet.EVENT, data=[event, *args]).encode()
+        for part in (encoded if isinstance(encoded, list) else [encoded]):
+            self.ws.send('4' + part if isinstance(part, str) else part)
+
+    def _read(self):
+        while True:
+            msg = self.ws.receive()
+            if msg is None: break
+            if isinstance(msg, bytes):
+                # 二进制事件的附件
+                if self._partial is not None and self._partial.add_attachment(msg):
+                    self._deliver(self._partial)
+                    self._partial = None
+                continue
+            if not msg: continue
+            if msg[0] == '2': self.ws.send('3')        # ping -> pong
+            elif msg[0] == '1': break
+            elif msg[0] == '4':
+                pkt = packet.Packet(encoded_packet=msg[1:])
+                if pkt.attachment_count: self._partial = pkt
+                else: self._deliver(pkt)
+
+    def _deliver(self, pkt):
+        if pkt.packet_type in (packet.EVENT, packet.BINARY_EVENT): self.inbox.put((pkt.data[0], pkt.data[1:]))
+
+    def close(self):
+        try: self.ws.close()
+        except Exception: pass
+
+
+class NetHub(BotHub):
+    """BotHub 的网络版：每个机器人一条 websocket 连接，决策在压测进程内完成"""
+
+    def __init__(self, url):
+        self.url, self.pool, self.clock, self.think = url, None, time.perf_counter, 0.0
+        self.sleep, self.start_task = eventlet.sleep, eventlet.spawn
+        self._bots = {}
+        self.reset_stats()
+
+    def connect(self, bot):
+        return NetLink(self.url)
+
+    def retire(self, bot):
+        self._bots.pop(bot.uid, None)
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1]) / 1024
+    except OSError: return None
+
+
+def server_stats(url):
+    with urllib.request.urlopen(url + '/debug/stats', timeout=5) as resp: return json.loads(resp.read())
+
+
+def start_server(port, env):
+    proc = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None: raise RuntimeError(f"服务端启动失败 (exit {proc.returncode})")
+        try: return proc, url, server_stats(url)
+        except OSError: eventlet.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("服务端 60 秒内没有就绪")
+
+
+class Sampler:
+    """压测期间定时采样服务端 RSS 与 /debug/stats，记录峰值"""
+
+    def __init__(self, proc, url, interval):
+        self.proc, self.url, self.interval = proc, url, interval
+        self.peak = {"rss_mb": 0.0, "greenthreads": 0, "rooms": 0, "online": 0}
+        self.last = None
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try: self.last = st = server_stats(self.url)
+            except OSError: st = None
+            rss = rss_mb(self.proc.pid)
+            if rss: self.peak["rss_mb"] = max(self.peak["rss_mb"], rss)
+            if st:
+                for k in ("greenthreads", "rooms", "online"): self.peak[k] = max(self.peak[k], st[k])
+            eventlet.sleep(self.interval)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Socket.IO 端到端压测")
+    ap.add_argument("--rooms", type=int, default=100)
+    ap.add_argument("--per-room", type=int, default=10)
+    ap.add_argument("--games", type=int, default=1)
+    ap.add_argument("--policy", default="heuristic", choices=sorted(POLICIES))
+    ap.add_argument("--ramp", type=float, default=5.0, help="在多少秒内逐步建立全部连接")
+    ap.add_argument("--port", type=int, default=5055)
+    ap.add_argument("--timeout", type=float, default=900.0)
+    ap.add_argument("--sample", type=float, default=1.0, help="服务端采样间隔 (秒)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="结果目录 (默认 bench/results)")
+    args = ap.parse_args()
+    commit = git_commit()      # 在建立大量连接之前调用子进程，避免与 eventlet 的 fd 监听冲突
+
+    # 每个客户端在两个进程中各占一个文件描述符
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    env = {**os.environ, 'DEBUG_STATS': '1'}
+    proc, url, idle = start_server(args.port, env)
+    try:
+        idle_rss = rss_mb(proc.pid)
+        sampler = Sampler(proc, url, args.sample)
+        eventlet.spawn(sampler.run)
+        hub = NetHub(url)
+        report = hub.load_test(args.rooms, args.per_room, args.games, args.policy, timeout=args.timeout,
+                               seed=args.seed, ramp=args.ramp)
+        sampler.running = False
+        final = server_stats(url)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    peak = sampler.peak
+    server = {
+        "rss_idle_mb": idle_rss, "rss_peak_mb": peak["rss_mb"],
+        "mem_per_room_kb": (peak["rss_mb"] - idle_rss) * 1024 / args.rooms if idle_rss else None,
+        "greenthreads_idle": idle["greenthreads"], "greenthreads_peak": peak["greenthreads"],
+        "greenthreads_end": final["greenthreads"], "rooms_peak": peak["rooms"], "online_peak": peak["online"],
+        "actors": final["actors"], "broadcast": final["broadcast"],
+    }
+    path = write_result("load", {"params": vars(args), "client": report, "server": server}, args.out, commit)
+
+    lat = report["latency_ms"]
+    print(f"{args.rooms} rooms x {args.per_room} clients, {args.games} game(s): {report['elapsed']:.1f}s, "
+          f"{report['unfinished']} unfinished, {report['errors']} errors")
+    print(f"emits {report['sent']} ({report['sent_per_sec']:,.0f}/s), received {report['received']} "
+          f"({report['received_per_sec']:,.0f}/s)")
+    if lat["n"]:
+        print(f"event -> game_update latency ms: p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  "
+              f"max {lat['max']:.1f}  (n={lat['n']})")
+    if server["mem_per_room_kb"] is not None:
+        print(f"server rss {idle_rss:.1f} -> {peak['rss_mb']:.1f} MB ({server['mem_per_room_kb']:.1f} KB/room), "
+              f"greenthreads {idle['greenthreads']} -> {peak['greenthreads']} (end {final['greenthreads']})")
+    print(f"written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# bench/micro.py
+"""
+热点函数的微基准：防守校验、对局状态广播、线上编码、缩略图下发
+    python bench/micro.py                  (全部)
+    python bench/micro.py --only validate  (名字包含 validate 的项)
+每项取多轮中位数，输出每次调用耗时 (us) 与吞吐；结果写入 bench/results/micro-<提交号>-<时间>.json
+"""
+import argparse, json, os, random, statistics, tempfile, time, urllib.parse
+from common import git_commit, write_result
+
+COMMIT = git_commit()      # 在导入 app (eventlet monkey_patch) 之前取提交号
+
+import app as server
+from codec import pack
+from deployments import iter_layouts, to_array, validate_defense_batch
+from game_logic import BoxSet, Match, calculate_grade, validate_defense
+from thumbnails import render_thumbnail
+
+
+def bench(fn, number, repeat=5):
+    """调用 fn() number 次为一轮，重复 repeat 轮，返回中位数的 {us, ops_per_sec}"""
+    fn()
+    rounds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number): fn()
+        rounds.append((time.perf_counter() - t0) / number)
+    per = statistics.median(rounds)
+    return {"us": per * 1e6, "ops_per_sec": 1 / per if per else None, "number": number, "repeat": repeat,
+            "min_us": min(rounds) * 1e6, "max_us": max(rounds) * 1e6}
+
+
+def sample_deployment(rule_id, rng, balance=10000):
+    """规则 rule_id 下的一个合法部署 (线上格式)，盒子位置随机打乱"""
+    layout = list(next(iter_layouts(rule_id, balance))[0])
+    rng.shuffle(layout)
+    return [{'c10': a, 'c100': b} for a, b in layout]
+
+
+# --- 防守校验 ---
+
+def bench_validate(rng, scale):
+    out = {}
+    for rule in (1, 2, 3):
+        wire = sample_deployment(rule, rng)
+        boxes = BoxSet.from_wire(wire)
+        assert validate_defense(rule, boxes, 10000)[0]
+        out[f"validate_defense_r{rule}_boxset"] = bench(lambda: validate_defense(rule, boxes, 10000), 2000 * scale)
+        out[f"validate_defense_r{rule}_wire"] = bench(lambda: validate_defense(rule, wire, 10000), 2000 * scale)
+        batch = to_array([wire] * 1000)
+        r = bench(lambda: validate_defense_batch(rule, batch, 10000), 20 * scale)
+        r["us_per_deployment"] = r["us"] / len(batch)
+        out[f"validate_defense_batch_r{rule}_x1000"] = r
+    return out
+
+
+# --- 对局状态广播 ---
+
+def build_room(rid, players=10, spectators=40):
+    """手工搭一个对局中的房间：players 人两两对局 (攻方待选)，另有 spectators 名观战者；只登记受众，不建立连接"""
+    uids = [f"{rid}-p{i}" for i in range(players)]
+    rng = random.Random(rid)
+    room = server.rooms[rid] = {
+        "id": rid, "players": uids, "ready": {u: True for u in uids}, "owner": uids[0],
+        "state": "GAME", "scores": {u: 10000 for u in uids}, "matches": {}, "bye_player": None,
+        "game_id": None, "history": [], "summary_confirms": []
+    }
+    for u in uids: server.registry.enter_room(u, rid)
+    for i in range(spectators): server.registry.enter_room(f"{rid}-s{i}", rid, spectator=True)
+    for i in range(0, players, 2):
+        mid = f"m{i // 2}"
+        match = room["matches"][mid] = Match(mid, uids[i], uids[i + 1])
+        server.registry.set_match(uids[i], rid, mid)
+        server.registry.set_match(uids[i + 1], rid, mid)
+        gd = match.game_data
+        gd.step, gd.rule, gd.deadline = "ATTACK_SELECT", 3, time.time() + 180
+        gd.boxes = BoxSet.from_wire(sample_deployment(3, rng))
+        gd.public_boxes = [{"id": j, "grade": calculate_grade(gd.boxes.c10[j] + gd.boxes.c100[j]), "revealed": False,
+                            "real_c10": 0, "real_c100": 0, "taken": False} for j in range(len(gd.boxes))]
+    server.broadcast_game_state(rid, regroup=True)
+    return room
+
+
+def bench_broadcast(rng, scale):
+    rid = "bench-room"
+    room = build_room(rid)
+    matches = list(room["matches"].values())
+    step = [0]
+
+    def changed():
+        # 每次翻开 / 合上一个公开盒子，保证每个受众都有差量要发
+        m = matches[step[0] % len(matches)]
+        pb = m.game_data.public_boxes[step[0] % len(m.game_data.public_boxes)]
+        pb["revealed"] = not pb["revealed"]
+        step[0] += 1
+        server.broadcast_game_state(rid)
+
+    out = {"broadcast_game_state_delta": bench(changed, 200 * scale),
+           "broadcast_game_state_unchanged": bench(lambda: server.broadcast_game_state(rid), 200 * scale),
+           "broadcast_game_state_regroup": bench(lambda: server.broadcast_game_state(rid, regroup=True), 100 * scale)}
+    for r in out.values(): r["audiences"] = 2 * len(matches) + 2
+    server.rooms.pop(rid, None)
+    server.channels.pop(rid, None)
+    return out
+
+
+# --- 线上编码 ---
+
+def bench_codec(rng, scale):
+    """对局快照与 room_sync 的 JSON / packed 编码耗时与字节数"""
+    rid = "bench-codec"
+    room = build_room(rid, spectators=0)
+    match = next(iter(room["matches"].values()))
+    chan = server.get_channel(rid, match.id)
+    out = {}
+    for role in ("attacker", "defender"):
+        snap = json.loads(chan.snapshot(f"{rid}:{match.id}:{role}"))
+        for name, fn in (("json", server.encode), ("packed", pack)):
+            r = out[f"game_update_{role}_{name}"] = bench(lambda: fn(snap), 500 * scale)
+            r["bytes"] = len(fn(snap))
+    wire = json.loads(server.encode(server.room_wire(room)))
+    for name, fn in (("json", server.encode), ("packed", pack)):
+        r = out[f"room_sync_{name}"] = bench(lambda: fn(wire), 200 * scale)
+        r["bytes"] = len(fn(wire))
+    server.rooms.pop(rid, None)
+    server.channels.pop(rid, None)
+    return out
+
+
+# --- 缩略图 ---
+
+def bench_thumbnail(rng, scale):
+    cards = server.thumb_cache.src_dir
+    names = sorted(n for n in os.listdir(cards) if not n.startswith('.'))
+    if not names: return {}
+    client = server.app.test_client()
+    accept = {'Accept': 'image/avif,image/webp,image/*'}
+    urls = [f"/thumbnail/{urllib.parse.quote(n)}?w=250" for n in names]
+    etags = {}
+    for url in urls:
+        resp = client.get(url, headers=accept)
+        etags[url] = resp.headers.get('ETag')
+    i = [0]
+
+    def hot():
+        url = urls[i[0] % len(urls)]
+        i[0] += 1
+        client.get(url, headers=accept).close()
+
+    def not_modified():
+        url = urls[i[0] % len(urls)]
+        i[0] += 1
+        client.get(url, headers={**accept, 'If-None-Match': etags[url] or ''}).close()
+
+    fmt = server.negotiate_format(accept['Accept'])
+    out = {"serve_thumbnail_hot": bench(hot, 200 * scale), "serve_thumbnail_304": bench(not_modified, 200 * scale)}
+    with tempfile.TemporaryDirectory() as tmp:
+        dst = os.path.join(tmp, 'thumb')
+        out["render_thumbnail_cold"] = bench(
+            lambda: render_thumbnail(os.path.join(cards, names[rng.randrange(len(names))]), dst, 250, fmt), 2 * scale, 3)
+    out["render_thumbnail_cold"]["format"] = fmt
+    return out
+
+
+BENCHES = {"validate": bench_validate, "broadcast": bench_broadcast, "codec": bench_codec, "thumbnail": bench_thumbnail}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="热点函数微基准")
+    ap.add_argument("--only", default=None, help="只运行名字包含该子串的基准组 (validate / broadcast / codec / thumbnail)")
+    ap.add_argument("--scale", type=int, default=1, help="每轮调用次数的倍数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="结果目录 (默认 bench/results)")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, fn in BENCHES.items():
+        if args.only and args.only not in name: continue
+        results.update(fn(rng, args.scale))
+    for name, r in results.items():
+        size = f"  {r['bytes']:>8} B" if "bytes" in r else ""
+        print(f"{name:<42} {r['us']:>12.2f} us  {r['ops_per_sec']:>14,.0f}/s{size}")
+    print(f"written to {write_result('micro', {'params': vars(args), 'results': results}, args.out, COMMIT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# bench/replay.py
+"""
+录制会话的确定性回放：性能回归与行为对照
+    RECORD_DIR=cache/sessions python app.py                                   (线上录制入站事件)
+    python bench/replay.py cache/sessions --workers 8                         (全速回放，报告事件吞吐)
+    python bench/replay.py cache/sessions --baseline bench/results/replay-abc1234-....json
+- 共享 sid / userId / 房间号的事件归为一个会话 (并查集)，会话之间互不影响，按事件数均分给多个进程并行回放
+- 每个录制的连接换成 Flask-SocketIO 测试客户端，事件走与线上相同的处理函数；房间 actor 同步执行，
+  时钟换成虚拟时钟：事件按录制时间戳推进，定时器在各自的到期时刻触发，被标记的房间在一个 tick 之后合并刷新，全程不 sleep
+- 开局种子取自录制，配对与对局编号与线上一致；机器人只回放它们录下的事件，不再生成
+- 每个会话的出站事件按客户端逐条哈希成摘要，--baseline 对比另一次回放的摘要，有不一致时退出码为 1
+  (用于确认 broadcast_game_state / finish_round 等重构不改变对外行为；大厅列表依赖同进程的其他房间，不计入摘要)
+- 录制开始前已存在的房间无法还原，录制窗口结束之后才到期的定时器不触发
+结果写入 bench/results/replay-<提交号>-<时间>.json，用 bench/compare.py 对比吞吐
+"""
+import argparse, collections, concurrent.futures, hashlib, json, os, sys, time
+from common import git_commit, write_result
+from records import iter_records
+
+COMMIT = git_commit()
+UNSTABLE = {'lobby_update', 'lobby_delta'}      # 不计入摘要的出站事件
+INF = float('inf')
+
+
+def load_sessions(path):
+    """读出录制并按 sid / userId / 房间号的连通关系分组，返回 [(会话名, 事件列表)]，事件按时间戳稳定排序"""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    events = []
+    for e in iter_records(path):
+        data = e.get("data")
+        keys = [k for k in (e.get("sid") and f"s:{e['sid']}", e.get("room") and f"r:{e['room']}",
+                            isinstance(data, dict) and data.get("userId") and f"u:{data['userId']}") if k]
+        if not keys: continue
+        for k in keys[1:]: parent[find(k)] = find(keys[0])
+        events.append((keys[0], e))
+    groups = collections.defaultdict(list)
+    for key, e in events: groups[find(key)].append(e)
+    out = []
+    for root, evs in groups.items():
+        evs.sort(key=lambda e: e["ts"])
+        rooms = sorted({e["room"] for e in evs if e.get("room")})
+        out.append((",".join(rooms) or root, evs))
+    return out
+
+
+def partition(sessions, n):
+    """按事件数贪心均分到 n 组 (大的先分)"""
+    bins = [[] for _ in range(n)]
+    load = [0] * n
+    for s in sorted(sessions, key=lambda s: -len(s[1])):
+        i = load.index(min(load))
+        bins[i].append(s)
+        load[i] += len(s[1])
+    return [b for b in bins if b]
+
+
+class VirtualClock:
+    __slots__ = ("now",)
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# --- 回放进程 ---
+_server = _clock = None
+
+
+def _init():
+    """导入服务端之前关闭录制 / 快照 / 对局日志 / 限流与外部后端；子进程中导入不会启动后台任务"""
+    global _server, _clock
+    for k in ('RECORD_DIR', 'SNAPSHOT_DIR', 'SOCKETIO_MESSAGE_QUEUE', 'STATE_BACKEND', 'SHARD_COUNT', 'METRICS'): os.environ.pop(k, None)
+    os.environ.update(GAME_LOG_DIR='', RATE_LIMIT='0')
+    import app as server
+    server.actors.spawn = None                      # 房间命令在调用方中同步执行
+    server.bots.fill = lambda *args, **kw: []       # 机器人的事件已在录制中
+    server.clock = _clock = VirtualClock()
+    _server = server
+
+
+def _encode(v):
+    if isinstance(v, (bytes, bytearray)): return v.hex()
+    raise TypeError(type(v).__name__)
+
+
+def replay_session(name, events, tick, dump=None):
+    server, clock = _server, _clock
+    seeds = collections.defaultdict(collections.deque)
+    for e in events:
+        if e["event"] == ':seed': seeds[e["room"]].append(e["data"])
+    server.draw_seed = lambda rid: seeds[rid].popleft() if seeds[rid] else 0
+    inbound = [e for e in events if e["event"] != ':seed']
+    if not inbound: return None
+    clients = {}                # 录制的 sid -> [测试客户端, 摘要]
+    outbound = collections.Counter()
+    dumped = [] if dump else None
+    fired, errors = server.timers.fired, server.actors.stats()["errors"]
+    end, i, flush_at = inbound[-1]["ts"], 0, None
+    clock.now = inbound[0]["ts"]
+
+    def collect():
+        for n, (client, h) in enumerate(clients.values()):
+            if not client.queue: continue
+            for msg in client.queue:
+                outbound[msg['name']] += 1
+                if msg['name'] in UNSTABLE: continue
+                line = json.dumps([msg['name'], msg['args']], sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_encode)
+                h.update(line.encode('utf-8'))
+                if dumped is not None: dumped.append(f'{n}\t{line}')
+            client.queue.clear()
+
+    start = time.perf_counter()
+    while True:
+        server.timers.fire_due()
+        if flush_at is None and server.broadcaster.pending(): flush_at = clock.now + tick
+        collect()
+        t_event = inbound[i]["ts"] if i < len(inbound) else INF
+        t_timer = server.timers.next_deadline()
+        if t_timer is None or t_timer > end: t_timer = INF
+        t = min(t_event, t_timer, flush_at or INF)
+        if t == INF: break
+        clock.now = max(clock.now, t)
+        if t == flush_at:
+            flush_at = None
+            server.broadcaster.flush_all()
+        elif t == t_event:
+            e = inbound[i]
+            i += 1
+            entry = clients.get(e["sid"])
+            if entry is None or e["event"] == 'connect':
+                client = server.socketio.test_client(server.app, auth=e["data"] if e["event"] == 'connect' else None)
+                entry = clients[e["sid"]] = [client, hashlib.blake2b(digest_size=16)]
+                if e["event"] == 'connect': continue
+            client = entry[0]
+            if not client.is_connected(): continue
+            if e["event"] == 'disconnect': client.disconnect()
+            else: client.emit(e["event"], e["data"])
+    elapsed = time.perf_counter() - start
+
+    # 清理本会话的连接与房间，下一个会话从干净的状态开始
+    for client, _ in clients.values():
+        if client.is_connected(): client.disconnect()
+        type(client).clients.pop(client.eio_sid, None)
+        server.socketio.server.environ.pop(client.eio_sid, None)
+    for rid in {e["room"] for e in events if e.get("room")}:
+        server.timers.cancel_room(rid)
+        server.broadcaster.discard(rid)
+        server.rooms.pop(rid, None); server.registry.drop_room(rid); server.channels.pop(rid, None); server.chats.pop(rid, None)
+    if dumped is not None:
+        with open(os.path.join(dump, f"{name.replace('/', '_')[:100]}.tsv"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(dumped) + "\n")
+    digest = hashlib.blake2b(b"".join(h.digest() for _, h in clients.values()), digest_size=16).hexdigest()
+    return {"name": name, "events": len(inbound), "timers": server.timers.fired - fired, "outbound": sum(outbound.values()),
+            "errors": server.actors.stats()["errors"] - errors, "seconds": elapsed, "digest": digest, "outbound_events": dict(outbound)}
+
+
+def replay_batch(batch, tick, dump=None):
+    """一个进程回放一组会话，返回 (各会话结果, 本组回放耗时)"""
+    start = time.perf_counter()
+    results = [r for r in (replay_session(name, events, tick, dump) for name, events in batch) if r]
+    return results, time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description="录制会话的确定性回放")
+    ap.add_argument("path", help="RECORD_DIR 录制目录或单个分段文件")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--tick", type=float, default=int(os.environ.get('BROADCAST_TICK_MS', 40)) / 1000, help="广播合并的 tick (秒)")
+    ap.add_argument("--room", default=None, help="只回放包含该房间的会话")
+    ap.add_argument("--baseline", default=None, help="另一次回放的结果文件：逐会话对比出站摘要")
+    ap.add_argument("--dump", default=None, help="把每个会话的出站事件写到该目录 (客户端序号<TAB>JSON)，用于定位差异")
+    ap.add_argument("--out", default=None, help="结果目录 (默认 bench/results)")
+    args = ap.parse_args()
+
+    sessions = load_sessions(args.path)
+    if args.room: sessions = [s for s in sessions if args.room in s[0].split(",")]
+    if not sessions: sys.exit(f"{args.path} 中没有可回放的会话")
+    if args.dump: os.makedirs(args.dump, exist_ok=True)
+    batches = partition(sessions, max(1, args.workers))
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(len(batches), initializer=_init) as ex:
+        done = list(ex.map(replay_batch, batches, [args.tick] * len(batches), [args.dump] * len(batches)))
+    wall = time.perf_counter() - start
+    results = sorted((r for rs, _ in done for r in rs), key=lambda r: r["name"])
+    # 吞吐按最慢的一组回放计 (各组并行，不含进程启动与导入)
+    elapsed = max(t for _, t in done)
+    total = {k: sum(r[k] for r in results) for k in ("events", "timers", "outbound", "errors")}
+    summary = {**total, "sessions": len(results), "processes": len(batches), "elapsed": elapsed, "wall": wall,
+               "events_per_sec": total["events"] / elapsed if elapsed else None,
+               "outbound_per_sec": total["outbound"] / elapsed if elapsed else None,
+               "session_ms_max": max(r["seconds"] for r in results) * 1000}
+    print(f"{summary['sessions']} sessions in {len(batches)} processes: {total['events']} events, {total['timers']} timers, "
+          f"{total['outbound']} outbound, {total['errors']} errors")
+    print(f"replayed in {elapsed:.2f}s ({wall:.2f}s wall): {summary['events_per_sec']:,.0f} events/s, "
+          f"{summary['outbound_per_sec']:,.0f} outbound/s")
+
+    mismatched = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f: base = json.load(f).get("digests", {})
+        digests = {r["name"]: r["digest"] for r in results}
+        mismatched = sorted(n for n in digests if n in base and base[n] != digests[n])
+        missing = sorted(set(base) ^ set(digests))
+        print(f"baseline: {len(digests) - len(mismatched) - len(set(digests) - set(base))} match, "
+              f"{len(mismatched)} differ, {len(missing)} only on one side")
+        for n in mismatched[:20]: print(f"  differs: {n}")
+    doc = {"params": vars(args), "results": summary, "digests": {r["name"]: r["digest"] for r in results}, "per_session": results}
+    print(f"written to {write_result('replay', doc, args.out, COMMIT)}")
+    if mismatched: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
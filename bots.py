@@ -0,0 +1,570 @@
+# bots.py
+"""
+服务端机器人玩家 / 进程内压测
+    python bots.py --rooms 20 --bots 10 --games 1 --policy heuristic [--json]
+- 机器人通过进程内连接 (LocalLink) 接入 Socket.IO 服务端：发出的事件交给 server._handle_eio_message，
+  与真人走相同的处理函数 (join_room / submit_defense / execute_attack ... -> 房间 actor)；
+  服务端发给机器人的包在发送钩子处直接投递到它的收件队列，真实连接不受影响
+- 决策 (抽部署、选猜测、查求解表) 由 decide() 在 WorkerPool 子进程中执行，机器人的 greenthread 只等待结果；
+  decide 只依赖传入的局面与种子，不保存状态
+- 房主可发送 add_bots 让机器人补位；房间里只剩机器人时它们自动离开
+"""
+if __name__ == "__main__":
+    # 作为压测脚本运行时，必须在导入 flask 之前 monkey_patch (与 app.py 一致)
+    import eventlet
+    eventlet.monkey_patch()
+
+import argparse, collections, json, os, queue, random, time, uuid
+import numpy as np
+from flask.testing import EnvironBuilder
+from socketio import packet
+from game_logic import BOX_COUNT, ATTEMPTS, STRATEGY_RULE, strategy_allowed, s4_pick_limit
+from simulator import sample_layouts
+from solver import JACKPOT_RATIO, SolverTables, target_mask
+from state_channel import apply_patch
+from workers import PoolSaturated
+
+MIN_TOTAL = 3000
+GRADES = {"较少": 0, "一般": 1, "较多": 2}
+
+
+# --- 决策 (在子进程中执行) ---
+
+def s3_interval(hints):
+    """策略 3 已有提示 [(猜的下标, 提示), ...] -> 特异点可能所在的区间 [lo, hi]"""
+    lo, hi = 0, BOX_COUNT - 1
+    for g, hint in hints:
+        if hint == "大了": hi = min(hi, g - 1)
+        else: lo = max(lo, g + 1)
+    return lo, hi
+
+
+class RandomPolicy:
+    """随机规则、随机合法部署、随机出手"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def order(self, ctx, candidates):
+        """候选盒子的尝试顺序"""
+        return [int(i) for i in self.rng.permutation(candidates)]
+
+    # --- 防守方 ---
+    def defend(self, ctx):
+        if ctx["balance"] < MIN_TOTAL: return []
+        rule = int(self.rng.integers(1, 4))
+        return self.deploy(rule, sample_layouts(rule, 1, self.rng, ctx["balance"])[0])
+
+    def deploy(self, rule, layout):
+        boxes = [{"c10": int(a), "c100": int(b)} for a, b in layout]
+        return [("lock_rule", {"rule": rule}), ("submit_defense", {"boxes": boxes})]
+
+    def s4_counter(self, ctx):
+        seen = set(ctx["s4"]["revealed_phase1"])
+        unseen = [i for i in range(len(ctx["boxes"])) if i not in seen]
+        return [("s4_submit_target", {"targetNum": self.counter_target(ctx, unseen)})]
+
+    def counter_target(self, ctx, unseen):
+        return int(ctx["boxes"][int(self.rng.choice(unseen))]["c10"])
+
+    # --- 攻方 ---
+    def strategy(self, ctx):
+        allowed = [s for s in STRATEGY_RULE if strategy_allowed(ctx["rule"], s)]
+        return [("select_strategy", {"strategy": int(self.rng.choice(allowed))})]
+
+    def attack(self, ctx):
+        strat, pub = ctx["strategy"], ctx["public"]
+        if strat == 1:
+            left = [i for i, b in enumerate(pub) if not b["taken"]]
+            return [("execute_attack", {"boxId": self.order(ctx, left)[0]})] if left else []
+        if strat == 2:
+            fresh = [i for i, b in enumerate(pub) if not b["revealed"]]
+            a, b = (int(i) for i in self.rng.choice(fresh if len(fresh) >= 2 else range(len(pub)), 2, replace=False))
+            return [("execute_attack", {"boxA": a, "boxB": b, "guess": self.compare(pub, a, b)})]
+        if strat == 3:
+            lo, hi = s3_interval(ctx["hints"])
+            return [("execute_attack", {"guessIdx": self.s3_guess(ctx, lo, hi)})]
+        return []
+
+    def compare(self, pub, a, b):
+        return "more"
+
+    def s3_guess(self, ctx, lo, hi):
+        return int(self.rng.integers(lo, hi + 1))
+
+    def s4_target(self, ctx):
+        return [("s4_submit_target", {"targetNum": self.pick_target(ctx)})]
+
+    def pick_target(self, ctx):
+        return int(self.rng.integers(1, BOX_COUNT + 1))
+
+    def s4_reveal(self, ctx):
+        s4 = ctx["s4"]
+        target = s4["target_x"] if s4["stage"] == 1 else s4["target_y"]
+        done = s4["revealed_phase1"] if s4["stage"] == 1 else s4["revealed_phase2"]
+        cand = [i for i in range(len(ctx["public"])) if i not in done]
+        return [("s4_reveal", {"boxId": self.reveal_order(ctx, target, cand)[0]})] if cand else []
+
+    def reveal_order(self, ctx, target, cand):
+        return self.order(ctx, cand)
+
+    def s4_pick(self, ctx):
+        limit = s4_pick_limit(ctx["s4"]["wins"])
+        return [("s4_execute_pick", {"pickIndices": self.pick_order(ctx)[:limit]})]
+
+    def pick_order(self, ctx):
+        return self.order(ctx, list(range(len(ctx["public"]))))
+
+
+class HeuristicPolicy(RandomPolicy):
+    """与 simulator 的 grade / bisect 打法一致：分级高的盒子优先，策略 3 二分；防守用规则 2 最低档"""
+
+    def order(self, ctx, candidates):
+        pub = ctx["public"]
+        return sorted(candidates, key=lambda i: (-GRADES[pub[i]["grade"]], self.rng.random()))
+
+    def defend(self, ctx):
+        return self.special(ctx, int(self.rng.integers(0, BOX_COUNT)))
+
+    def special(self, ctx, spec):
+        """规则 2：每盒 n 张，特异盒子放在 spec；n 取总额不低于 3,000 的最小值"""
+        n = -(-MIN_TOTAL // (10 * (BOX_COUNT - 1) + 100))
+        if ctx["balance"] < n * (10 * (BOX_COUNT - 1) + 100): return super().defend(ctx)
+        return self.deploy(2, [(0, n) if i == spec else (n, 0) for i in range(BOX_COUNT)])
+
+    def strategy(self, ctx):
+        # 每条规则都选它专属的策略
+        return [("select_strategy", {"strategy": next(s for s, r in STRATEGY_RULE.items() if r == ctx["rule"])})]
+
+    def compare(self, pub, a, b):
+        return "more" if GRADES[pub[b]["grade"]] >= GRADES[pub[a]["grade"]] else "less"
+
+    def s3_guess(self, ctx, lo, hi):
+        return (lo + hi) // 2
+
+    def pick_target(self, ctx):
+        return BOX_COUNT
+
+    def reveal_order(self, ctx, target, cand):
+        known, pub = ctx["known"], ctx["public"]
+        want = target_mask(target)
+        hits = [i for i in cand if i in known and known[i][0] == target]
+        rest = sorted((i for i in cand if i not in known), key=lambda i: (abs(GRADES[pub[i]["grade"]] - want), self.rng.random()))
+        return hits + rest + [i for i in cand if i in known and i not in hits]
+
+    def pick_order(self, ctx):
+        known, pub = ctx["known"], ctx["public"]
+        seen = sorted(known, key=lambda i: -(known[i][0] * 10 + known[i][1] * 100))
+        return seen + self.order(ctx, [i for i in range(len(pub)) if i not in known])
+
+
+class SolverPolicy(HeuristicPolicy):
+    """按 solver.py 写出的均衡表出手；表不存在时退回启发式"""
+
+    def defend(self, ctx):
+        spec = solver_tables().s3_place(self.rng)
+        return super().defend(ctx) if spec is None else self.special(ctx, spec)
+
+    def strategy(self, ctx):
+        s3 = solver_tables().s3
+        if ctx["rule"] != 2 or s3 is None: return super().strategy(ctx)
+        # 以部署总额为单位比较：策略 3 为 value / 3.1，策略 1 为 8 / 22
+        return [("select_strategy", {"strategy": 3 if s3["value"] / JACKPOT_RATIO > ATTEMPTS / BOX_COUNT else 1})]
+
+    def s3_guess(self, ctx, lo, hi):
+        # 整回合沿同一棵搜索树走：以回合种子抽树，每次决策抽到的都是同一棵
+        tree = solver_tables().s3_pick_tree(np.random.default_rng(ctx["round_seed"]))
+        g = int(tree[lo, hi]) if tree is not None else -1
+        return g if lo <= g <= hi else super().s3_guess(ctx, lo, hi)
+
+    def pick_target(self, ctx):
+        return solver_tables().s4_best_target(_grade_counts(ctx["public"], range(len(ctx["public"]))))[0]
+
+    def reveal_order(self, ctx, target, cand):
+        # 均衡策略：在可能藏有目标的未知盒子上均匀揭示
+        known, pub = ctx["known"], ctx["public"]
+        mask = target_mask(target)
+        hits = [i for i in cand if i in known and known[i][0] == target]
+        feasible = [i for i in cand if i not in known and GRADES[pub[i]["grade"]] >= mask]
+        ordered = hits + [int(i) for i in self.rng.permutation(feasible)] if feasible else hits
+        return ordered + [i for i in cand if i not in ordered]
+
+    def counter_target(self, ctx, unseen):
+        candidates = [int(ctx["boxes"][i]["c10"]) for i in unseen]
+        return int(solver_tables().s4_counter_target(candidates, _grade_counts(ctx["public"], unseen)))
+
+
+def _grade_counts(pub, indices):
+    counts = [0, 0, 0]
+    for i in indices: counts[GRADES[pub[i]["grade"]]] += 1
+    return tuple(counts)
+
+
+POLICIES = {"random": RandomPolicy, "heuristic": HeuristicPolicy, "solver": SolverPolicy}
+_tables = None
+
+
+def solver_tables():
+    global _tables
+    if _tables is None:
+        _tables = SolverTables(os.environ.get('SOLVER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'solver')))
+    return _tables
+
+
+def decide(policy, kind, ctx, seed):
+    """决策入口：返回要发出的 [(事件名, 载荷), ...]，为空表示本次不操作"""
+    return getattr(POLICIES[policy](np.random.default_rng(seed)), kind)(ctx)
+
+
+# --- 进程内连接 ---
+
+class LocalLink:
+    """
+    机器人的 Socket.IO 连接，不经过 Engine.IO 传输层
+    - emit 把事件编码成 Socket.IO 包交给 server._handle_eio_message，与真实连接收到的包走同一条路径
+    - 服务端发给本连接的包由 BotHub 的发送钩子交给 receive，解码后放入 inbox
+    """
+
+    def __init__(self, server, app, eio_sid, query=None):
+        self.server, self.eio_sid = server, eio_sid
+        self.inbox = queue.Queue()
+        self._partial = None
+        self._environ = EnvironBuilder(app, path='/socket.io', query_string=query).get_environ()
+        self._environ['flask.app'] = app
+
+    def connect(self):
+        self.server._handle_eio_connect(self.eio_sid, self._environ)
+        self._send(packet.Packet(packet.CONNECT, None, namespace='/'))
+
+    def emit(self, event, *args):
+        self._send(packet.Packet(packet.EVENT, data=[event, *args], namespace='/'))
+
+    def _send(self, pkt):
+        encoded = pkt.encode()
+        for part in (encoded if isinstance(encoded, list) else [encoded]): self.server._handle_eio_message(self.eio_sid, part)
+
+    def receive(self, data):
+        """服务端发来的一个 Engine.IO 消息 (二进制事件的附件分多条到达)"""
+        if self._partial is not None:
+            if not self._partial.add_attachment(data): return
+            pkt, self._partial = self._partial, None
+        else:
+            pkt = self.server.packet_class(encoded_packet=data)
+            if pkt.attachment_count:
+                self._partial = pkt
+                return
+        if pkt.packet_type in (packet.EVENT, packet.BINARY_EVENT): self.inbox.put((pkt.data[0], pkt.data[1:]))
+
+    def close(self):
+        self.server._handle_eio_disconnect(self.eio_sid, self.server.reason.CLIENT_DISCONNECT)
+
+
+# --- 机器人 ---
+
+class Bot:
+    """
+    一个机器人玩家：一条 LocalLink + 一个 greenthread
+    像浏览器一样维护对局视图 (game_update 快照 + game_delta 差量)，轮到自己时按局面键去重后做一次决策
+    """
+
+    def __init__(self, hub, uid, policy, rid, create=False, games=None, think=0.0, autostart=0, stay=False, seed=None):
+        self.hub, self.uid, self.policy, self.rid = hub, uid, policy, rid
+        self.create, self.games, self.think, self.autostart, self.stay = create, games, think, autostart, stay
+        self.rng = random.Random(seed)
+        self.link = None
+        self.running = True
+        self.joined = self.ready_sent = self.start_sent = self.resyncing = False
+        self.view = self.rev = None
+        self.acted = None           # 已做出决策的局面键
+        self.strikes = 0            # 同一局面连续收到 error 的次数
+        self.sent_at = None         # 最近一次操作的发出时间 (用于延迟统计)
+        self.retry = None
+        self.match_key = None
+        self.known, self.hints, self.last_guess, self.round_seed = {}, [], None, 0
+
+    def emit(self, event, **payload):
+        payload.setdefault("userId", self.uid)
+        payload.setdefault("roomId", self.rid)
+        self.hub.count_sent(event)
+        self.link.emit(event, payload)
+
+    def run(self):
+        try:
+            self.link = self.hub.connect(self)
+            self.emit("enter_lobby")
+            self.emit("create_room" if self.create else "join_room")
+            while self.running:
+                try: item = self.link.inbox.get(timeout=self.retry or 1.0)
+                except queue.Empty: item = None
+                # 先处理完积压的消息，再按最新局面决策
+                while item is not None and self.running:
+                    self.on_event(*item)
+                    try: item = self.link.inbox.get_nowait()
+                    except queue.Empty: item = None
+                if self.running: self.act()
+        except Exception as e:
+            self.hub.errors += 1
+            print(f"Bot error ({self.uid}): {e}")
+        finally:
+            self.running = False
+            if self.link: self.link.close()
+            self.hub.retire(self)
+
+    def leave(self):
+        self.emit("leave_room")
+        self.running = False
+
+    # --- 收到的事件 ---
+    def on_event(self, name, args):
+        self.hub.received += 1
+        data = args[0] if args else None
+        if name == "game_update":
+            frame = json.loads(data)
+            self.view, self.rev, self.resyncing = frame["view"], frame["rev"], False
+            self.on_view()
+        elif name == "game_delta":
+            frame = json.loads(data)
+            if self.view is None or frame["base"] != self.rev:
+                if not self.resyncing:
+                    self.resyncing = True
+                    self.emit("game_resync")
+                return
+            self.view, self.rev = apply_patch(self.view, frame["ops"]), frame["rev"]
+            self.emit("game_ack", rev=self.rev)
+            self.on_view()
+        elif name == "strat3_hint":
+            match = (self.view or {}).get("match_data") or {}
+            if data.get("match_id") == match.get("id") and self.last_guess is not None:
+                self.hints.append((self.last_guess, data["hint"]))
+                self.answered()
+        elif name == "join_success":
+            self.joined, self.retry = True, None
+        elif name == "room_sync":
+            self.on_room(data)
+        elif name == "show_game_summary":
+            self.emit("confirm_summary")
+        elif name == "reset_to_lobby":
+            self.view = self.rev = self.acted = None
+            self.ready_sent = self.start_sent = False
+            if self.games is not None:
+                self.games -= 1
+                if self.games <= 0: self.leave()
+        elif name == "error":
+            self.answered()
+            if not self.joined:
+                # 房间尚未创建好 (房主的 create_room 还在排队)：稍后重试加入，不计为错误
+                self.hub.sleep(0.2)
+                self.emit("join_room")
+                return
+            self.hub.errors += 1
+            if self.acted is not None and self.strikes < 3:
+                self.strikes += 1
+                self.acted = None
+                self.retry = 0.5
+
+    def on_room(self, room):
+        if room["state"] != "LOBBY" or self.uid not in room["players"]: return
+        if not self.stay and all(self.hub.is_bot(p) for p in room["players"]): return self.leave()
+        if not room["ready"].get(self.uid) and not self.ready_sent:
+            self.ready_sent = True
+            self.emit("set_ready")
+        if (self.autostart and room["owner"] == self.uid and not self.start_sent
+                and len(room["players"]) >= self.autostart and all(room["ready"].values())):
+            self.start_sent = True
+            self.emit("start_game")
+
+    def on_view(self):
+        self.answered()
+        self.strikes = 0
+        match = self.view.get("match_data")
+        if not match: return
+        key = (match["id"], match["round"])
+        if key != self.match_key:
+            self.match_key, self.known, self.hints, self.last_guess = key, {}, [], None
+            self.round_seed = self.rng.getrandbits(32)
+        # 记住揭示过的盒子 (方案 D 阶段切换时前端会被清空)
+        for i, pb in enumerate(match["game_data"].get("public_boxes") or ()):
+            if pb["revealed"]: self.known[i] = (pb["real_c10"], pb["real_c100"])
+
+    def answered(self):
+        if self.sent_at is not None:
+            self.hub.latencies.append(self.hub.clock() - self.sent_at)
+            self.sent_at = None
+
+    # --- 决策 ---
+    def turn(self):
+        """轮到自己操作时返回 (局面键, 决策类型)"""
+        match = (self.view or {}).get("match_data")
+        if not match: return None
+        gd, role, r = match["game_data"], self.view["role_info"]["role"], match["round"]
+        if gd.get("hold"): return None
+        step, s4 = gd["step"], gd.get("s4")
+        if role == "defender":
+            if step == "SETUP": return (r, "defend"), "defend"
+            if step == "ATTACKING" and s4 and s4["stage"] == 2: return (r, "s4_counter"), "s4_counter"
+        elif role == "attacker":
+            if step == "ATTACK_SELECT": return (r, "strategy"), "strategy"
+            if step != "ATTACKING": return None
+            if gd["strategy"] in (1, 2): return (r, "attack", gd.get("attempts")), "attack"
+            if gd["strategy"] == 3: return (r, "attack", len(self.hints)), "attack"
+            if gd["strategy"] == 4 and s4:
+                if s4["stage"] == 0: return (r, "s4_target"), "s4_target"
+                if s4["stage"] in (1, 3):
+                    n = len(s4["revealed_phase1" if s4["stage"] == 1 else "revealed_phase2"])
+                    if n < 7: return (r, "s4_reveal", s4["stage"], n), "s4_reveal"
+                if s4["stage"] == 4: return (r, "s4_pick"), "s4_pick"
+        return None
+
+    def act(self):
+        turn = self.turn()
+        if turn is None or turn[0] == self.acted: return
+        key, kind = turn
+        self.acted, self.retry = key, None
+        gd = self.view["match_data"]["game_data"]
+        ctx = {"balance": self.view["scores"].get(self.uid, 0), "rule": gd["rule"], "strategy": gd["strategy"],
+               "public": gd.get("public_boxes") or [], "boxes": gd.get("boxes"), "s4": gd.get("s4"),
+               "known": self.known, "hints": self.hints, "round_seed": self.round_seed}
+        if self.think: self.hub.sleep(self.think * (0.5 + self.rng.random()))
+        try: actions = self.hub.decide(self.policy, kind, ctx, self.rng.getrandbits(32))
+        except PoolSaturated:
+            # 决策进程池已满：稍后重新决策
+            self.acted, self.retry = None, 0.1
+            return
+        for event, payload in actions:
+            if "guessIdx" in payload: self.last_guess = payload["guessIdx"]
+            self.emit(event, **payload)
+        if actions: self.sent_at = self.hub.clock()
+
+
+class BotHub:
+    """
+    管理本进程中的全部机器人
+    - 首次连接时在 server 的发包函数上装钩子：发往机器人的包转交给对应 LocalLink，其余照常发送
+    - 统计机器人发出 / 收到的事件数，以及 操作 -> 本方视图更新 的延迟 (含广播 tick 合批)
+    """
+
+    def __init__(self, socketio, app, pool=None, clock=time.perf_counter, think=0.0):
+        self.socketio, self.app, self.pool, self.clock, self.think = socketio, app, pool, clock, think
+        self.sleep, self.start_task = socketio.sleep, socketio.start_background_task
+        self._links = {}        # eio_sid -> LocalLink
+        self._bots = {}         # uid -> Bot
+        self._installed = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = collections.Counter()
+        self.received = self.errors = 0
+        self.latencies = collections.deque(maxlen=200000)
+
+    def count_sent(self, event):
+        self.sent[event] += 1
+
+    def _install(self):
+        server = self.socketio.server
+        send_packet, send_eio_packet = server._send_packet, server._send_eio_packet
+        links = self._links
+
+        def _send_packet(eio_sid, pkt):
+            link = links.get(eio_sid)
+            if link is None: return send_packet(eio_sid, pkt)
+            encoded = pkt.encode()
+            for part in (encoded if isinstance(encoded, list) else [encoded]): link.receive(part)
+
+        def _send_eio_packet(eio_sid, eio_pkt):
+            link = links.get(eio_sid)
+            if link is None: return send_eio_packet(eio_sid, eio_pkt)
+            link.receive(eio_pkt.data)
+
+        server._send_packet, server._send_eio_packet = _send_packet, _send_eio_packet
+        self._installed = True
+
+    def connect(self, bot):
+        if not self._installed: self._install()
+        link = LocalLink(self.socketio.server, self.app, f"bot-{bot.uid}")
+        self._links[link.eio_sid] = link
+        link.connect()
+        return link
+
+    def retire(self, bot):
+        self._links.pop(f"bot-{bot.uid}", None)
+        if self._bots.get(bot.uid) is bot: del self._bots[bot.uid]
+
+    def is_bot(self, uid):
+        return uid in self._bots
+
+    def decide(self, policy, kind, ctx, seed):
+        return self.pool.run(decide, policy, kind, ctx, seed) if self.pool else decide(policy, kind, ctx, seed)
+
+    def spawn(self, rid, policy="heuristic", **kw):
+        if policy not in POLICIES: raise ValueError(f"未知的机器人策略: {policy}")
+        uid = f"bot-{uuid.uuid4().hex[:6]}"
+        bot = self._bots[uid] = Bot(self, uid, policy, rid, **kw)
+        self.start_task(bot.run)
+        return bot
+
+    def fill(self, rid, count, policy="heuristic"):
+        """往已有房间里加 count 个机器人 (房主补位)；它们一直打到房间里没有真人为止"""
+        return [self.spawn(rid, policy, think=self.think) for _ in range(count)]
+
+    def stats(self):
+        lat = np.array(self.latencies) * 1000
+        pct = {f"p{q}": float(np.percentile(lat, q)) for q in (50, 90, 95, 99)} if len(lat) else {}
+        return {"bots": len(self._bots), "sent": sum(self.sent.values()), "received": self.received, "errors": self.errors,
+                "latency_ms": {"n": len(lat), **pct, "max": float(lat.max()) if len(lat) else 0.0}}
+
+    def load_test(self, rooms, per_room=10, games=1, policy="heuristic", think=0.0, timeout=600.0, seed=0, ramp=0.0):
+        """
+        开 rooms 个房间 x per_room 个机器人，每个房间打 games 局；返回吞吐与延迟统计
+        ramp 秒内逐个房间均匀启动 (大量连接同时建立时避免瞬时洪峰)
+        """
+        self.reset_stats()
+        rng = random.Random(seed)
+        bots = []
+        start = self.clock()
+        for r in range(rooms):
+            rid = f"load-{seed}-{r}"
+            kw = dict(games=games, think=think, stay=True)
+            bots.append(self.spawn(rid, policy, create=True, autostart=per_room, seed=rng.getrandbits(32), **kw))
+            bots += [self.spawn(rid, policy, seed=rng.getrandbits(32), **kw) for _ in range(per_room - 1)]
+            if ramp: self.sleep(ramp / rooms)
+        while any(b.running for b in bots) and self.clock() - start < timeout: self.sleep(0.2)
+        elapsed = self.clock() - start
+        out = self.stats()
+        out.update({"rooms": rooms, "bots": len(bots), "unfinished": sum(b.running for b in bots), "elapsed": elapsed,
+                    "sent_per_sec": out["sent"] / elapsed, "received_per_sec": out["received"] / elapsed,
+                    "events": dict(self.sent)})
+        return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="进程内机器人压测")
+    ap.add_argument("--rooms", type=int, default=10)
+    ap.add_argument("--bots", type=int, default=10, help="每个房间的机器人数 (2..10)")
+    ap.add_argument("--games", type=int, default=1)
+    ap.add_argument("--policy", default="heuristic", choices=sorted(POLICIES))
+    ap.add_argument("--think", type=float, default=0.0, help="每次操作前的平均思考时间 (秒)")
+    ap.add_argument("--timeout", type=float, default=600.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    import app as server    # 导入即 monkey_patch，并启动定时器 / 广播后台任务
+    report = server.bots.load_test(args.rooms, args.bots, args.games, args.policy, args.think, args.timeout, args.seed)
+    actors = server.actors.stats()
+    report["server"] = {"processed": actors["processed"], "errors": actors["errors"],
+                        "wait_max_ms": max((s["wait_max_ms"] for s in actors["rooms"].values()), default=0.0),
+                        "decide_pool": server.bot_pool.stats()}
+    if args.json: return print(json.dumps(report, ensure_ascii=False, indent=2))
+    lat = report["latency_ms"]
+    print(f"{report['rooms']} rooms x {args.bots} bots, {args.games} game(s), policy {args.policy}: "
+          f"{report['elapsed']:.1f}s, {report['unfinished']} bots unfinished")
+    print(f"events sent {report['sent']} ({report['sent_per_sec']:,.0f}/s), received {report['received']} "
+          f"({report['received_per_sec']:,.0f}/s), errors {report['errors']}")
+    if lat["n"]:
+        print(f"action -> view latency ms: p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}  (n={lat['n']})")
+    print(f"server: {report['server']['processed']} commands, actor errors {report['server']['errors']}, "
+          f"max mailbox wait {report['server']['wait_max_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
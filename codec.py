@@ -0,0 +1,174 @@
+# codec.py
+import struct
+from game_logic import calculate_grade
+
+# 紧凑二进制帧 (packed)：连接时协商 (Socket.IO auth {codec: 'packed'})，默认仍为 JSON；前端解码器见 index.html 的 unpackFrame
+#   帧 = MAGIC VERSION | 本帧字符串表: varint 个数, (varint 字节数, UTF-8)* | 值
+#   值的首字节：
+#     0x00 null  0x01 false  0x02 true  0x03 zigzag varint 整数  0x04 float64 (小端)
+#     0x05 列表 varint 个数, 值*       0x06 对象 varint 个数, (varint 键的字符串号, 值)*
+#     0x07 字符串 varint 字符串号      0x08 公开盒子 / 0x09 部署盒子 (见下)
+#     0x40 | n  字符串号 n < 64        0x80 | n  整数 0 <= n < 128
+#   字符串号先编静态表 STRINGS (前后端共用)，之后是本帧字符串表
+#   公开盒子 [{"id": i, "grade", "revealed", "real_c10", "real_c100", "taken"}, ...]：varint 个数, 每个 3 字节
+#     (revealed | taken << 1 | 分级号 << 2, real_c10, real_c100)，id 即下标
+#   部署盒子 [{"c10", "c100", "taken"}, ...]：varint 个数, 每个 3 字节 (c10, c100, taken)
+MAGIC, VERSION = 0xC1, 1      # 0xC1 不是合法的 JSON 首字节，前端据此区分两种帧
+NULL, FALSE, TRUE, INT, FLOAT, LIST, DICT, STR, PUBLIC_BOXES, BOXES = range(10)
+SHORT_STR, SMALL_INT = 0x40, 0x80
+
+GRADES = tuple(dict.fromkeys(calculate_grade(n) for n in range(64)))
+PUBLIC_BOX_KEYS = ("id", "grade", "revealed", "real_c10", "real_c100", "taken")
+BOX_KEYS = ("c10", "c100", "taken")
+# 线上格式中反复出现的键与取值：前 64 个只占 1 字节
+STRINGS = (
+    "rev", "view", "base", "ops", "r", "d", "match_list", "scores", "role_info", "match_data", "round_deadline",
+    "id", "p1", "p2", "round", "step", "role", "match_id", "is_bye", "defender", "attacker", "spectator",
+    "game_data", "rule", "strategy", "deadline", "hold", "public_boxes", "boxes", "attempts", "guesses", "s4",
+    "grade", "revealed", "real_c10", "real_c100", "taken", "c10", "c100", "indices", "hint", "count",
+    "players", "ready", "owner", "state", "matches", "bye_player", "game_id", "summary_confirms",
+    "LOBBY", "GAME", "SETUP", "ATTACK_SELECT", "ATTACKING", "FINISHING",
+    "stage", "target_x", "target_y", "revealed_phase1", "revealed_phase2", "wins", "is_spectator", "is_reconnect",
+) + GRADES
+_STATIC = {s: i for i, s in enumerate(STRINGS)}
+_GRADE = {g: i for i, g in enumerate(GRADES)}
+_F64 = struct.Struct('<d')
+
+
+def _varint(out, n):
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Packer:
+    __slots__ = ("out", "strings")
+
+    def __init__(self):
+        self.out = bytearray()
+        self.strings = {}       # 本帧字符串 -> 字符串号
+
+    def ref(self, s):
+        i = _STATIC.get(s)
+        if i is None:
+            i = self.strings.get(s)
+            if i is None: i = self.strings[s] = len(STRINGS) + len(self.strings)
+        return i
+
+    def value(self, v):
+        out = self.out
+        t = type(v)
+        if t is str:
+            i = self.ref(v)
+            if i < 64: out.append(SHORT_STR | i)
+            else:
+                out.append(STR)
+                _varint(out, i)
+        elif t is bool: out.append(TRUE if v else FALSE)
+        elif t is int:
+            if 0 <= v < 128: out.append(SMALL_INT | v)
+            elif -(1 << 53) < v < 1 << 53:
+                out.append(INT)
+                _varint(out, v << 1 if v >= 0 else (-v << 1) - 1)
+            else: self.value(float(v))
+        elif t is float:
+            out.append(FLOAT)
+            out += _F64.pack(v)
+        elif t is dict:
+            out.append(DICT)
+            _varint(out, len(v))
+            for k, x in v.items():
+                _varint(out, self.ref(k))
+                self.value(x)
+        elif t is list or t is tuple:
+            if v and self.boxes(v): return
+            out.append(LIST)
+            _varint(out, len(v))
+            for x in v: self.value(x)
+        elif v is None: out.append(NULL)
+        else: raise TypeError(f"无法编码的类型: {t.__name__}")
+
+    def boxes(self, v):
+        """v 符合两种盒子列表的固定格式时按位打包，返回是否已写出"""
+        first = v[0]
+        if type(first) is not dict: return False
+        try:
+            if len(first) == 6 and tuple(first) == PUBLIC_BOX_KEYS:
+                packed = bytes(b for i, pb in enumerate(v) if tuple(pb) == PUBLIC_BOX_KEYS and pb["id"] == i
+                               for b in (pb["revealed"] | pb["taken"] << 1 | _GRADE[pb["grade"]] << 2, pb["real_c10"], pb["real_c100"]))
+                tag = PUBLIC_BOXES
+            elif len(first) == 3 and tuple(first) == BOX_KEYS:
+                packed = bytes(b for x in v if tuple(x) == BOX_KEYS for b in (x["c10"], x["c100"], x["taken"]))
+                tag = BOXES
+            else: return False
+        except (KeyError, TypeError, ValueError): return False      # 分级未知 / 数值超出一个字节：退回通用编码
+        if len(packed) != 3 * len(v): return False
+        self.out.append(tag)
+        _varint(self.out, len(v))
+        self.out += packed
+        return True
+
+    def frame(self, obj):
+        self.value(obj)
+        head = bytearray((MAGIC, VERSION))
+        _varint(head, len(self.strings))
+        for s in self.strings:
+            b = s.encode('utf-8')
+            _varint(head, len(b))
+            head += b
+        return bytes(head + self.out)
+
+
+def pack(obj):
+    """JSON 兼容的纯数据 -> packed 帧字节"""
+    return _Packer().frame(obj)
+
+
+def unpack(data):
+    """packed 帧 -> 纯数据 (与前端 unpackFrame 相同，供测试与工具使用)"""
+    if data[0] != MAGIC or data[1] != VERSION: raise ValueError("不是 packed 帧")
+    pos = 2
+
+    def varint():
+        nonlocal pos
+        n = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80: return n
+            shift += 7
+
+    strings = list(STRINGS)
+    for _ in range(varint()):
+        n = varint()
+        strings.append(bytes(data[pos:pos + n]).decode('utf-8'))
+        pos += n
+
+    def value():
+        nonlocal pos
+        t = data[pos]
+        pos += 1
+        if t >= SMALL_INT: return t & 0x7F
+        if t >= SHORT_STR: return strings[t & 0x3F]
+        if t == NULL: return None
+        if t in (FALSE, TRUE): return t == TRUE
+        if t == INT:
+            z = varint()
+            return z >> 1 if not z & 1 else -((z + 1) >> 1)
+        if t == FLOAT:
+            pos += 8
+            return _F64.unpack_from(data, pos - 8)[0]
+        if t == STR: return strings[varint()]
+        if t == LIST: return [value() for _ in range(varint())]
+        if t == DICT: return {strings[varint()]: value() for _ in range(varint())}
+        n = varint()
+        raw, pos = data[pos:pos + 3 * n], pos + 3 * n
+        if t == PUBLIC_BOXES:
+            return [{"id": i, "grade": GRADES[raw[3 * i] >> 2], "revealed": bool(raw[3 * i] & 1), "real_c10": raw[3 * i + 1],
+                     "real_c100": raw[3 * i + 2], "taken": bool(raw[3 * i] & 2)} for i in range(n)]
+        if t == BOXES: return [{"c10": raw[3 * i], "c100": raw[3 * i + 1], "taken": bool(raw[3 * i + 2])} for i in range(n)]
+        raise ValueError(f"未知的类型标记 {t:#x}")
+
+    return value()
@@ -0,0 +1,171 @@
+# deployments.py
+import itertools, math
+import numpy as np
+from game_logic import BOX_COUNT
+
+MIN_TOTAL = 3000
+
+# 校验结果码 -> 原因，与 game_logic.validate_defense 返回的文字一一对应
+REASONS = (
+    "验证通过",
+    f"必须部署 {BOX_COUNT} 个盒子",
+    "代币数量不能为负数",
+    "每个盒子至少需要一张代币",
+    "部署总金额不能少于 3,000",
+    "余额不足",
+    "金额不构成等差数列",
+    "所有盒子代币张数必须相同",
+    "规则2要求盒子内只能有一种面值的代币",
+    "必须有且仅有 1 个盒子装入100元面值",
+    "必须有 21 个盒子只装入10元面值",
+    "10元面值张数必须严格对应 1~22 张且不重复",
+    "10元面值张数必须在 1~22 之间",
+    "未知规则类型",
+)
+(OK, BAD_COUNT, NEGATIVE, EMPTY_BOX, TOTAL_LOW, NO_BALANCE, NOT_ARITHMETIC, COUNT_MISMATCH,
+ MIXED_BOX, SPECIAL_COUNT, PURE10_COUNT, C10_DUPLICATE, C10_RANGE, UNKNOWN_RULE) = range(len(REASONS))
+
+
+def validate_defense_batch(rule_id, boxes, balances):
+    """
+    批量校验防守部署，结果与逐个调用 validate_defense 完全一致
+    boxes: [N, 22, 2] 整数数组 (最后一维为 c10, c100)；balances: [N] 或标量
+    返回 [N] 的结果码 (int8)，0 为合法，原因见 REASONS[code] / explain(codes)
+    """
+    boxes = np.asarray(boxes, dtype=np.int64)
+    n = boxes.shape[0]
+    codes = np.zeros(n, dtype=np.int8)
+    if boxes.ndim != 3 or boxes.shape[1] != BOX_COUNT or boxes.shape[2] != 2:
+        codes[:] = BAD_COUNT
+        return codes
+    balances = np.broadcast_to(np.asarray(balances, dtype=np.int64), (n,))
+    c10, c100 = boxes[..., 0], boxes[..., 1]
+    pending = np.ones(n, dtype=bool)
+
+    def fail(mask, code):
+        hit = pending & mask
+        codes[hit] = code
+        pending[hit] = False
+
+    # 1. 按盒子顺序找第一个非法的盒子：负数优先于空盒 (与逐个检查的顺序一致)
+    neg = (c10 < 0) | (c100 < 0)
+    bad = neg | ((c10 == 0) & (c100 == 0))
+    first = bad.argmax(axis=1)
+    any_bad = bad.any(axis=1)
+    first_neg = neg[np.arange(n), first]
+    fail(any_bad & first_neg, NEGATIVE)
+    fail(any_bad, EMPTY_BOX)
+
+    amounts = c10 * 10 + c100 * 100
+    total = amounts.sum(axis=1)
+    fail(total < MIN_TOTAL, TOTAL_LOW)
+    fail(total > balances, NO_BALANCE)
+
+    # 2. 规则校验
+    if rule_id == 1:
+        steps = np.diff(np.sort(amounts, axis=1), axis=1)
+        fail((steps != steps[:, :1]).any(axis=1), NOT_ARITHMETIC)
+    elif rule_id == 2:
+        counts = c10 + c100
+        fail((counts != counts[:, :1]).any(axis=1), COUNT_MISMATCH)
+        pure10 = (c10 > 0) & (c100 == 0)
+        pure100 = (c100 > 0) & (c10 == 0)
+        fail(~(pure10 | pure100).all(axis=1), MIXED_BOX)
+        fail(pure100.sum(axis=1) != 1, SPECIAL_COUNT)
+        fail(pure10.sum(axis=1) != BOX_COUNT - 1, PURE10_COUNT)
+    elif rule_id == 3:
+        s = np.sort(c10, axis=1)
+        fail((np.diff(s, axis=1) == 0).any(axis=1), C10_DUPLICATE)
+        fail((s[:, 0] != 1) | (s[:, -1] != BOX_COUNT), C10_RANGE)
+    else:
+        fail(np.ones(n, dtype=bool), UNKNOWN_RULE)
+    return codes
+
+
+def explain(codes):
+    return [REASONS[c] for c in codes]
+
+
+def to_array(deployments):
+    """线上格式 [[{'c10','c100'}, ...], ...] -> [N, 22, 2] 数组"""
+    return np.array([[(b['c10'], b['c100']) for b in boxes] for boxes in deployments], dtype=np.int64)
+
+
+# --- 合法部署枚举 ---
+# 部署是 22 个 (c10, c100) 的有序列表。枚举时只产出规范形式 (layout)：
+#   规则 1 按金额升序，规则 2 特异盒子在最前，规则 3 按 c10 = 1..22 排列
+# 同时给出该规范形式对应的有序部署数 (multiplicity)，即盒子位置的不同排列数。
+# 所有枚举都是惰性的生成器，计数用组合公式直接求出，不需要遍历。
+
+def _splits(amount):
+    """金额 amount 的所有 (c10, c100) 拆法，c100 从多到少"""
+    return [((amount - 100 * h) // 10, h) for h in range(amount // 100, -1, -1)]
+
+
+def _arrangements(layout):
+    """规范形式对应的有序部署数 22! / prod(k!)"""
+    out = math.factorial(len(layout))
+    for _, group in itertools.groupby(sorted(layout)): out //= math.factorial(len(list(group)))
+    return out
+
+
+def rule1_sequences(balance):
+    """规则 1 的所有金额等差数列 (首项 a，公差 d，单位元)，总额 22a + 231d 落在 [3000, balance]"""
+    half = BOX_COUNT * (BOX_COUNT - 1) // 2
+    for d in range(0, balance // half + 1, 10):
+        a_min = max(10, -(-(MIN_TOTAL - half * d) // BOX_COUNT))
+        a_min += -a_min % 10
+        for a in range(a_min, (balance - half * d) // BOX_COUNT + 1, 10):
+            yield a, d
+
+
+def iter_layouts(rule_id, balance):
+    """惰性产出 (layout, multiplicity)；layout 为 22 个 (c10, c100) 组成的元组"""
+    if rule_id == 1:
+        for a, d in rule1_sequences(balance):
+            if d == 0:
+                for combo in itertools.combinations_with_replacement(_splits(a), BOX_COUNT):
+                    yield combo, _arrangements(combo)
+            else:
+                fact = math.factorial(BOX_COUNT)
+                for combo in itertools.product(*(_splits(a + i * d) for i in range(BOX_COUNT))):
+                    yield combo, fact
+    elif rule_id == 2:
+        for n in range(1, balance // 310 + 1):
+            if 310 * n < MIN_TOTAL: continue
+            yield ((0, n),) + ((n, 0),) * (BOX_COUNT - 1), BOX_COUNT
+    elif rule_id == 3:
+        base = 10 * BOX_COUNT * (BOX_COUNT + 1) // 2
+        fact = math.factorial(BOX_COUNT)
+        for s in range(max(0, -(-(MIN_TOTAL - base) // 100)), (balance - base) // 100 + 1):
+            # c100 的总张数 s 分配到 22 个盒子 (隔板法)
+            for bars in itertools.combinations(range(s + BOX_COUNT - 1), BOX_COUNT - 1):
+                parts, prev = [], -1
+                for b in bars: parts.append(b - prev - 1); prev = b
+                parts.append(s + BOX_COUNT - 2 - prev)
+                yield tuple((i + 1, h) for i, h in enumerate(parts)), fact
+
+
+def count_deployments(rule_id, balance):
+    """返回 (规范形式数, 有序部署数)，按组合公式计算，不枚举"""
+    layouts = deployments = 0
+    if rule_id == 1:
+        for a, d in rule1_sequences(balance):
+            if d == 0:
+                k = a // 100 + 1
+                layouts += math.comb(BOX_COUNT + k - 1, BOX_COUNT)
+                deployments += k ** BOX_COUNT
+            else:
+                p = math.prod((a + i * d) // 100 + 1 for i in range(BOX_COUNT))
+                layouts += p
+                deployments += p * math.factorial(BOX_COUNT)
+    elif rule_id == 2:
+        n = max(0, balance // 310 - (MIN_TOTAL - 1) // 310)
+        layouts, deployments = n, n * BOX_COUNT
+    elif rule_id == 3:
+        base = 10 * BOX_COUNT * (BOX_COUNT + 1) // 2
+        for s in range(max(0, -(-(MIN_TOTAL - base) // 100)), (balance - base) // 100 + 1):
+            layouts += math.comb(s + BOX_COUNT - 1, BOX_COUNT - 1)
+        deployments = layouts * math.factorial(BOX_COUNT)
+    return layouts, deployments
+
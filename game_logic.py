@@ -1,4 +1,124 @@
 # game_logic.py
+from array import array
+
+BOX_COUNT = 22
+
+
+class BoxSet:
+    """
+    一局 22 个盒子的紧凑表示：c10 / c100 / amount 三个定长数组 + taken 位掩码
+    - total() 为部署总额，refund() 为尚未被取走的金额，两者都是 O(1)，take 时增量更新
+    - 被取走的盒子金额清零 (与原来的 dict 表示一致)，value(i) 直接读数组
+    - 只在边界上与线上格式 [{'c10': int, 'c100': int, 'taken': bool}, ...] 互相转换
+    """
+    __slots__ = ("c10", "c100", "amount", "taken", "_total", "_remaining")
+
+    def __init__(self, c10, c100, taken=0):
+        self.c10 = array('i', c10)
+        self.c100 = array('i', c100)
+        if len(self.c10) != len(self.c100): raise ValueError("c10 / c100 长度不一致")
+        self.amount = array('q', (a * 10 + b * 100 for a, b in zip(self.c10, self.c100)))
+        self.taken = taken
+        self._total = sum(self.amount)
+        self._remaining = self._total - sum(self.amount[i] for i in range(len(self.amount)) if taken >> i & 1)
+
+    @classmethod
+    def from_wire(cls, boxes):
+        """解析客户端提交 (或持久化) 的盒子列表，格式不对时抛 ValueError"""
+        try:
+            c10 = [int(b['c10']) for b in boxes]
+            c100 = [int(b['c100']) for b in boxes]
+            taken = sum(1 << i for i, b in enumerate(boxes) if b.get('taken'))
+            return cls(c10, c100, taken)
+        except (KeyError, TypeError, AttributeError, OverflowError) as e:
+            raise ValueError(f"盒子格式错误: {e}")
+
+    def to_wire(self):
+        return [{'c10': self.c10[i], 'c100': self.c100[i], 'taken': bool(self.taken >> i & 1)} for i in range(len(self.c10))]
+
+    def __len__(self):
+        return len(self.c10)
+
+    def is_taken(self, i):
+        return bool(self.taken >> i & 1)
+
+    def value(self, i):
+        return self.amount[i]
+
+    def take(self, i):
+        """取走盒子 i，返回取得的金额 (已被取走的返回 0)；下标越界时抛出 IndexError"""
+        if not 0 <= i < len(self.c10): raise IndexError(f"盒子下标越界: {i}")
+        if self.taken >> i & 1: return 0
+        amt = self.amount[i]
+        self.taken |= 1 << i
+        self.c10[i] = self.c100[i] = self.amount[i] = 0
+        self._remaining -= amt
+        return amt
+
+    def total(self):
+        return self._total
+
+    def refund(self):
+        return self._remaining
+
+    def first_c100(self):
+        """第一个装有 100 元面值的盒子下标 (规则 2 的特异点)，没有时返回 0"""
+        return next((i for i, v in enumerate(self.c100) if v > 0), 0)
+
+
+class GameData:
+    """一个回合的对局数据；可选字段为 None 时不出现在线上格式中"""
+    __slots__ = ("step", "boxes", "rule", "strategy", "deadline", "hold", "public_boxes", "attempts", "guesses", "s4")
+    OPTIONAL = ("public_boxes", "attempts", "guesses", "s4")
+
+    def __init__(self):
+        self.step, self.boxes, self.rule, self.strategy, self.deadline, self.hold = "SETUP", None, 0, 0, 0, False
+        self.public_boxes = self.attempts = self.guesses = self.s4 = None
+
+    def to_wire(self, with_boxes=True):
+        out = {"step": self.step, "rule": self.rule, "strategy": self.strategy, "deadline": self.deadline, "hold": self.hold}
+        if with_boxes: out["boxes"] = self.boxes.to_wire() if self.boxes else []
+        for k in self.OPTIONAL:
+            v = getattr(self, k)
+            if v is not None: out[k] = v
+        return out
+
+    @classmethod
+    def from_wire(cls, d):
+        gd = cls()
+        gd.step, gd.rule, gd.strategy = d["step"], d.get("rule", 0), d.get("strategy", 0)
+        gd.deadline, gd.hold = d.get("deadline", 0), d.get("hold", False)
+        gd.boxes = BoxSet.from_wire(d["boxes"]) if d.get("boxes") else None
+        for k in cls.OPTIONAL: setattr(gd, k, d.get(k))
+        return gd
+
+
+class Match:
+    """一对玩家的对局；每回合攻守互换，game_data 换成新的 GameData"""
+    __slots__ = ("id", "p1", "p2", "defender", "attacker", "round", "game_data")
+
+    def __init__(self, match_id, p1, p2):
+        self.id, self.p1, self.p2 = match_id, p1, p2
+        self.defender, self.attacker, self.round = p1, p2, 1
+        self.game_data = GameData()
+
+    def next_round(self):
+        self.defender, self.attacker = self.attacker, self.defender
+        self.round += 1
+        self.game_data = GameData()
+
+    def to_wire(self, with_boxes=True):
+        return {"id": self.id, "p1": self.p1, "p2": self.p2, "defender": self.defender, "attacker": self.attacker,
+                "round": self.round, "game_data": self.game_data.to_wire(with_boxes)}
+
+    @classmethod
+    def from_wire(cls, d):
+        m = cls(d["id"], d["p1"], d["p2"])
+        m.defender, m.attacker, m.round = d["defender"], d["attacker"], d["round"]
+        m.game_data = GameData.from_wire(d["game_data"])
+        return m
+
+
 def calculate_grade(total_bills):
     """根据金额返回模糊分级"""
     #if total_bills <= 5: return "少"
@@ -10,20 +130,24 @@ def calculate_grade(total_bills):
 def validate_defense(rule_id, boxes, user_balance):
     """
     校验防守部署是否合法
-    boxes: [{'c10': int, 'c100': int}, ...]
+    boxes: BoxSet (或线上格式 [{'c10': int, 'c100': int}, ...])
     """
+    if not isinstance(boxes, BoxSet):
+        try: boxes = BoxSet.from_wire(boxes)
+        except ValueError as e: return False, str(e)
+    if len(boxes) != BOX_COUNT: return False, f"必须部署 {BOX_COUNT} 个盒子"
+
     # 1. 基础数值校验
-    for b in boxes:
-        if b['c10'] < 0 or b['c100'] < 0:
+    for c10, c100 in zip(boxes.c10, boxes.c100):
+        if c10 < 0 or c100 < 0:
             return False, "代币数量不能为负数"
-        if b['c10'] == 0 and b['c100'] == 0:
+        if c10 == 0 and c100 == 0:
             return False, "每个盒子至少需要一张代币"
 
-    amounts = [b['c10'] * 10 + b['c100'] * 100 for b in boxes]
-    counts_10 = [b['c10'] for b in boxes]
-    counts_total = [b['c10'] + b['c100'] for b in boxes]
+    amounts = boxes.amount
+    counts_10 = boxes.c10
     
-    total_amount = sum(amounts)
+    total_amount = boxes.total()
     
     if total_amount < 3000: return False, "部署总金额不能少于 3,000"
     if total_amount > user_balance: return False, "余额不足"
@@ -33,22 +157,22 @@ def validate_defense(rule_id, boxes, user_balance):
         sorted_amounts = sorted(amounts)
         diff = sorted_amounts[1] - sorted_amounts[0]
         # 简单校验：需容错浮点，但此处是整数，直接判断
-        for i in range(1, 22):
+        for i in range(1, len(sorted_amounts)):
             if sorted_amounts[i] - sorted_amounts[i-1] != diff: 
                 return False, "金额不构成等差数列"
                 
     elif rule_id == 2: # 规则 2：特异点
-        target_count = counts_total[0]
-        if not all(c == target_count for c in counts_total): 
+        target_count = boxes.c10[0] + boxes.c100[0]
+        if not all(a + b == target_count for a, b in zip(boxes.c10, boxes.c100)): 
             return False, "所有盒子代币张数必须相同"
         
         pure_10_boxes = 0
         pure_100_boxes = 0
         
-        for b in boxes:
-            if b['c10'] > 0 and b['c100'] == 0:
+        for c10, c100 in zip(boxes.c10, boxes.c100):
+            if c10 > 0 and c100 == 0:
                 pure_10_boxes += 1
-            elif b['c100'] > 0 and b['c10'] == 0:
+            elif c100 > 0 and c10 == 0:
                 pure_100_boxes += 1
             else:
                 return False, "规则2要求盒子内只能有一种面值的代币"
@@ -68,4 +192,40 @@ def validate_defense(rule_id, boxes, user_balance):
     else: 
         return False, "未知规则类型"
 
-    return True, "验证通过"
\ No newline at end of file
+    return True, "验证通过"
+
+
+# --- 攻击结算 ---
+# 以下函数只读取 BoxSet，返回本次操作应翻开 / 取走的盒子与结果，不涉及房间与推送，
+# 由 app 的事件处理和离线模拟器 (simulator.py) 共用。
+
+STRATEGY_RULE = {1: None, 2: 1, 3: 2, 4: 3}    # 策略 -> 要求的规则 (None 表示任意规则)
+ATTEMPTS = 8                                    # 策略 1 / 2 的出手次数
+JACKPOT_GUESSES = (1, 2, 3, 7, 8)               # 策略 3 在这些次数猜中时取走全部盒子
+
+def strategy_allowed(rule_id, strategy):
+    if strategy not in STRATEGY_RULE: return False
+    need = STRATEGY_RULE[strategy]
+    return need is None or need == rule_id
+
+def compare_outcome(boxes, i, j, guess):
+    """策略 2：猜盒子 j 比 i 多 ('more'，相等算多) 或少 ('less')，返回 (是否猜对, i 的金额, j 的金额)"""
+    a, b = boxes.value(i), boxes.value(j)
+    return (guess == 'more' and b >= a) or (guess == 'less' and b < a), a, b
+
+def guess_outcome(boxes, g, guesses):
+    """策略 3：第 guesses 次猜特异点下标为 g，返回 (提示, 取走的盒子)；猜中时提示为 None"""
+    spec = boxes.first_c100()
+    if g != spec: return ("大了" if g > spec else "小了"), ()
+    return None, (range(len(boxes)) if guesses in JACKPOT_GUESSES else (spec,))
+
+def s4_found(boxes, revealed, target):
+    """方案 D：揭示的盒子中是否有 10 元张数等于 target 的"""
+    return any(boxes.c10[i] == target for i in revealed)
+
+def s4_pick_limit(wins):
+    return 22 if wins == 2 else (7 if wins == 1 else 5)
+
+def s4_pick_targets(boxes, indices):
+    """方案 D 最终选择中实际能取走的盒子 (越界、重复、已取走的忽略)"""
+    return [i for i in dict.fromkeys(indices) if 0 <= i < len(boxes) and not boxes.is_taken(i)]
@@ -0,0 +1,108 @@
+# lobby.py
+from backends import room_summary
+from state_channel import encode
+
+ROOM_CAPACITY = 10
+PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+# 增量按筛选条件 (state, free) 分组发送，每组对应一个 Socket.IO 房间
+BUCKETS = [(state, free) for state in (None, "LOBBY", "GAME") for free in range(ROOM_CAPACITY + 1)]
+
+
+class LobbyIndex:
+    """
+    大厅索引：按房间号缓存房间摘要，房间命令执行完后增量更新 (摘要没变时什么都不做)
+    - 每次变化 version +1，并累积为待发送的增量；run() 每 tick 为 buckets() 中的每个筛选条件最多发出一次合并后的
+      {"version", "add": [摘要], "update": [摘要], "remove": [房间号]}，同一房间在一个 tick 内多次变化只发最终状态；
+      只包含与该条件有关的房间：进入筛选范围为 add，离开为 remove，仍在范围内为 update，没有相关变化的条件不发
+    - page() 按状态 / 空位过滤并分页，返回编码好的字节；同一版本下相同的查询直接复用
+    - remote() 返回其他进程负责的房间摘要 (Redis 后端)，只在查询时读取；那些房间的增量由其所在进程发出
+    """
+
+    def __init__(self, emit, sleep, tick=0.5, remote=None, capacity=ROOM_CAPACITY, buckets=None):
+        self.emit, self.sleep, self.tick = emit, sleep, tick
+        self.remote, self.capacity = remote, capacity
+        self.buckets = buckets or (lambda: BUCKETS)     # 当前有观看者的筛选条件 [(state, free)]
+        self._items = {}        # rid -> 摘要，保持创建顺序
+        self._pending = {}      # rid -> 本 tick 第一次变化之前的摘要 (客户端手上的版本，新建的房间为 None)
+        self._pages = {}        # (state, free, offset, limit) -> 编码后的页
+        self._running = False
+        self.version = 0
+        self.changes = self.deltas = self.coalesced = self.page_hits = self.page_misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def update(self, rid, room):
+        """房间 rid 可能已变化 (room 为 None 表示已删除)"""
+        if room is None: return self.remove(rid)
+        summary = room_summary(room)
+        old = self._items.get(rid)
+        if old == summary: return
+        self._items[rid] = summary
+        self._changed(rid, old)
+
+    def remove(self, rid):
+        old = self._items.pop(rid, None)
+        if old is None: return
+        self._changed(rid, old)
+
+    def _changed(self, rid, old):
+        # 同一 tick 内只记第一次变化前的摘要，发送时与最终状态比较 (新建后又删除、改回原样的房间不发)
+        if rid in self._pending: self.coalesced += 1
+        else: self._pending[rid] = old
+        self.version += 1
+        self.changes += 1
+        self._pages.clear()
+
+    def matches(self, summary, state=None, free=0):
+        return (not state or summary["state"] == state) and self.capacity - summary["count"] >= free
+
+    def flush(self, buckets=((None, 0),)):
+        """取出累积的变化，按筛选条件生成增量：{(state, free): delta}，没有相关变化的条件不出现"""
+        if not self._pending: return {}
+        pending, self._pending = self._pending, {}
+        changes = [(rid, old, self._items.get(rid)) for rid, old in pending.items() if old != self._items.get(rid)]
+        out = {}
+        for state, free in buckets:
+            delta = {"version": self.version, "add": [], "update": [], "remove": []}
+            for rid, old, new in changes:
+                was = old is not None and self.matches(old, state, free)
+                if new is not None and self.matches(new, state, free): delta["update" if was else "add"].append(new)
+                elif was: delta["remove"].append(rid)
+            if delta["add"] or delta["update"] or delta["remove"]: out[(state, free)] = delta
+        self.deltas += len(out)
+        return out
+
+    def page(self, state=None, free=0, offset=0, limit=PAGE_LIMIT):
+        """过滤 + 分页后的大厅列表，编码为 JSON 字节：{"version", "total", "offset", "limit", "rooms"}"""
+        key = (state, free, offset, limit)
+        cached = self._pages.get(key) if self.remote is None else None
+        if cached is not None:
+            self.page_hits += 1
+            return cached
+        self.page_misses += 1
+        items = list(self._items.values())
+        if self.remote: items += self.remote()
+        if state or free > 0: items = [r for r in items if self.matches(r, state, free)]
+        data = encode({"version": self.version, "total": len(items), "offset": offset, "limit": limit,
+                       "rooms": items[offset:offset + limit]})
+        if self.remote is None:
+            if len(self._pages) >= 64: self._pages.clear()
+            self._pages[key] = data
+        return data
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.sleep(self.tick)
+            for bucket, delta in self.flush(self.buckets()).items():
+                try: self.emit(bucket, encode(delta))
+                except Exception as e: print(f"Lobby delta error: {e}")
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {"rooms": len(self._items), "version": self.version, "pending": len(self._pending), "changes": self.changes,
+                "deltas": self.deltas, "coalesced": self.coalesced, "page_hits": self.page_hits, "page_misses": self.page_misses}
@@ -0,0 +1,159 @@
+# metrics.py
+import bisect, collections, functools, sys, time
+from eventlet import patcher
+
+# 延迟类直方图的桶上界 (秒)：0.1ms ~ 10s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 负载大小直方图的桶上界 (字节)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+
+
+class Histogram:
+    """固定桶的直方图；counts[i] 为落在 (buckets[i-1], buckets[i]] 的次数，最后一格为 +Inf"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum, self.count = 0.0, 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs: return ""
+    esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """
+    进程内指标，按 Prometheus 文本格式导出
+    - histogram：在热路径上记录，enabled=False 时 observe / timed 只做一次布尔判断
+    - gauge：注册取值函数，只在导出时调用 (房间数、定时器积压等现成状态不需要另行维护)；
+      计数由各组件自己累计 (如 fired / processed / decisions)，同样经 gauge 以 kind="counter" 导出
+    指标名与标签名在注册时固定；同名指标按标签值分组
+    """
+
+    def __init__(self, enabled=False, prefix=""):
+        self.enabled, self.prefix = enabled, prefix
+        self._hist = {}         # name -> (help, labelnames, buckets, {labelvalues: Histogram})
+        self._gauges = {}       # name -> (help, labelnames, fn, type)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._hist[self.prefix + name] = (help, tuple(labels), tuple(buckets), {})
+
+    def gauge(self, name, help, fn, labels=(), kind="gauge"):
+        """
+        fn() 返回数值；有标签时返回 {标签值元组: 数值}
+        组件自己维护的累计计数 (如 fired / processed) 也通过这里导出，kind="counter"
+        """
+        self._gauges[self.prefix + name] = (help, tuple(labels), fn, kind)
+
+    def observe(self, name, value, *labels):
+        if not self.enabled: return
+        _, _, buckets, series = self._hist[self.prefix + name]
+        h = series.get(labels)
+        if h is None: h = series[labels] = Histogram(buckets)
+        h.observe(value)
+
+    def timed(self, name, *labels):
+        """装饰器：把函数执行耗时记入直方图 name (标签值为 labels)"""
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try: return fn(*args, **kwargs)
+                finally: self.observe(name, time.perf_counter() - start, *labels)
+            return wrapper
+        return deco
+
+    def render(self):
+        """Prometheus 文本格式 (version 0.0.4)"""
+        out = []
+        for name, (help, names, fn, kind) in self._gauges.items():
+            out += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            try: value = fn()
+            except Exception as e:
+                out.append(f"# error: {e}")
+                continue
+            for values, v in (value.items() if names else [((), value)]):
+                out.append(f"{name}{_labels(names, values)} {float(v)}")
+        for name, (help, names, buckets, series) in self._hist.items():
+            out += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for values, h in list(series.items()):
+                acc = 0
+                for le, n in zip(buckets + ("+Inf",), h.counts):
+                    acc += n
+                    out.append(f"{name}_bucket{_labels(names, values, ('le', le))} {acc}")
+                out.append(f"{name}_sum{_labels(names, values)} {h.sum}")
+                out.append(f"{name}_count{_labels(names, values)} {h.count}")
+        return "\n".join(out) + "\n"
+
+
+def metered_packet_class(base, metrics, name):
+    """
+    Socket.IO 包类的子类：事件包编码时把字节数按事件名记入直方图 name
+    manager 对房间广播只编码一次，因此记录的是每次 emit 的负载大小，与接收人数无关
+    """
+    class MeteredPacket(base):
+        def encode(self):
+            encoded = super().encode()
+            if metrics.enabled and self.data and self.packet_type in (2, 5):    # EVENT / BINARY_EVENT
+                parts = encoded if isinstance(encoded, list) else (encoded,)
+                metrics.observe(name, sum(len(p) for p in parts), self.data[0])
+            return encoded
+    return MeteredPacket
+
+
+class SamplingProfiler:
+    """
+    采样剖析：一个真实的 OS 线程按 interval 读取主线程当前栈 (即正在运行的 greenthread)，
+    输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式："f1;f2;f3 次数"
+    eventlet 下所有 greenthread 共享一个 OS 线程，采到 hub 的 poll 说明进程在空闲等待 IO
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._thread = None
+        self._stacks = collections.Counter()
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread: raise RuntimeError("剖析已在进行中")
+        threading = patcher.original('threading')      # monkey_patch 之后 threading.Thread 是 greenthread
+        self._stacks.clear()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(threading.main_thread().ident,), daemon=True,
+                                        name="sampling-profiler")
+        self._thread.start()
+
+    def _run(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self._stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        """停止采样，返回折叠栈文本"""
+        if not self._thread: return ""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return "\n".join(f"{stack} {n}" for stack, n in self._stacks.most_common()) + "\n"
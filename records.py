@@ -0,0 +1,120 @@
+# records.py
+"""
+聊天环形缓冲 + 对局记录日志
+    python records.py cache/games                   (逐行输出全部记录，JSON Lines)
+    python records.py cache/games --room R1 --type summary
+"""
+import argparse, datetime, gzip, itertools, json, os, sys, threading, time, zlib
+from collections import deque
+
+
+class ChatLog:
+    """
+    一个房间的聊天记录：只保留最近 maxlen 条 (deque 环形缓冲)，每条带递增序号 seq
+    客户端按 seq 向前翻页 (page(before=最早一条的 seq))，聊天不再随 room_sync 下发
+    """
+    __slots__ = ("_items", "seq")
+
+    def __init__(self, maxlen=200):
+        self._items = deque(maxlen=maxlen)
+        self.seq = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def append(self, payload):
+        self.seq += 1
+        item = {**payload, "seq": self.seq}
+        self._items.append(item)
+        return item
+
+    def page(self, before=None, limit=50):
+        """seq < before 的最近 limit 条 (按时间正序)，以及是否还有更早的消息；seq 连续，按下标直接切片"""
+        items = self._items
+        end = len(items)
+        if before is not None and items: end = max(0, min(end, before - items[0]["seq"]))
+        start = max(0, end - limit)
+        return list(itertools.islice(items, start, end)), start > 0
+
+
+class GameRecordLog:
+    """
+    对局记录的追加式压缩日志：每行一条 JSON (JSON Lines)，gzip 压缩
+    - 每个回合结算一条 {"type": "round", ...}，游戏结束一条 {"type": "summary", ...}
+    - 文件按日期和大小分段：{prefix}-YYYYMMDD-NNN.jsonl.gz；写入后 flush (Z_SYNC_FLUSH)，正在写的分段也能读到已写入的记录
+    - 进程退出或分段写满时写入 gzip 尾部；意外退出留下的分段缺尾部，iter_records 读到截断处为止
+    过去的对局只在磁盘上，内存里只有当前分段的文件句柄
+    """
+
+    def __init__(self, directory, prefix="games", max_bytes=64 * 1024 * 1024, clock=time.time):
+        self.directory, self.prefix, self.max_bytes, self.clock = directory, prefix, max_bytes, clock
+        self._file = self._raw = None
+        self._day = None
+        self._lock = threading.Lock()
+        self.records = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self, day):
+        self.close()
+        n = 0
+        while os.path.exists(path := os.path.join(self.directory, f"{self.prefix}-{day}-{n:03d}.jsonl.gz")): n += 1
+        self._raw = open(path, 'xb')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        self._day = day
+        return path
+
+    def append(self, record):
+        """追加一条记录 (dict)，自动补上写入时间 ts"""
+        line = json.dumps({"ts": self.clock(), **record}, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._lock:
+            day = datetime.date.fromtimestamp(self.clock()).strftime('%Y%m%d')
+            if self._file is None or day != self._day or self._raw.tell() >= self.max_bytes: self._open(day)
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        if self._file is None: return
+        self._file.close()
+        self._raw.close()
+        self._file = self._raw = None
+
+    def stats(self):
+        return {"records": self.records, "segment": self._raw.name if self._raw else None,
+                "segment_bytes": self._raw.tell() if self._raw else 0}
+
+
+def segments(path):
+    """目录下的日志分段 (按文件名即时间顺序)；path 本身是文件时只有它"""
+    if os.path.isfile(path): return [path]
+    return sorted(os.path.join(path, n) for n in os.listdir(path) if n.endswith(".jsonl.gz"))
+
+
+def iter_records(path, room=None, game=None, type=None):
+    """流式读取记录 (一次只解压一块，不把日志读入内存)；可按房间 / 对局 / 类型过滤"""
+    for seg in segments(path):
+        with gzip.open(seg, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if not line.endswith("\n"): break         # 正在写入的分段末尾可能是半行
+                    rec = json.loads(line)
+                    if room is not None and rec.get("room") != room: continue
+                    if game is not None and rec.get("game") != game: continue
+                    if type is not None and rec.get("type") != type: continue
+                    yield rec
+            except (EOFError, zlib.error): pass               # 缺 gzip 尾部的分段：读到截断处为止
+
+
+def main():
+    ap = argparse.ArgumentParser(description="流式导出对局记录 (JSON Lines)")
+    ap.add_argument("path", help="日志目录或单个分段文件")
+    ap.add_argument("--room", default=None)
+    ap.add_argument("--game", default=None)
+    ap.add_argument("--type", default=None, choices=("round", "summary"))
+    args = ap.parse_args()
+    for rec in iter_records(args.path, args.room, args.game, args.type):
+        sys.stdout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
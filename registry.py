@@ -0,0 +1,127 @@
+# registry.py
+
+
+class Registry:
+    """
+    在线用户 / 房间成员索引，替代对 online_users、rooms、matches 的线性扫描
+    - uid <-> sid 双向映射，一个 uid 可以同时开多个标签页 (多个 sid)
+    - uid -> 所在房间，uid -> 所在对局，房间 -> 观战者
+    所有方法都是 O(1) (或与单个房间人数成正比)
+    """
+
+    def __init__(self):
+        self._sids = {}         # uid -> set(sid)
+        self._uids = {}         # sid -> uid
+        self._room_of = {}      # uid -> rid
+        self._members = {}      # rid -> set(uid)，玩家 + 观战者
+        self._spectators = {}   # rid -> set(uid)
+        self._match_of = {}     # uid -> (rid, match_id)
+        self._audience_of = {}  # uid -> 受众子房间名 (如 'rid:match:attacker')
+        self._audiences = {}    # 受众子房间名 -> set(uid)
+
+    # --- 连接 ---
+    def bind(self, sid, uid):
+        old = self._uids.get(sid)
+        if old == uid: return
+        if old is not None: self.unbind(sid)
+        self._uids[sid] = uid
+        self._sids.setdefault(uid, set()).add(sid)
+
+    def unbind(self, sid):
+        """断开一个 sid，返回它对应的 uid (可能为 None)"""
+        uid = self._uids.pop(sid, None)
+        if uid is not None:
+            sids = self._sids.get(uid)
+            if sids:
+                sids.discard(sid)
+                if not sids: del self._sids[uid]
+        return uid
+
+    def uid_of(self, sid):
+        return self._uids.get(sid)
+
+    def sids(self, uid):
+        return self._sids.get(uid, ())
+
+    def is_online(self, uid):
+        return uid in self._sids
+
+    def online_count(self):
+        return len(self._sids)
+
+    # --- 房间 ---
+    def enter_room(self, uid, rid, spectator=False):
+        prev = self._room_of.get(uid)
+        if prev is not None and prev != rid: self.leave_room(uid)
+        self._room_of[uid] = rid
+        self._members.setdefault(rid, set()).add(uid)
+        specs = self._spectators.setdefault(rid, set())
+        if spectator: specs.add(uid)
+        else: specs.discard(uid)
+
+    def leave_room(self, uid):
+        rid = self._room_of.pop(uid, None)
+        if rid is None: return None
+        for index in (self._members, self._spectators):
+            s = index.get(rid)
+            if s is not None: s.discard(uid)
+        self._match_of.pop(uid, None)
+        self.set_audience(uid, None)
+        return rid
+
+    def room_of(self, uid):
+        return self._room_of.get(uid)
+
+    def members(self, rid):
+        return self._members.get(rid, ())
+
+    def spectators(self, rid):
+        return self._spectators.get(rid, ())
+
+    def audience_sids(self, rid):
+        """房间内所有在线成员的 sid"""
+        for uid in self._members.get(rid, ()):
+            yield from self._sids.get(uid, ())
+
+    def drop_room(self, rid):
+        for uid in self._members.pop(rid, ()):
+            if self._room_of.get(uid) == rid: del self._room_of[uid]
+            self._match_of.pop(uid, None)
+            self.set_audience(uid, None)
+        self._spectators.pop(rid, None)
+
+    # --- 对局 ---
+    def set_match(self, uid, rid, match_id):
+        self._match_of[uid] = (rid, match_id)
+
+    def match_of(self, uid):
+        return self._match_of.get(uid)
+
+    # --- 受众 (同一视图的一组用户) ---
+    def set_audience(self, uid, name):
+        """把 uid 移到受众 name (None 表示移出)，返回原来的受众名"""
+        old = self._audience_of.get(uid)
+        if old == name: return old
+        if old is not None:
+            s = self._audiences.get(old)
+            if s is not None:
+                s.discard(uid)
+                if not s: del self._audiences[old]
+        if name is None: self._audience_of.pop(uid, None)
+        else:
+            self._audience_of[uid] = name
+            self._audiences.setdefault(name, set()).add(uid)
+        return old
+
+    def audience_of(self, uid):
+        return self._audience_of.get(uid)
+
+    def audience_members(self, name):
+        return self._audiences.get(name, ())
+
+    def end_game(self, rid):
+        """对局结束回到大厅：清空对局索引，观战者离开房间"""
+        for uid in list(self._spectators.get(rid, ())): self.leave_room(uid)
+        for uid in self._members.get(rid, ()):
+            self._match_of.pop(uid, None)
+            self.set_audience(uid, None)
@@ -0,0 +1,85 @@
+# scheduler.py
+
+
+class BroadcastScheduler:
+    """
+    按房间合并高频广播
+    - mark(rid)：标记房间状态已变化，下一个 tick 统一刷新一次
+    - mark_selection(rid, key, payload)：选择同步消息按 key 只保留最新一条
+    - flush(rid)：关键节点 (回合结算 / 游戏结束) 立即刷新，绕过 tick
+    run() 在单独的后台任务中循环，每 tick 秒刷新一次所有脏房间
+    dispatch(rid, fn, *args) 决定 tick 刷新在哪里执行 (默认直接调用，可投递到房间 actor)
+    """
+
+    def __init__(self, flush_fn, selection_fn, sleep, tick=0.04, dispatch=None):
+        self.flush_fn, self.selection_fn = flush_fn, selection_fn
+        self.sleep, self.tick = sleep, tick
+        self.dispatch = dispatch or self._call
+        self._dirty = {}        # rid -> None，保持标记顺序
+        self._selection = {}    # rid -> {key: payload}
+        self._running = False
+        # saved: 被合并掉、没有单独发出的广播 / 选择同步次数
+        self.marked = self.flushed = self.saved = 0
+        self.selection_marked = self.selection_sent = self.selection_saved = 0
+
+    @staticmethod
+    def _call(rid, fn, *args):
+        try: fn(*args)
+        except Exception as e: print(f"Broadcast error ({rid}): {e}")
+
+    def mark(self, rid):
+        self.marked += 1
+        if rid in self._dirty: self.saved += 1
+        else: self._dirty[rid] = None
+
+    def mark_selection(self, rid, key, payload):
+        self.selection_marked += 1
+        pending = self._selection.setdefault(rid, {})
+        if key in pending: self.selection_saved += 1
+        pending[key] = payload
+
+    def discard(self, rid):
+        """房间刚被完整广播过：之前的标记已经被覆盖"""
+        if self._dirty.pop(rid, 0) is None: self.saved += 1
+
+    def flush(self, rid):
+        sel = self._selection.pop(rid, None)
+        if sel:
+            for payload in sel.values():
+                self.selection_sent += 1
+                self.selection_fn(rid, payload)
+        self._dirty.pop(rid, None)
+        self.flushed += 1
+        self.flush_fn(rid)
+
+    def flush_all(self):
+        sel, self._selection = self._selection, {}
+        for rid, items in sel.items():
+            for payload in items.values():
+                self.selection_sent += 1
+                self.dispatch(rid, self.selection_fn, rid, payload)
+        dirty, self._dirty = self._dirty, {}
+        for rid in dirty:
+            self.flushed += 1
+            self.dispatch(rid, self.flush_fn, rid)
+
+    def pending(self):
+        """是否有等待下一个 tick 刷新的房间或选择同步"""
+        return bool(self._dirty or self._selection)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.sleep(self.tick)
+            if self.pending(): self.flush_all()
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {
+            "tick": self.tick, "marked": self.marked, "flushed": self.flushed, "saved": self.saved,
+            "selection_marked": self.selection_marked, "selection_sent": self.selection_sent,
+            "selection_saved": self.selection_saved,
+            "dirty_rooms": len(self._dirty),
+        }
@@ -0,0 +1,271 @@
+# simulator.py
+"""
+离线蒙特卡洛模拟：随机合法部署 x 攻方策略，统计每个 (规则, 策略, 攻方打法) 的期望与方差
+    python simulator.py --rounds 1000000 --workers 8 --seed 1
+    python simulator.py --rule 3 --strategy 4 --policy grade --json
+- 局数按固定大小切块，每块由 SeedSequence(seed).spawn 派生独立种子，结果与进程数无关
+- 策略 1/2/3 有 NumPy 向量化实现 (--scalar 强制逐局走 game_logic 的结算函数，用于对照)
+"""
+import argparse, concurrent.futures, json, math, os, time
+import numpy as np
+from game_logic import (BoxSet, BOX_COUNT, ATTEMPTS, JACKPOT_GUESSES, STRATEGY_RULE, validate_defense, calculate_grade,
+                        compare_outcome, guess_outcome, s4_found, s4_pick_limit, s4_pick_targets)
+from deployments import validate_defense_batch, rule1_sequences
+
+BALANCE = 10000
+CHUNK = 20000
+
+# 每个策略可用的攻方打法
+POLICIES = {1: ("random", "grade"), 2: ("random", "grade"), 3: ("bisect", "linear"), 4: ("random", "grade")}
+
+
+# --- 防守方：按规则均匀抽取合法部署 ---
+
+def sample_layouts(rule_id, n, rng, balance=BALANCE):
+    """返回 [n, 22, 2] 的 (c10, c100) 数组，每一行都是合法部署"""
+    if rule_id == 1:
+        seqs = np.array(list(rule1_sequences(balance)), dtype=np.int64)
+        pick = seqs[rng.integers(0, len(seqs), n)]
+        amounts = pick[:, :1] + pick[:, 1:] * np.arange(BOX_COUNT)
+        c100 = np.floor(rng.random((n, BOX_COUNT)) * (amounts // 100 + 1)).astype(np.int64)
+        c10 = (amounts - 100 * c100) // 10
+        order = np.argsort(rng.random((n, BOX_COUNT)), axis=1)
+        layout = np.stack([np.take_along_axis(c10, order, 1), np.take_along_axis(c100, order, 1)], axis=2)
+    elif rule_id == 2:
+        k = rng.integers(-(-3000 // 310), balance // 310 + 1, n)
+        c10 = np.repeat(k[:, None], BOX_COUNT, axis=1)
+        c100 = np.zeros_like(c10)
+        spec = rng.integers(0, BOX_COUNT, n)
+        rows = np.arange(n)
+        c100[rows, spec], c10[rows, spec] = k, 0
+        layout = np.stack([c10, c100], axis=2)
+    elif rule_id == 3:
+        base = 10 * BOX_COUNT * (BOX_COUNT + 1) // 2
+        s = rng.integers(-(-(3000 - base) // 100), (balance - base) // 100 + 1, n)
+        c10 = np.argsort(rng.random((n, BOX_COUNT)), axis=1) + 1
+        c100 = rng.multinomial(s, np.full(BOX_COUNT, 1 / BOX_COUNT))
+        layout = np.stack([c10, c100], axis=2)
+    else:
+        raise ValueError(f"unknown rule {rule_id}")
+    return layout
+
+
+def _grades(layout):
+    """公开的模糊分级 (0 较少 / 1 一般 / 2 较多)，与 calculate_grade 一致"""
+    count = layout[..., 0] + layout[..., 1]
+    return (count > 7).astype(np.int64) + (count > 15)
+
+
+# --- 向量化结算 (策略 1 / 2 / 3) ---
+
+def _vector_profit(strategy, policy, layout, rng):
+    n = len(layout)
+    amounts = layout[..., 0] * 10 + layout[..., 1] * 100
+    noise = rng.random((n, BOX_COUNT))
+    if strategy == 1:
+        # random: 随机 8 个盒子；grade: 分级高的优先，同级随机
+        keys = noise - (_grades(layout) if policy == "grade" else 0)
+        picks = np.argsort(keys, axis=1)[:, :ATTEMPTS]
+        return np.take_along_axis(amounts, picks, 1).sum(axis=1)
+    if strategy == 2:
+        # 每次比较两个没翻开过的盒子，共 16 个不同盒子
+        order = np.argsort(noise, axis=1)[:, :2 * ATTEMPTS]
+        va = np.take_along_axis(amounts, order[:, 0::2], 1)
+        vb = np.take_along_axis(amounts, order[:, 1::2], 1)
+        if policy == "grade":
+            g = _grades(layout)
+            more = np.take_along_axis(g, order[:, 1::2], 1) >= np.take_along_axis(g, order[:, 0::2], 1)
+        else:
+            more = np.ones(va.shape, dtype=bool)
+        win = np.where(more, vb >= va, vb < va)
+        return ((va + vb) * win).sum(axis=1)
+    if strategy == 3:
+        spec = layout[..., 1].argmax(axis=1)
+        hit_on = np.array([_guesses_to_hit(policy, s) for s in range(BOX_COUNT)])[spec]
+        jackpot = np.isin(hit_on, JACKPOT_GUESSES)
+        return np.where(jackpot, amounts.sum(axis=1), amounts[np.arange(n), spec])
+    raise ValueError(f"strategy {strategy} has no vectorized path")
+
+
+def _guesses_to_hit(policy, spec):
+    """确定性打法 (二分 / 顺序) 猜中特异点 spec 所需的次数"""
+    lo, hi, count = 0, BOX_COUNT - 1, 0
+    while True:
+        g = (lo + hi) // 2 if policy == "bisect" else lo
+        count += 1
+        if g == spec: return count
+        if g > spec: hi = g - 1
+        else: lo = g + 1
+
+
+# --- 逐局结算：走 game_logic 中与线上相同的结算函数 ---
+
+def play_round(strategy, policy, boxes, rng):
+    """在 BoxSet 上完整打一回合，返回攻方收益"""
+    n = len(boxes)
+    grades = [{"较少": 0, "一般": 1, "较多": 2}[calculate_grade(boxes.c10[i] + boxes.c100[i])] for i in range(n)]
+    by_grade = sorted(range(n), key=lambda i: (-grades[i], rng.random())) if policy == "grade" else rng.permutation(n).tolist()
+    profit = 0
+    if strategy == 1:
+        for i in by_grade[:ATTEMPTS]: profit += boxes.take(i)
+    elif strategy == 2:
+        order = rng.permutation(n).tolist()
+        for k in range(ATTEMPTS):
+            i, j = order[2 * k], order[2 * k + 1]
+            guess = 'more' if policy != "grade" or grades[j] >= grades[i] else 'less'
+            win, a, b = compare_outcome(boxes, i, j, guess)
+            if win: profit += boxes.take(i) + boxes.take(j)
+    elif strategy == 3:
+        lo, hi, guesses = 0, n - 1, 0
+        while True:
+            g = (lo + hi) // 2 if policy == "bisect" else lo
+            guesses += 1
+            hint, taken = guess_outcome(boxes, g, guesses)
+            if hint is None:
+                profit += sum(boxes.take(i) for i in taken)
+                break
+            if hint == "大了": hi = g - 1
+            else: lo = g + 1
+    elif strategy == 4:
+        profit = _play_s4(policy, boxes, grades, rng)
+    return profit
+
+
+def _play_s4(policy, boxes, grades, rng):
+    n = len(boxes)
+    known = {}          # 攻方记住揭示过的盒子金额
+    wins = 0
+
+    def reveal_for(target):
+        # grade 打法：目标张数越大，越可能在分级高的盒子里
+        if policy == "grade":
+            want = 2 if target > 15 else (1 if target > 7 else 0)
+            cand = sorted(range(n), key=lambda i: (abs(grades[i] - want), rng.random()))
+            # 已知 c10 的盒子直接命中
+            hit = [i for i in known if boxes.c10[i] == target]
+            cand = hit + [i for i in cand if i not in known and i not in hit]
+        else:
+            cand = rng.permutation(n).tolist()
+        return cand[:7]
+
+    # 阶段 1：攻方出题 (grade 打法选 22，只可能在"较多"的盒子里)
+    x = BOX_COUNT if policy == "grade" else int(rng.integers(1, 23))
+    rev = reveal_for(x)
+    wins += s4_found(boxes, rev, x)
+    for i in rev: known[i] = boxes.value(i)
+    # 阶段 2：守方出题，选攻方没见过的盒子里的张数
+    unseen = [i for i in range(n) if i not in known]
+    y = int(boxes.c10[unseen[int(rng.integers(0, len(unseen)))]])
+    rev = reveal_for(y)
+    wins += s4_found(boxes, rev, y)
+    for i in rev: known[i] = boxes.value(i)
+    # 结算：已知金额高的优先，其余按分级
+    limit = s4_pick_limit(wins)
+    rest = sorted((i for i in range(n) if i not in known), key=lambda i: (-grades[i], rng.random()))
+    picks = sorted(known, key=known.get, reverse=True) + rest
+    return sum(boxes.take(i) for i in s4_pick_targets(boxes, picks[:limit]))
+
+
+# --- 汇总 ---
+
+def _moments(values):
+    """(局数, 均值, 离差平方和 M2)；加上部署总额后可按 Chan 公式合并"""
+    v = np.asarray(values, dtype=np.float64)
+    mean = float(v.mean()) if len(v) else 0.0
+    return len(v), mean, float(((v - mean) ** 2).sum())
+
+
+def _merge(a, b):
+    n = a[0] + b[0]
+    if n == 0: return a
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / n
+    return n, mean, a[2] + b[2] + delta * delta * a[0] * b[0] / n, a[3] + b[3]
+
+
+def run_chunk(rule_id, strategy, policy, n, seed, vectorized=True, balance=BALANCE):
+    """在一个进程中模拟 n 局，返回 (局数, 均值, M2, 部署总额之和)"""
+    rng = np.random.default_rng(seed)
+    layout = sample_layouts(rule_id, n, rng, balance)
+    deployed = float((layout[..., 0] * 10 + layout[..., 1] * 100).sum())
+    if vectorized and strategy != 4:
+        if (validate_defense_batch(rule_id, layout, balance) != 0).any(): raise AssertionError("抽样得到非法部署")
+        return _moments(_vector_profit(strategy, policy, layout, rng)) + (deployed,)
+    profits = []
+    for row in layout:
+        boxes = BoxSet(row[:, 0].tolist(), row[:, 1].tolist())
+        ok, msg = validate_defense(rule_id, boxes, balance)
+        if not ok: raise AssertionError(f"抽样得到非法部署: {msg}")
+        profits.append(play_round(strategy, policy, boxes, rng))
+    return _moments(profits) + (deployed,)
+
+
+def simulate(pairs, rounds, seed=0, workers=None, vectorized=True, balance=BALANCE, chunk=CHUNK):
+    """
+    pairs: [(rule, strategy, policy), ...]；每个组合模拟 rounds 局
+    返回 {(rule, strategy, policy): {...统计...}}
+    """
+    jobs = []
+    root = np.random.SeedSequence(seed)
+    for pair, pair_seq in zip(pairs, root.spawn(len(pairs))):
+        sizes = [chunk] * (rounds // chunk) + ([rounds % chunk] if rounds % chunk else [])
+        for size, s in zip(sizes, pair_seq.spawn(len(sizes))): jobs.append((pair, size, s))
+    acc = {pair: (0, 0.0, 0.0, 0.0) for pair in pairs}
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers <= 1:
+        for pair, size, s in jobs: acc[pair] = _merge(acc[pair], run_chunk(*pair, size, s, vectorized, balance))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as ex:
+            futures = {ex.submit(run_chunk, *pair, size, s, vectorized, balance): pair for pair, size, s in jobs}
+            # 按提交顺序合并，保证浮点结果与完成顺序无关
+            for fut in list(futures): acc[futures[fut]] = _merge(acc[futures[fut]], fut.result())
+    elapsed = time.perf_counter() - start
+    out = {}
+    for pair, (n, mean, m2, deployed) in acc.items():
+        var = m2 / (n - 1) if n > 1 else 0.0
+        out[pair] = {"rounds": n, "ev": mean, "var": var, "std": math.sqrt(var),
+                     "stderr": math.sqrt(var / n) if n else 0.0,
+                     "mean_deployed": deployed / n if n else 0.0,
+                     "take_rate": mean / (deployed / n) if n and deployed else 0.0}
+    return out, elapsed
+
+
+def all_pairs():
+    for strategy, rule in STRATEGY_RULE.items():
+        for r in ((1, 2, 3) if rule is None else (rule,)):
+            for policy in POLICIES[strategy]: yield r, strategy, policy
+
+
+def main():
+    ap = argparse.ArgumentParser(description="蒙特卡洛策略模拟")
+    ap.add_argument("--rounds", type=int, default=200000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--rule", type=int)
+    ap.add_argument("--strategy", type=int)
+    ap.add_argument("--policy")
+    ap.add_argument("--balance", type=int, default=BALANCE)
+    ap.add_argument("--scalar", action="store_true", help="逐局走 game_logic 结算函数，不使用向量化实现")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    pairs = [p for p in all_pairs()
+             if (args.rule is None or p[0] == args.rule) and (args.strategy is None or p[1] == args.strategy)
+             and (args.policy is None or p[2] == args.policy)]
+    results, elapsed = simulate(pairs, args.rounds, args.seed, args.workers, not args.scalar, args.balance)
+    total = sum(r["rounds"] for r in results.values())
+    if args.json:
+        print(json.dumps({"elapsed": elapsed, "rounds_per_sec": total / elapsed,
+                          "results": [{"rule": k[0], "strategy": k[1], "policy": k[2], **v} for k, v in results.items()]},
+                         ensure_ascii=False, indent=2))
+        return
+    print(f"{'rule':>4} {'strat':>5} {'policy':>7} {'rounds':>9} {'EV':>9} {'std':>9} {'±se':>7} {'deployed':>9} {'take':>6}")
+    for (rule, strategy, policy), r in results.items():
+        print(f"{rule:>4} {strategy:>5} {policy:>7} {r['rounds']:>9} {r['ev']:>9.1f} {r['std']:>9.1f} "
+              f"{r['stderr']:>7.2f} {r['mean_deployed']:>9.1f} {r['take_rate']:>6.1%}")
+    print(f"{total} rounds in {elapsed:.2f}s ({total / elapsed:,.0f} rounds/s)")
+
+
+if __name__ == "__main__":
+    main()
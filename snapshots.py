@@ -0,0 +1,257 @@
+# snapshots.py
+import gc, mmap, os, pickle, struct, time, zlib
+
+MAGIC = b'PIGS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQIQ')     # magic, version, 保留, 覆盖到的 WAL 段号, 房间数, 索引偏移
+RECORD = struct.Struct('<II')          # crc32, 长度 (快照与 WAL 共用)
+WAL_OP = struct.Struct('<BH')          # 操作 (PUT / DELETE), 房间号长度
+INDEX = struct.Struct('<QI')           # 快照中记录的偏移, 长度
+PUT, DELETE = 1, 2
+
+
+def encode_payload(record):
+    """房间记录 -> zlib 压缩的 pickle；对局对象 (__slots__ 类) 原样保存，恢复时不必再从线上格式逐个盒子重建"""
+    return zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def decode_payload(payload):
+    # 只读取本进程自己写入的本地文件
+    return pickle.loads(zlib.decompress(payload))
+
+
+class RoomStore:
+    """
+    房间状态的本地持久化：快照 + 预写日志 (WAL)，进程崩溃后重启恢复进行中的对局
+    - put(rid, record) 在每条房间命令执行完后调用 (房间 actor 的 after 钩子)：内容变化时追加一条 WAL 记录
+    - snapshot() 周期性执行，增量生成新快照：变化过的房间直接使用写 WAL 时的压缩字节，
+      其余房间从旧快照 (mmap) 原样拷贝，不重新序列化；新快照原子替换后删除已被覆盖的 WAL 段
+    - load() 以 mmap 读取快照，再按顺序重放之后的 WAL 段；记录按房间后写覆盖先写，遇到残缺的尾部记录即停止
+    - 写快照文件与 fsync 经 offload(fn, *args) 执行 (服务端传入 eventlet.tpool.execute，放到 OS 线程中，不阻塞 hub)；
+      线程中只读旧快照的 mmap 与交给它的脏记录，切换 WAL 段、替换文件、重新映射都在调用方完成，put() 不需要加锁
+    文件格式 (小端)：
+      snapshot.bin   头部 HEADER | 记录 (crc, len, payload)* | 索引 (rid_len u16, rid, off u64, len u32)*
+      wal-NNNNNNNN.log  (crc, len, op u8, rid_len u16, rid, payload)*，crc 覆盖 len 之后的全部字节
+    """
+
+    def __init__(self, directory, interval=30.0, fsync_interval=1.0, sleep=time.sleep, offload=None):
+        self.directory, self.interval, self.fsync_interval, self.sleep = directory, interval, fsync_interval, sleep
+        self.offload = offload or (lambda fn, *args: fn(*args))
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, 'snapshot.bin')
+        self._crc = {}          # rid -> 上次写入内容的 crc，内容不变时不写 WAL
+        self._dirty = {}        # rid -> 上次快照之后的最新压缩记录 (None 表示已删除)
+        self._map = None        # 当前快照的 mmap
+        self._index = {}        # rid -> (offset, length)，指向 _map
+        self._wal = None
+        self._wal_seq = 0
+        self._unsynced = False
+        self._running = False
+        self.puts = self.skipped = self.snapshots = 0
+        self.last_snapshot_ms = self.last_load_ms = 0.0
+
+    # --- 写入 ---
+    def put(self, rid, record):
+        """记录房间 rid 的最新状态 (record 为 None 表示房间已删除)"""
+        payload = encode_payload(record) if record is not None else None
+        crc = zlib.crc32(payload) if payload is not None else None
+        if self._crc.get(rid, -1) == crc:
+            self.skipped += 1
+            return
+        if crc is None and rid not in self._crc and rid not in self._index: return
+        if crc is None: self._crc.pop(rid, None)
+        else: self._crc[rid] = crc
+        self._dirty[rid] = payload
+        key = rid.encode('utf-8')
+        body = WAL_OP.pack(DELETE if payload is None else PUT, len(key)) + key + (payload or b'')
+        if self._wal is None: self._open_wal(self._wal_seq or 1)
+        self._wal.write(RECORD.pack(zlib.crc32(body), len(body)) + body)
+        self._unsynced = True
+        self.puts += 1
+
+    def _wal_path(self, seq):
+        return os.path.join(self.directory, f'wal-{seq:08d}.log')
+
+    def _open_wal(self, seq):
+        if self._wal: self._wal.close()
+        self._wal_seq = seq
+        self._wal = open(self._wal_path(seq), 'ab', buffering=0)
+
+    def _wal_segments(self):
+        return sorted(int(n[4:12]) for n in os.listdir(self.directory) if n.startswith('wal-') and n.endswith('.log'))
+
+    def sync(self):
+        if self._wal and self._unsynced:
+            self._unsynced = False          # fsync 期间的写入重新标记，下一轮再同步
+            self.offload(os.fsync, self._wal.fileno())
+
+    def snapshot(self):
+        """增量生成新快照；没有变化时什么都不做"""
+        if not self._dirty: return False
+        start = time.perf_counter()
+        # 先切换 WAL 段：之后的修改写入新段，新快照覆盖旧段的全部内容
+        covered = self._wal_seq
+        self._open_wal(covered + 1)
+        dirty, self._dirty = self._dirty, {}
+        tmp = self._path + '.tmp'
+        try:
+            self.offload(self._write_snapshot, tmp, dirty, covered)
+            self._install(tmp)
+        except Exception:
+            # 写入失败 (如磁盘满)：放回脏记录并回到旧 WAL 段，旧快照与 mmap 保持不变，下次快照重试
+            self._dirty = {**dirty, **self._dirty}
+            self._rollback_wal(covered)
+            try: os.remove(tmp)
+            except OSError: pass
+            raise
+        for seq in self._wal_segments():
+            if seq <= covered: os.remove(self._wal_path(seq))
+        self.snapshots += 1
+        self.last_snapshot_ms = (time.perf_counter() - start) * 1000
+        return True
+
+    def _rollback_wal(self, seq):
+        new = self._wal_seq
+        self._open_wal(seq)
+        try:
+            if new != seq and os.path.getsize(self._wal_path(new)) == 0: os.remove(self._wal_path(new))
+        except OSError: pass
+
+    def _write_snapshot(self, tmp, dirty, covered):
+        index = {}
+        with open(tmp, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            off = HEADER.size
+            for rid in list(self._index) + [r for r in dirty if r not in self._index]:
+                if rid in dirty:
+                    payload = dirty[rid]
+                    if payload is None: continue
+                    blob = RECORD.pack(zlib.crc32(payload), len(payload)) + payload
+                else:
+                    o, n = self._index[rid]
+                    blob = self._map[o:o + n]
+                f.write(blob)
+                index[rid] = (off, len(blob))
+                off += len(blob)
+            index_off = off
+            for rid, (o, n) in index.items():
+                key = rid.encode('utf-8')
+                f.write(struct.pack('<H', len(key)) + key + INDEX.pack(o, n))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, 0, covered + 1, len(index), index_off))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _install(self, tmp):
+        # 替换失败时旧快照仍在原处，重新映射即可
+        self._close_map()
+        try: os.replace(tmp, self._path)
+        finally: self._open_map()
+
+    # --- 读取 ---
+    def _open_map(self):
+        """映射快照文件并读出索引；返回快照之后需要重放的第一个 WAL 段号"""
+        self._index = {}
+        if not os.path.exists(self._path) or os.path.getsize(self._path) < HEADER.size: return 1
+        with open(self._path, 'rb') as f: self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, wal_from, count, pos = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION: raise ValueError(f"快照格式不兼容: {self._path}")
+        mm = self._map
+        for _ in range(count):
+            (n,) = struct.unpack_from('<H', mm, pos)
+            rid = mm[pos + 2:pos + 2 + n].decode('utf-8')
+            self._index[rid] = INDEX.unpack_from(mm, pos + 2 + n)
+            pos += 2 + n + INDEX.size
+        return wal_from
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _snapshot_payload(self, rid):
+        o, n = self._index[rid]
+        crc, length = RECORD.unpack_from(self._map, o)
+        payload = self._map[o + RECORD.size:o + RECORD.size + length]
+        if zlib.crc32(payload) != crc: raise ValueError(f"快照记录校验失败: {rid}")
+        return payload
+
+    def _replay(self, seq, latest):
+        """重放一个 WAL 段到 latest (rid -> payload / None)；返回是否完整读完"""
+        with open(self._wal_path(seq), 'rb') as f: data = f.read()
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            crc, length = RECORD.unpack_from(data, pos)
+            body = data[pos + RECORD.size:pos + RECORD.size + length]
+            if len(body) < length or zlib.crc32(body) != crc: return False      # 崩溃时写了一半的记录
+            op, n = WAL_OP.unpack_from(body, 0)
+            rid = body[WAL_OP.size:WAL_OP.size + n].decode('utf-8')
+            latest[rid] = body[WAL_OP.size + n:] if op == PUT else None
+            pos += RECORD.size + length
+        return pos == len(data)
+
+    def load(self):
+        """恢复全部房间记录：{rid: record}；之后的写入进入新的 WAL 段"""
+        start = time.perf_counter()
+        self._close_map()
+        wal_from = self._open_map()
+        latest = {}
+        segments = [s for s in self._wal_segments() if s >= wal_from]
+        for seq in segments:
+            if not self._replay(seq, latest): print(f"RoomStore: WAL 段 {seq} 尾部残缺，已忽略残缺部分")
+        out = {}
+        # 一次解码成千上万个房间会不断触发分代 GC 扫描新建的容器，解码期间暂停 GC (约快一倍)
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for rid in self._index:
+                if rid not in latest: out[rid] = self._decode(rid, self._snapshot_payload(rid))
+            for rid, payload in latest.items():
+                if payload is not None: out[rid] = self._decode(rid, payload)
+                else: out.pop(rid, None)
+        finally:
+            if enabled: gc.enable()
+        # WAL 中的修改尚未进入快照：记为脏，下一次快照时写入
+        self._dirty = {rid: payload for rid, payload in latest.items() if payload is not None or rid in self._index}
+        self._crc = {rid: zlib.crc32(p) for rid, p in latest.items() if p is not None}
+        self._crc.update((rid, zlib.crc32(self._snapshot_payload(rid))) for rid in self._index if rid not in latest)
+        self._open_wal(max(segments + [wal_from - 1]) + 1)
+        self.last_load_ms = (time.perf_counter() - start) * 1000
+        return {rid: rec for rid, rec in out.items() if rec is not None}
+
+    @staticmethod
+    def _decode(rid, payload):
+        try: return decode_payload(payload)
+        except Exception as e:      # 代码升级后旧记录不再兼容：丢弃该房间，不影响其余房间恢复
+            print(f"RoomStore: 无法恢复房间 {rid}: {e}")
+            return None
+
+    # --- 后台任务 ---
+    def run(self):
+        self._running = True
+        last_snapshot = time.monotonic()
+        while self._running:
+            self.sleep(self.fsync_interval)
+            try:
+                self.sync()
+                if time.monotonic() - last_snapshot >= self.interval:
+                    last_snapshot = time.monotonic()
+                    self.snapshot()
+            except Exception as e: print(f"RoomStore error: {type(e).__name__}: {e}")     # 后台任务不能因一次失败退出
+
+    def close(self):
+        """停止后台任务并写出最终快照 (下次启动不需要重放 WAL)"""
+        self._running = False
+        self.offload = lambda fn, *args: fn(*args)      # 退出时 (atexit) 不再依赖线程池，直接在当前线程写出
+        try:
+            self.snapshot()
+            self.sync()
+        finally:
+            if self._wal: self._wal.close()
+            self._wal = None
+            self._close_map()
+
+    def stats(self):
+        return {"rooms": len(self._crc), "dirty": len(self._dirty), "wal_seq": self._wal_seq, "puts": self.puts,
+                "skipped": self.skipped, "snapshots": self.snapshots, "last_snapshot_ms": self.last_snapshot_ms,
+                "last_load_ms": self.last_load_ms}
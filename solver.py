@@ -0,0 +1,300 @@
+# solver.py
+"""
+策略 3 与方案 D (策略 4) 的精确博弈求解
+    python solver.py build [--dir cache/solver]     求解并写出表文件
+    python solver.py show  [--dir cache/solver]     查看已写出的结果
+- 策略 3：防守方选特异点位置 s (0..21)，攻方每次猜一个下标并得到 大了/小了 提示，直到猜中；
+  第 1/2/3/7/8 次猜中拿走全部 (规则 2 下为特异盒子金额的 3.1 倍)，否则只拿走特异盒子。
+  双 oracle：防守方在已知搜索树集合上解 LP，攻方对防守分布做逆向归纳求最优搜索树，直到收敛。
+  逆向归纳的置换表以 (区间, 第几次猜) 为键，利用左右镜像对称共用表项，并有 LRU 上限。
+- 方案 D：同一分级的盒子对攻方不可区分 (盒子置换对称)，信息状态只需要各分级中未揭示的盒子数。
+  目标张数 t 只可能在 张数下限满足的分级中 (t<=7 任意分级，8..15 为"一般"/"较多"，>=16 只在"较多")，
+  揭示 L 个盒子的搜索博弈有精确解：价值 min(1, L/N)，N 为可能藏有 t 的未揭示盒子数，
+  双方的均衡策略都是在这 N 个盒子上均匀分布。
+表文件为 .npy，启动时只以 mmap_mode='r' 惰性映射，查询时不做任何求解。
+"""
+import argparse, json, os
+from collections import OrderedDict
+import numpy as np
+from game_logic import BOX_COUNT, JACKPOT_GUESSES
+
+JACKPOT_RATIO = 3.1         # 规则 2：全部金额 310n / 特异盒子金额 100n
+GRADE_CLASSES = 3           # 较少 / 一般 / 较多
+S4_LOOKS = 7
+
+
+class TranspositionTable:
+    """带 LRU 上限的置换表；canon(key) 返回 (规范键, 是否经过镜像)，对称状态共用一项"""
+
+    def __init__(self, maxsize=100000, canon=None):
+        self.maxsize, self.canon = maxsize, canon
+        self._data = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        ckey, flipped = self.canon(key) if self.canon else (key, False)
+        v = self._data.get(ckey)
+        if v is None:
+            self.misses += 1
+            return None, flipped
+        self._data.move_to_end(ckey)
+        self.hits += 1
+        return v, flipped
+
+    def put(self, key, value):
+        ckey, _ = self.canon(key) if self.canon else (key, False)
+        self._data[ckey] = value
+        self._data.move_to_end(ckey)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- 策略 3 ---
+
+def _pay(k):
+    return JACKPOT_RATIO if k in JACKPOT_GUESSES else 1.0
+
+
+def _reflect(key):
+    lo, hi, k = key
+    flipped = (BOX_COUNT - 1 - hi, BOX_COUNT - 1 - lo, k)
+    return (flipped, True) if flipped < key else (key, False)
+
+
+def s3_best_response(p, maxsize=100000):
+    """
+    对防守分布 p (长度 22，需左右对称) 的攻方最优搜索树，逆向归纳
+    返回 (期望收益, 猜测表 [22, 22] int8 (tree[lo, hi] = 猜的下标，-1 为不会到达), 各位置的命中次数)
+    """
+    last = BOX_COUNT - 1
+    table = TranspositionTable(maxsize, canon=_reflect)
+
+    def value(lo, hi, k):
+        if lo > hi: return 0.0, -1
+        hit, flipped = table.get((lo, hi, k))
+        if hit is not None: return hit[0], (last - hit[1] if flipped else hit[1])
+        best, best_g = -1.0, lo
+        for g in range(lo, hi + 1):
+            v = p[g] * _pay(k) + value(lo, g - 1, k + 1)[0] + value(g + 1, hi, k + 1)[0]
+            if v > best + 1e-15: best, best_g = v, g
+        # 表项按规范方向存储猜测
+        _, flip = _reflect((lo, hi, k))
+        table.put((lo, hi, k), (best, last - best_g if flip else best_g))
+        return best, best_g
+
+    tree = np.full((BOX_COUNT, BOX_COUNT), -1, dtype=np.int8)
+    hits = np.zeros(BOX_COUNT, dtype=np.int64)
+    total = value(0, last, 1)[0]
+    stack = [(0, last, 1)]
+    while stack:
+        lo, hi, k = stack.pop()
+        if lo > hi: continue
+        g = value(lo, hi, k)[1]
+        tree[lo, hi], hits[g] = g, k
+        stack += [(lo, g - 1, k + 1), (g + 1, hi, k + 1)]
+    return total, tree, hits
+
+
+def _reflect_tree(tree):
+    out = np.full_like(tree, -1)
+    lo, hi = np.nonzero(tree >= 0)
+    out[BOX_COUNT - 1 - hi, BOX_COUNT - 1 - lo] = BOX_COUNT - 1 - tree[lo, hi]
+    return out
+
+
+def _tree_hits(tree):
+    hits = np.zeros(BOX_COUNT, dtype=np.int64)
+    stack = [(0, BOX_COUNT - 1, 1)]
+    while stack:
+        lo, hi, k = stack.pop()
+        if lo > hi: continue
+        g = int(tree[lo, hi])
+        hits[g] = k
+        stack += [(lo, g - 1, k + 1), (g + 1, hi, k + 1)]
+    return hits
+
+
+def _bisect_tree():
+    tree = np.full((BOX_COUNT, BOX_COUNT), -1, dtype=np.int8)
+    for lo in range(BOX_COUNT):
+        for hi in range(lo, BOX_COUNT): tree[lo, hi] = (lo + hi) // 2
+    return tree
+
+
+def solve_s3(tol=1e-10, max_iter=500):
+    """
+    双 oracle 求策略 3 的均衡
+    返回 dict: value (以特异盒子金额为单位的攻方期望)、defender (22 个位置的概率)、trees [m, 22, 22]、weights [m]
+    """
+    try: from scipy.optimize import linprog
+    except ImportError: raise RuntimeError("求解需要 scipy (pip install scipy)；查询已写出的表不需要")
+    trees = [_bisect_tree()]
+    trees.append(_reflect_tree(trees[0]))
+    n = BOX_COUNT
+    for it in range(max_iter):
+        pay = np.array([[_pay(k) for k in _tree_hits(t)] for t in trees])
+        # 变量 [p_0..p_21, v]：min v  s.t. pay @ p <= v, sum p = 1
+        # 树集合对镜像封闭，p 与其镜像同为最优解，取平均得到对称的 p (逆向归纳的镜像置换表要求对称)
+        c = np.zeros(n + 1); c[-1] = 1
+        a_ub = np.hstack([pay, -np.ones((len(trees), 1))])
+        res = linprog(c, A_ub=a_ub, b_ub=np.zeros(len(trees)), A_eq=np.append(np.ones(n), 0)[None],
+                      b_eq=[1], bounds=[(0, None)] * n + [(None, None)], method="highs")
+        if res.status != 0: raise RuntimeError(f"LP 求解失败: {res.message}")
+        p, v = (res.x[:n] + res.x[n - 1::-1]) / 2, res.x[n]
+        br_value, br_tree, _ = s3_best_response(p)
+        if br_value <= v + tol: break
+        trees += [br_tree, _reflect_tree(br_tree)]
+    weights = np.maximum(-res.ineqlin.marginals, 0)
+    weights /= weights.sum()
+    keep = weights > 1e-12
+    return {"value": float(v), "defender": p, "trees": np.array(trees)[keep], "weights": weights[keep], "iterations": it + 1}
+
+
+# --- 方案 D ---
+
+def target_mask(t):
+    """目标张数 t 可能所在的分级下限：0 任意分级，1 "一般"及以上，2 只在"较多" """
+    return 0 if t <= 7 else (1 if t <= 15 else 2)
+
+
+def solve_s4_search():
+    """
+    方案 D 单阶段搜索博弈的完整表：[mask, n0, n1, n2, looks] -> (value, q0, q1, q2, x0, x1, x2)
+    q 为防守方把目标放在各分级的概率，x 为攻方在各分级的期望揭示数；不可能的状态为 NaN
+    """
+    size = BOX_COUNT + 1
+    out = np.full((GRADE_CLASSES, size, size, size, S4_LOOKS + 1, 7), np.nan, dtype=np.float32)
+    n0, n1, n2 = np.meshgrid(np.arange(size), np.arange(size), np.arange(size), indexing="ij")
+    valid = n0 + n1 + n2 <= BOX_COUNT
+    counts = np.stack([n0, n1, n2], axis=-1).astype(np.float64)
+    for mask in range(GRADE_CLASSES):
+        feasible = counts * (np.arange(GRADE_CLASSES) >= mask)
+        total = feasible.sum(axis=-1)
+        ok = valid & (total > 0)
+        for looks in range(S4_LOOKS + 1):
+            value = np.minimum(1.0, looks / np.where(total > 0, total, 1))
+            q = feasible / np.where(total > 0, total, 1)[..., None]
+            x = feasible * value[..., None]
+            block = np.concatenate([value[..., None], q, x], axis=-1)
+            out[mask, ..., looks, :][ok] = block[ok]
+    return out
+
+
+# --- 表文件 ---
+
+class SolverTables:
+    """惰性映射求解结果；文件不存在时对应属性为 None，调用方应退回启发式"""
+
+    def __init__(self, path):
+        self.path = path
+        self._s3 = self._s4 = None
+        self._loaded = set()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def s3(self):
+        if "s3" not in self._loaded:
+            self._loaded.add("s3")
+            try:
+                with open(self._file("s3.json"), encoding="utf-8") as f: meta = json.load(f)
+                self._s3 = {**meta, "defender": np.load(self._file("s3_defender.npy"), mmap_mode="r"),
+                            "trees": np.load(self._file("s3_trees.npy"), mmap_mode="r"),
+                            "weights": np.load(self._file("s3_weights.npy"), mmap_mode="r")}
+            except FileNotFoundError: self._s3 = None
+        return self._s3
+
+    @property
+    def s4(self):
+        if "s4" not in self._loaded:
+            self._loaded.add("s4")
+            try: self._s4 = np.load(self._file("s4.npy"), mmap_mode="r")
+            except FileNotFoundError: self._s4 = None
+        return self._s4
+
+    def save(self, s3, s4):
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self._file("s3_defender.npy"), np.asarray(s3["defender"], dtype=np.float64))
+        np.save(self._file("s3_trees.npy"), s3["trees"].astype(np.int8))
+        np.save(self._file("s3_weights.npy"), s3["weights"].astype(np.float64))
+        with open(self._file("s3.json"), "w", encoding="utf-8") as f:
+            json.dump({"value": s3["value"], "iterations": s3["iterations"], "jackpot_ratio": JACKPOT_RATIO}, f)
+        np.save(self._file("s4.npy"), s4)
+        self._loaded.clear()
+
+    # --- 查询 (不做求解) ---
+    def s3_pick_tree(self, rng):
+        """按均衡混合策略抽一棵搜索树，攻方整回合照它走"""
+        s3 = self.s3
+        if s3 is None: return None
+        w = np.asarray(s3["weights"])
+        return np.asarray(s3["trees"][rng.choice(len(w), p=w / w.sum())])
+
+    def s3_place(self, rng):
+        """按均衡分布抽防守方的特异点位置"""
+        s3 = self.s3
+        if s3 is None: return None
+        p = np.asarray(s3["defender"])
+        return int(rng.choice(BOX_COUNT, p=p / p.sum()))
+
+    def s3_hint(self, lo, hi):
+        """当前区间 [lo, hi] 的推荐猜测：均衡中权重最大、且经过该区间的搜索树给出的下标"""
+        s3 = self.s3
+        if s3 is None or lo > hi: return None
+        guesses = np.asarray(s3["trees"][:, lo, hi])
+        w = np.where(guesses >= 0, np.asarray(s3["weights"]), 0)
+        return int(guesses[w.argmax()]) if w.any() else (lo + hi) // 2
+
+    def s4_search(self, target, counts, looks=S4_LOOKS):
+        """目标张数 target、各分级未揭示盒子数 counts 时的 (找到概率, 各分级期望揭示数)"""
+        s4 = self.s4
+        mask = target_mask(target)
+        if s4 is not None:
+            row = s4[mask, counts[0], counts[1], counts[2], min(looks, S4_LOOKS)]
+            if not np.isnan(row[0]): return float(row[0]), [float(x) for x in row[4:7]]
+        # 表缺失时按闭式解计算 (与表内容一致)
+        feasible = [c if g >= mask else 0 for g, c in enumerate(counts)]
+        total = sum(feasible)
+        if total == 0: return 0.0, [0.0] * GRADE_CLASSES
+        value = min(1.0, looks / total)
+        return value, [c * value for c in feasible]
+
+    def s4_best_target(self, counts, looks=S4_LOOKS):
+        """阶段 1 攻方出题：返回 (目标张数, 找到概率)；同一 mask 内任何张数等价，取最大的"""
+        best = max(((t, self.s4_search(t, counts, looks)[0]) for t in (7, 15, BOX_COUNT)), key=lambda x: x[1])
+        return best
+
+    def s4_counter_target(self, candidates, counts, looks=S4_LOOKS):
+        """阶段 2 守方出题：candidates 为攻方没见过的盒子的 10 元张数，返回让攻方找到概率最低的一个"""
+        return min(candidates, key=lambda t: (self.s4_search(t, counts, looks)[0], t))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="策略 3 / 方案 D 精确求解")
+    ap.add_argument("cmd", choices=("build", "show"))
+    ap.add_argument("--dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "solver"))
+    args = ap.parse_args()
+    tables = SolverTables(args.dir)
+    if args.cmd == "build":
+        s3 = solve_s3()
+        tables.save(s3, solve_s4_search())
+        print(f"S3 value {s3['value']:.6f} ({s3['iterations']} iterations, {len(s3['weights'])} trees in support)")
+        print(f"written to {args.dir}")
+        return
+    s3 = tables.s3
+    if s3 is None: return print(f"no tables in {args.dir}; run: python solver.py build")
+    print(f"S3 value {s3['value']:.6f} x special box, {len(s3['weights'])} attacker trees")
+    print("defender placement:", " ".join(f"{x:.3f}" for x in s3["defender"]))
+    first = {}
+    for t, w in zip(s3["trees"], s3["weights"]): first[int(t[0, BOX_COUNT - 1])] = first.get(int(t[0, BOX_COUNT - 1]), 0) + float(w)
+    print("first guess:", {g: round(w, 4) for g, w in sorted(first.items())})
+    print("S4 phase 1, all boxes unseen, grades (5, 5, 12):", tables.s4_best_target((5, 5, 12)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# state_channel.py
+import json
+from codec import pack
+
+# 差量格式 (与前端 applyPatch 对应)：
+#   ['r', path, value]  替换/新增 path 处的值
+#   ['d', path]         删除 path 处的键
+# path 为键/下标组成的列表，例如 ['match_data', 'game_data', 'public_boxes', 3, 'revealed']
+
+
+def diff(old, new, path=None, ops=None):
+    """求 old -> new 的差量；两者都必须是 JSON 往返之后的纯数据 (不与运行时状态共享引用)"""
+    if path is None: path = []
+    if ops is None: ops = []
+    if type(old) is dict and type(new) is dict:
+        for k, v in new.items():
+            if k not in old: ops.append(['r', path + [k], v])
+            elif old[k] != v: diff(old[k], v, path + [k], ops)
+        for k in old:
+            if k not in new: ops.append(['d', path + [k]])
+    elif type(old) is list and type(new) is list and len(old) == len(new):
+        for i, (a, b) in enumerate(zip(old, new)):
+            if a != b: diff(a, b, path + [i], ops)
+    elif old != new:
+        ops.append(['r', path, new])
+    return ops
+
+
+def apply_patch(doc, ops):
+    """把差量应用到 doc 上 (原地修改)，返回新的根对象"""
+    for op in ops:
+        path = op[1]
+        if not path:
+            doc = op[2] if op[0] == 'r' else None
+            continue
+        node = doc
+        for k in path[:-1]: node = node[k]
+        if op[0] == 'r': node[path[-1]] = op[2]
+        else: node.pop(path[-1], None)
+    return doc
+
+
+def encode(obj):
+    """序列化为紧凑的 UTF-8 JSON 字节，作为 Socket.IO 二进制附件下发"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class StateChannel:
+    """
+    一个对局的版本化状态通道
+    - rev 单调递增，每次广播最多 +1
+    - 按视图键 (受众) 记录最后一次发布的内容与版本，下一次只需要发送差量
+    - 每个视图只序列化一次，差量与快照字节被该受众的所有连接共享；packed 编码的快照在首次需要时生成并缓存
+    """
+    __slots__ = ("rev", "_views")
+
+    def __init__(self):
+        self.rev = 0
+        self._views = {}   # key -> [rev, frozen_view, raw_json, snapshot_bytes, packed_snapshot_bytes]
+
+    def bump(self):
+        self.rev += 1
+        return self.rev
+
+    def publish(self, key, view):
+        """
+        记录视图的新内容，返回 (base_rev, rev, ops)
+        首次发布时 ops 为 None；内容没有变化时 ops 为空，rev == base_rev
+        """
+        raw = json.dumps(view, ensure_ascii=False, separators=(',', ':'))
+        prev = self._views.get(key)
+        if prev is not None and prev[2] == raw: return prev[0], prev[0], []
+        frozen = json.loads(raw)
+        self._views[key] = [self.rev, frozen, raw, None, None]
+        if prev is None: return None, self.rev, None
+        return prev[0], self.rev, diff(prev[1], frozen)
+
+    def rev_of(self, key):
+        v = self._views.get(key)
+        return v[0] if v else None
+
+    def snapshot(self, key, packed=False):
+        """返回视图 key 当前版本的快照字节 {"rev": n, "view": {...}} (JSON 或 packed 帧)；没有发布过时返回 None"""
+        v = self._views.get(key)
+        if v is None: return None
+        if packed:
+            if v[4] is None: v[4] = pack({"rev": v[0], "view": v[1]})
+            return v[4]
+        if v[3] is None: v[3] = f'{{"rev":{v[0]},"view":{v[2]}}}'.encode('utf-8')
+        return v[3]
+
+    def forget(self, key):
+        self._views.pop(key, None)
+
+
+class ClientSync:
+    """
+    记录每个 sid 正在跟随的 (通道, 视图键) 与最后确认 (ack) 的版本
+    ack 落后通道当前版本太多时，调用方应补发一次完整快照
+    """
+    MAX_LAG = 8
+
+    def __init__(self):
+        self._state = {}   # sid -> [channel, key, acked_rev]
+
+    def follow(self, sid, channel, key, rev):
+        self._state[sid] = [channel, key, rev]
+
+    def ack(self, sid, rev):
+        """记录 ack，返回该客户端是否已落后过多"""
+        st = self._state.get(sid)
+        if not st or not isinstance(rev, int): return False
+        if rev > st[2]: st[2] = rev
+        current = st[0].rev_of(st[1])
+        return current is not None and current - st[2] > self.MAX_LAG
+
+    def drop(self, sid):
+        self._state.pop(sid, None)
@@ -0,0 +1,66 @@
+# tests/test_actors.py
+import threading, time
+from actors import ActorSystem
+
+
+def make(after=None):
+    return ActorSystem(spawn=None, after=after)
+
+
+def test_fifo_per_room_with_nested_tell():
+    log = []
+    actors = make()
+
+    def cmd(rid, name):
+        log.append((rid, name, "start"))
+        if name == "a1":
+            actors.tell(rid, cmd, rid, "a3")        # 命令中向同一房间投递：排在已入队的命令之后，不重入
+            actors.tell("B", cmd, "B", "b1")        # 其他房间：立即执行
+        log.append((rid, name, "end"))
+
+    actors.tell("A", cmd, "A", "a1")
+    actors.tell("A", cmd, "A", "a2")
+    assert [x for x in log if x[0] == "A"] == [("A", "a1", "start"), ("A", "a1", "end"), ("A", "a3", "start"),
+                                                 ("A", "a3", "end"), ("A", "a2", "start"), ("A", "a2", "end")]
+    assert ("B", "b1", "end") in log and log.index(("B", "b1", "end")) < log.index(("A", "a1", "end"))
+    assert actors.stats("A")["processed"] == 3 and actors.depth("A") == 0
+
+
+def test_after_called_once_per_command():
+    calls = []
+    actors = make(after=calls.append)
+    for _ in range(3): actors.tell("A", lambda: None)
+    actors.tell("B", lambda: None)
+    actors.tell_readonly("A", lambda: None)            # 只读命令不调用 after
+    actors.tell(None, lambda: None)                     # 没有房间号的命令也不调用
+    assert calls == ["A", "A", "A", "B"]
+
+
+def test_errors_are_isolated():
+    done, calls = [], []
+
+    def boom(): raise RuntimeError("boom")
+
+    def bad_after(rid):
+        calls.append(rid)
+        if rid == "B": raise RuntimeError("after")
+    actors = make(after=bad_after)
+    actors.tell("A", boom)
+    actors.tell("A", done.append, 1)
+    actors.tell("B", done.append, 2)
+    actors.tell("B", done.append, 3)
+    assert done == [1, 2, 3]                            # 出错的命令之后继续执行同一房间的命令
+    assert calls == ["A", "A", "B", "B"]                # 出错的命令之后仍调用 after
+    assert actors.stats("A")["errors"] == 1 and actors.stats("B")["errors"] == 0
+    assert actors.stats()["errors"] == 1 and actors.stats()["processed"] == 4
+
+
+def test_consumer_thread_keeps_order_and_retires():
+    actors = ActorSystem(spawn=lambda fn, *args: threading.Thread(target=fn, args=args, daemon=True).start(),
+                         idle_timeout=0.05)
+    seen = []
+    for i in range(200): actors.tell("A", seen.append, i)
+    deadline = time.monotonic() + 5
+    while actors.stats()["actors"] and time.monotonic() < deadline: time.sleep(0.01)
+    assert seen == list(range(200))
+    assert actors.stats()["actors"] == 0 and actors.stats()["processed"] == 200     # 空闲后退出，计数并入 retired
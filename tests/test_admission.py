@@ -0,0 +1,89 @@
+# tests/test_admission.py
+import pytest
+from admission import AdmissionController, LagMonitor, CRITICAL, NORMAL, LOW
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+POLICY = {'attack': (CRITICAL, 2, 4), 'move': (NORMAL, 10, 3), 'chat': (LOW, 1, 2)}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make(clock, lag=0.0, **kw):
+    state = {"lag": lag}
+    ctl = AdmissionController(POLICY, lag=lambda: state["lag"], clock=clock, **kw)
+    return ctl, state
+
+
+def test_burst_then_limited(clock):
+    ctl, _ = make(clock)
+    assert [ctl.check("s1", 'attack') for _ in range(6)] == [("ok", False)] * 4 + [("limited", True), ("limited", False)]
+    assert ctl.decisions[('attack', 'ok')] == 4 and ctl.decisions[('attack', 'limited')] == 2
+
+
+def test_refill_at_rate_up_to_burst(clock):
+    ctl, _ = make(clock)
+    for _ in range(4): ctl.check("s1", 'attack')
+    clock.now += 0.25                                       # 2/s -> 0.5 个令牌
+    assert ctl.check("s1", 'attack')[0] == "limited"
+    clock.now += 0.25
+    assert ctl.check("s1", 'attack') == ("ok", False)       # 放行后重新开始计连续拒绝
+    assert ctl.check("s1", 'attack') == ("limited", True)
+    clock.now += 60                                         # 补满也不超过 burst
+    assert [ctl.check("s1", 'attack')[0] for _ in range(5)] == ["ok"] * 4 + ["limited"]
+
+
+def test_buckets_are_per_sid_and_event(clock):
+    ctl, _ = make(clock)
+    for _ in range(4): ctl.check("s1", 'attack')
+    assert ctl.check("s1", 'attack')[0] == "limited"
+    assert ctl.check("s2", 'attack')[0] == "ok"
+    assert ctl.check("s1", 'move')[0] == "ok"
+    assert ctl.check("s1", 'other')[0] == "ok"              # 未列出的事件使用 default
+    ctl.drop("s1")
+    assert ctl.check("s1", 'attack')[0] == "ok"             # 断开后重新计数
+    assert ctl.stats()["clients"] == 2
+
+
+def test_shedding_by_lag(clock):
+    ctl, lag = make(clock, shed_low=0.05, shed_normal=0.2)
+    assert [ctl.check("s1", e)[0] for e in ('chat', 'move', 'attack')] == ["ok"] * 3
+    lag["lag"] = 0.05
+    assert [ctl.check("s1", e)[0] for e in ('chat', 'move', 'attack')] == ["shed", "ok", "ok"]
+    assert ctl.stats()["shedding"] == "low"
+    lag["lag"] = 0.5
+    assert [ctl.check("s1", e)[0] for e in ('chat', 'move', 'attack')] == ["shed", "shed", "ok"]
+    assert ctl.stats()["shedding"] == "normal"
+    lag["lag"] = 0.0
+    assert ctl.check("s1", 'chat') == ("ok", False)        # 被丢弃的事件不消耗令牌 (burst 2，只放行过 1 次)
+    assert ctl.check("s1", 'chat')[0] == "limited"
+    assert ctl.stats()["shedding"] is None
+
+
+def test_disabled_admits_everything(clock):
+    ctl, _ = make(clock, lag=1.0, enabled=False)
+    assert all(ctl.check("s1", 'chat') == ("ok", False) for _ in range(10))
+
+
+def test_lag_monitor(clock):
+    delays, seen = [0.0, 0.3, 0.0, 0.0], []
+
+    def sleep(t):
+        seen.append(monitor.lag)                            # 上一轮结束后的 lag
+        clock.now += t + delays.pop(0)                      # 比预期晚醒来 delay 秒
+        if not delays: monitor.stop()
+    monitor = LagMonitor(sleep=sleep, interval=0.1, alpha=0.5, clock=clock)
+    monitor.run()
+    assert seen == [0.0, 0.0, pytest.approx(0.3), pytest.approx(0.075)]    # 突发的长阻塞立即生效
+    assert monitor.max == pytest.approx(0.3) and monitor.last == 0.0
+    assert monitor.lag == monitor.avg == pytest.approx(0.0375)             # 恢复时按指数滑动平均下降
@@ -0,0 +1,65 @@
+# tests/test_backends.py
+import json
+import pytest
+from backends import RedisBackend, shard_for
+from game_logic import BoxSet, Match
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_room(rid, players=("a", "b"), state="LOBBY"):
+    return {"id": rid, "players": list(players), "ready": {p: False for p in players}, "owner": players[0],
+            "state": state, "scores": {p: 10000 for p in players}, "matches": {}, "bye_player": None,
+            "game_id": None, "history": [], "summary_confirms": []}
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def test_save_room_writes_room_and_summary(client):
+    backend = RedisBackend(client, prefix='t:')
+    room = make_room("R1", state="GAME")
+    match = room["matches"]["m1"] = Match("m1", "a", "b")
+    match.game_data.boxes = BoxSet([1] * 22, [0] * 22)
+    backend.save_room("R1", room)
+    stored = json.loads(client.hget('t:rooms', 'R1'))
+    assert stored["players"] == ["a", "b"]
+    assert stored["matches"]["m1"]["game_data"]["boxes"][0] == {"c10": 1, "c100": 0, "taken": False}     # 对局经 to_wire 转成纯数据
+    assert json.loads(client.hget('t:lobby', 'R1')) == {"id": "R1", "owner": "a", "count": 2, "state": "GAME"}
+
+
+def test_save_room_skips_unchanged(client):
+    backend = RedisBackend(client, prefix='t:')
+    room = make_room("R1")
+    backend.save_room("R1", room)
+    client.hdel('t:rooms', 'R1')
+    backend.save_room("R1", room)           # 内容未变：不再写入
+    assert client.hget('t:rooms', 'R1') is None
+    room["players"].append("c")
+    backend.save_room("R1", room)
+    assert json.loads(client.hget('t:rooms', 'R1'))["players"] == ["a", "b", "c"]
+
+
+def test_delete_room(client):
+    backend = RedisBackend(client, prefix='t:')
+    backend.save_room("R1", make_room("R1"))
+    backend.save_room("R2", make_room("R2"))
+    backend.delete_room("R1")
+    assert client.hget('t:rooms', 'R1') is None and client.hget('t:lobby', 'R1') is None
+    assert client.hget('t:rooms', 'R2') is not None
+    # 其他进程写入、本进程从未保存过的房间也能删除
+    RedisBackend(client, prefix='t:').delete_room("R2")
+    assert client.hget('t:lobby', 'R2') is None
+
+
+def test_remote_lobby_excludes_own_shard(client):
+    rids = [f"R{i}" for i in range(20)]
+    shards = [RedisBackend(client, prefix='t:', owns=lambda rid, k=k: shard_for(rid, 2) == k) for k in range(2)]
+    for rid in rids: shards[shard_for(rid, 2)].save_room(rid, make_room(rid))
+    for k, backend in enumerate(shards):
+        remote = {item["id"] for item in backend.remote_lobby()}
+        assert remote == {rid for rid in rids if shard_for(rid, 2) != k}
+    shards[shard_for("R3", 2)].delete_room("R3")
+    assert "R3" not in {item["id"] for b in shards for item in b.remote_lobby()}
@@ -0,0 +1,59 @@
+# tests/test_codec.py
+import pytest
+from codec import BOXES, LIST, MAGIC, PUBLIC_BOXES, pack, unpack
+from game_logic import BoxSet, Match, calculate_grade
+
+
+def make_match():
+    match = Match("m1", "玩家甲", "bot_2")
+    gd = match.game_data
+    gd.step, gd.rule, gd.strategy, gd.deadline = "ATTACKING", 3, 4, 1760000000.25
+    gd.boxes = BoxSet([i % 7 for i in range(22)], [i % 3 for i in range(22)])
+    gd.boxes.take(5)
+    gd.public_boxes = [{"id": i, "grade": calculate_grade(gd.boxes.c10[i] + gd.boxes.c100[i]), "revealed": i in (2, 5),
+                        "real_c10": gd.boxes.c10[i] if i == 2 else 0, "real_c100": 0, "taken": i == 5} for i in range(22)]
+    gd.attempts, gd.guesses = 1, [2, 5]
+    gd.s4 = {"stage": 2, "target_x": 5, "target_y": 20, "wins": {"attacker": True, "defender": False}}
+    return match
+
+
+def test_game_update_round_trip():
+    match = make_match()
+    payload = {"rev": 17, "view": {"match_data": match.to_wire(with_boxes=True), "role": "defender", "round_deadline": None,
+                                   "scores": {"玩家甲": 9220, "bot_2": 10780, "负分": -350}, "match_list": [match.to_wire(False)]}}
+    data = pack(payload)
+    assert data[0] == MAGIC
+    assert bytes([PUBLIC_BOXES, 22]) in data and bytes([BOXES, 22]) in data      # 两种盒子列表都按位打包
+    assert unpack(data) == payload
+
+
+def test_room_sync_round_trip():
+    match = make_match()
+    room = {"id": "房间-1", "players": ["玩家甲", "bot_2", "u3"], "ready": {"玩家甲": True, "bot_2": False, "u3": False},
+            "owner": "玩家甲", "state": "GAME", "scores": {"玩家甲": 10000, "bot_2": 10000, "u3": 10000},
+            "matches": {"m1": match.to_wire(with_boxes=False)}, "bye_player": "u3", "game_id": "00ab12cd34ef",
+            "summary_confirms": [], "is_spectator": False}
+    assert unpack(pack(room)) == room
+
+
+@pytest.mark.parametrize("value", [0, 127, 128, -1, -(1 << 40), (1 << 53) - 1, 1 << 60, 0.5, -1e-9, 1e300,
+                                   "", "x" * 300, "混合 text ✓", [], {}, [None, True, False], {"a": [{"b": [1, [2]]}]}])
+def test_scalar_round_trip(value):
+    assert unpack(pack(value)) == value
+
+
+def test_irregular_boxes_fall_back():
+    # 金额超出一个字节 / id 与下标不符：退回通用编码，内容不变
+    boxes = [{"c10": 300, "c100": 0, "taken": False}]
+    public = [{"id": 1, "grade": calculate_grade(0), "revealed": False, "real_c10": 0, "real_c100": 0, "taken": False}]
+    for value in (boxes, public):
+        data = pack(value)
+        assert data[2:4] == bytes([0, LIST])      # 本帧没有新字符串，值的首字节是通用列表
+        assert unpack(data) == value
+    public[0]["id"], public[0]["grade"] = 0, "未知"
+    assert unpack(pack(public)) == public
+
+
+def test_unpack_rejects_other_frames():
+    with pytest.raises(ValueError):
+        unpack(b'{"rev":1}')
@@ -0,0 +1,85 @@
+# tests/test_deployments.py
+import itertools, random
+import numpy as np
+import pytest
+from deployments import count_deployments, explain, iter_layouts, validate_defense_batch
+from game_logic import BOX_COUNT, validate_defense
+
+RULE1 = [(10 + i, 0) for i in range(BOX_COUNT)]                         # 100 ~ 310，公差 10
+RULE2 = [(0, 10)] + [(10, 0)] * (BOX_COUNT - 1)                          # 3100
+RULE3 = [(i + 1, 5 if i == 7 else 0) for i in range(BOX_COUNT)]         # 3030
+
+
+def edit(boxes, **changes):
+    out = list(boxes)
+    for i, box in changes.items(): out[int(i[1:])] = box
+    return out
+
+
+CASES = [
+    (1, RULE1, 10000), (2, RULE2, 10000), (3, RULE3, 10000),
+    (1, RULE1[::-1], 10000),                                            # 顺序无关
+    (1, edit(RULE1, b3=(-1, 0)), 10000),
+    (1, edit(RULE1, b3=(0, 0), b5=(-1, 0)), 10000),                    # 空盒在负数之前
+    (1, edit(RULE1, b3=(-1, 0), b5=(0, 0)), 10000),
+    (1, edit(RULE1, b0=(0, -2), b1=(0, 0)), 10000),
+    (1, [(1, 0)] * BOX_COUNT, 10000),                                   # 总额不足
+    (1, RULE1, 4509), (1, RULE1, 4510), (1, RULE1, 0),                  # 余额边界
+    (1, edit(RULE1, b21=(32, 0)), 10000),
+    (1, [(0, 2)] * BOX_COUNT, 10000),                                   # 公差为 0
+    (1, edit(RULE1, b10=(0, 2)), 10000),                                # 金额相同、面值不同
+    (2, edit(RULE2, b4=(11, 0)), 10000),
+    (2, edit(RULE2, b4=(5, 5)), 10000),
+    (2, edit(RULE2, b4=(0, 10)), 10000),
+    (2, [(10, 0)] * BOX_COUNT, 10000),
+    (2, [(0, 10)] * BOX_COUNT, 10000),
+    (2, RULE2, 3099),
+    (3, edit(RULE3, b0=(2, 0)), 10000),                                 # 重复
+    (3, [(i + 2, 0) for i in range(BOX_COUNT)], 10000),                 # 2~23，总额不足
+    (3, [(i + 2, 5 if i == 7 else 0) for i in range(BOX_COUNT)], 10000),    # 2~23
+    (3, [(i, 5 if i == 7 else 0) for i in range(BOX_COUNT)], 10000),    # 含 0 张 10 元的盒子
+    (3, RULE3, 3029),
+    (4, RULE1, 10000), (0, RULE1, 10000),
+]
+
+
+def scalar(rule_id, boxes, balance):
+    return validate_defense(rule_id, [{'c10': a, 'c100': b} for a, b in boxes], balance)
+
+
+@pytest.mark.parametrize("rule_id, boxes, balance", CASES)
+def test_batch_matches_scalar(rule_id, boxes, balance):
+    ok, msg = scalar(rule_id, boxes, balance)
+    codes = validate_defense_batch(rule_id, [boxes], balance)
+    assert explain(codes) == [msg] and (codes[0] == 0) == ok
+
+
+def test_wrong_box_count():
+    for boxes in (RULE1[:-1], RULE1 + [(1, 0)]):
+        assert explain(validate_defense_batch(1, [boxes], 10000)) == [scalar(1, boxes, 10000)[1]]
+
+
+@pytest.mark.parametrize("rule_id", [1, 2, 3])
+def test_batch_matches_scalar_random(rule_id):
+    rng = random.Random(rule_id)
+    base = {1: RULE1, 2: RULE2, 3: RULE3}[rule_id]
+    batch, balances = [], []
+    for _ in range(500):
+        boxes = list(base)
+        rng.shuffle(boxes)
+        for _ in range(rng.randrange(3)):
+            boxes[rng.randrange(BOX_COUNT)] = (rng.randint(-1, 23), rng.choice((-1, 0, 0, 1, 5, 10)))
+        batch.append(boxes)
+        balances.append(rng.choice((0, 3000, 3100, 4510, 10000)))
+    codes = validate_defense_batch(rule_id, batch, np.array(balances))
+    assert explain(codes) == [scalar(rule_id, b, bal)[1] for b, bal in zip(batch, balances)]
+    assert len(set(codes.tolist())) > 2          # 覆盖了多种结果
+
+
+@pytest.mark.parametrize("rule_id, balance, checked", [(1, 3180, None), (2, 3500, None), (3, 3030, 2000)])
+def test_count_matches_enumeration(rule_id, balance, checked):
+    layouts = list(iter_layouts(rule_id, balance))
+    assert count_deployments(rule_id, balance) == (len(layouts), sum(m for _, m in layouts))
+    assert layouts and len(set(l for l, _ in layouts)) == len(layouts)
+    sample = [l for l, _ in itertools.islice(layouts, checked)]
+    assert not validate_defense_batch(rule_id, sample, balance).any()     # 枚举出的规范形式都合法
@@ -0,0 +1,54 @@
+# tests/test_game_logic.py
+import random
+import pytest
+from game_logic import BoxSet
+
+
+def untaken(boxes, c10, c100):
+    return sum(a * 10 + b * 100 for i, (a, b) in enumerate(zip(c10, c100)) if not boxes.is_taken(i))
+
+
+def test_refund_tracks_takes():
+    rng = random.Random(11)
+    c10 = [rng.randint(0, 30) for _ in range(22)]
+    c100 = [rng.randint(0, 5) for _ in range(22)]
+    boxes = BoxSet(c10, c100)
+    assert boxes.total() == boxes.refund() == untaken(boxes, c10, c100)
+    for i in [3, 7, 3, 0, 21, 7, 12]:                       # 重复取同一个盒子
+        before, expected = boxes.refund(), 0 if boxes.is_taken(i) else c10[i] * 10 + c100[i] * 100
+        assert boxes.take(i) == expected
+        assert boxes.refund() == before - expected == untaken(boxes, c10, c100)
+        assert boxes.value(i) == 0 and boxes.take(i) == 0
+    assert boxes.total() == sum(a * 10 + b * 100 for a, b in zip(c10, c100))      # 部署总额不变
+
+
+@pytest.mark.parametrize("i", [-1, 22, 100])
+def test_take_out_of_range(i):
+    boxes = BoxSet([1] * 22, [0] * 22)
+    with pytest.raises(IndexError):
+        boxes.take(i)
+    assert boxes.refund() == 220 and boxes.taken == 0
+
+
+def test_wire_round_trip_with_taken():
+    boxes = BoxSet([i + 1 for i in range(22)], [i % 3 for i in range(22)])
+    for i in (0, 5, 21): boxes.take(i)
+    wire = boxes.to_wire()
+    assert [b["taken"] for b in wire].count(True) == 3 and wire[5] == {"c10": 0, "c100": 0, "taken": True}
+    again = BoxSet.from_wire(wire)
+    assert again.to_wire() == wire
+    assert again.taken == boxes.taken and again.refund() == boxes.refund()
+    assert again.total() == boxes.refund()                  # 取走的盒子金额已清零，恢复后的总额即剩余金额
+
+
+def test_from_wire_taken_flags_exclude_amounts():
+    wire = [{"c10": 10, "c100": 1, "taken": i % 2 == 0} for i in range(22)]
+    boxes = BoxSet.from_wire(wire)
+    assert boxes.total() == 22 * 200 and boxes.refund() == 11 * 200
+    assert boxes.take(0) == 0 and boxes.take(1) == 200 and boxes.refund() == 10 * 200
+
+
+def test_from_wire_rejects_bad_boxes():
+    for bad in ([{"c10": 1}], [{"c10": "x", "c100": 0}], [None], [{"c10": 1, "c100": 0}] * 2 + [{"c10": 2 ** 40, "c100": 0}]):
+        with pytest.raises(ValueError):
+            BoxSet.from_wire(bad)
@@ -0,0 +1,44 @@
+# tests/test_lobby.py
+from lobby import LobbyIndex
+
+
+def room(rid, players, state="LOBBY"):
+    return {"id": rid, "owner": players[0], "players": list(players), "state": state}
+
+
+def make_index():
+    return LobbyIndex(emit=None, sleep=None)
+
+
+def test_flush_routes_changes_by_filter():
+    lobby = make_index()
+    lobby.update("A", room("A", ["a"]))
+    lobby.update("G", room("G", ["b", "c"], state="GAME"))
+    out = lobby.flush([(None, 0), ("LOBBY", 0), ("GAME", 0), (None, 10)])
+    assert [r["id"] for r in out[(None, 0)]["add"]] == ["A", "G"]
+    assert [r["id"] for r in out[("LOBBY", 0)]["add"]] == ["A"]
+    assert [r["id"] for r in out[("GAME", 0)]["add"]] == ["G"]
+    assert (None, 10) not in out                  # 没有满足条件的房间，不发送
+
+
+def test_flush_turns_leaving_filter_into_remove():
+    lobby = make_index()
+    lobby.update("A", room("A", ["a"]))
+    lobby.flush()
+    lobby.update("A", room("A", ["a", "b"], state="GAME"))
+    out = lobby.flush([(None, 0), ("LOBBY", 0), ("GAME", 0)])
+    assert [r["count"] for r in out[(None, 0)]["update"]] == [2]
+    assert out[("LOBBY", 0)]["remove"] == ["A"] and not out[("LOBBY", 0)]["update"]
+    assert [r["id"] for r in out[("GAME", 0)]["add"]] == ["A"]
+
+
+def test_flush_coalesces_within_tick():
+    lobby = make_index()
+    lobby.update("A", room("A", ["a"]))
+    lobby.remove("A")                              # 同一 tick 内新建又删除
+    lobby.update("B", room("B", ["b"]))
+    lobby.flush()
+    lobby.update("B", room("B", ["b", "c"]))
+    lobby.update("B", room("B", ["b"]))            # 改回原样
+    assert lobby.flush() == {}
+    assert lobby.coalesced == 2
@@ -0,0 +1,56 @@
+# tests/test_records.py
+import os
+from records import ChatLog, GameRecordLog, iter_records, segments
+
+DAY = 1760000000.0          # 2025-10-09 (UTC)
+
+
+def seqs(page):
+    items, more = page
+    return [m["seq"] for m in items], more
+
+
+def test_chat_page_across_wrap():
+    chat = ChatLog(5)
+    for i in range(12): chat.append({"user": "u", "msg": str(i)})
+    assert len(chat) == 5 and chat.seq == 12                # 只剩 8 ~ 12
+    assert seqs(chat.page(limit=3)) == ([10, 11, 12], True)
+    assert seqs(chat.page(before=10, limit=3)) == ([8, 9], False)
+    assert seqs(chat.page(before=8)) == ([], False)
+    assert seqs(chat.page(before=3)) == ([], False)         # 早于缓冲区的游标
+    assert seqs(chat.page(before=100, limit=2)) == ([11, 12], True)
+    assert seqs(chat.page(limit=50)) == ([8, 9, 10, 11, 12], False)
+    assert chat.page(before=12, limit=1)[0][0]["msg"] == "10"
+
+
+def test_chat_page_empty():
+    assert ChatLog(5).page() == ([], False)
+    assert ChatLog(5).page(before=1) == ([], False)
+
+
+def test_append_rotate_iterate(tmp_path):
+    now = [DAY]
+    log = GameRecordLog(str(tmp_path), max_bytes=300, clock=lambda: now[0])
+    for i in range(40): log.append({"type": "round", "room": f"R{i % 3}", "game": "g1", "n": i, "text": "回合" * 5})
+    now[0] += 86400
+    log.append({"type": "summary", "room": "R0", "game": "g1", "n": 40})
+    files = segments(str(tmp_path))
+    assert len(files) > 2 and files[-1].endswith("-000.jsonl.gz")      # 按大小分段，跨天从 000 重新编号
+    assert len({os.path.basename(f).split("-")[1] for f in files}) == 2
+    # 正在写的分段没有 gzip 尾部，已写入的记录也能读到
+    assert [r["n"] for r in iter_records(str(tmp_path))] == list(range(41))
+    log.close()
+    assert [r["n"] for r in iter_records(str(tmp_path), room="R1")] == list(range(1, 40, 3))
+    assert [r["n"] for r in iter_records(str(tmp_path), type="summary")] == [40]
+    assert [r["ts"] for r in iter_records(files[-1])] == [DAY + 86400]
+    assert log.records == 41
+
+
+def test_iterate_truncated_segment(tmp_path):
+    log = GameRecordLog(str(tmp_path), clock=lambda: DAY)
+    for i in range(200): log.append({"type": "round", "n": i, "pad": "x" * 40})
+    log.close()
+    path = segments(str(tmp_path))[0]
+    with open(path, 'r+b') as f: f.truncate(os.path.getsize(path) // 2)    # 意外退出：分段缺尾部
+    got = [r["n"] for r in iter_records(path)]
+    assert got == list(range(len(got))) and 0 < len(got) < 200
@@ -0,0 +1,27 @@
+# tests/test_registry.py
+from registry import Registry
+
+
+def test_spectator_leave_clears_indexes():
+    reg = Registry()
+    for uid in ("a", "b"): reg.enter_room(uid, "R")
+    reg.bind("sid1", "s"); reg.bind("sid2", "s")
+    reg.enter_room("s", "R", spectator=True)
+    reg.set_audience("s", "R:spectator")
+    assert set(reg.members("R")) == {"a", "b", "s"} and set(reg.spectators("R")) == {"s"}
+    assert reg.unbind("sid1") == "s" and reg.is_online("s")      # 还有一个标签页
+    reg.unbind("sid2")
+    assert not reg.is_online("s") and reg.room_of("s") == "R"    # 断开本身不改房间索引，由调用方决定是否离开
+    assert reg.leave_room("s") == "R"
+    assert set(reg.members("R")) == {"a", "b"} and not reg.spectators("R")
+    assert reg.audience_of("s") is None and not reg.audience_members("R:spectator")
+    assert list(reg.audience_sids("R")) == []
+
+
+def test_end_game_removes_spectators_only():
+    reg = Registry()
+    reg.enter_room("a", "R")
+    reg.enter_room("s", "R", spectator=True)
+    reg.set_match("a", "R", "m1")
+    reg.end_game("R")
+    assert set(reg.members("R")) == {"a"} and reg.room_of("s") is None and reg.match_of("a") is None
@@ -0,0 +1,100 @@
+# tests/test_snapshots.py
+import os
+import pytest
+from snapshots import RoomStore
+
+
+def record(rid, n):
+    return {"room": {"id": rid, "players": [f"p{i}" for i in range(n)], "state": "GAME"}, "timers": []}
+
+
+def crash(store):
+    """模拟进程崩溃：不写最终快照，直接丢下文件"""
+    store._wal.close()
+    store._close_map()
+
+
+def wal_files(directory):
+    return sorted(os.path.join(directory, n) for n in os.listdir(directory) if n.startswith('wal-'))
+
+
+def test_replay_skips_torn_tail(tmp_path):
+    store = RoomStore(str(tmp_path))
+    store.load()
+    for i in range(3): store.put(f"R{i}", record(f"R{i}", i + 1))
+    crash(store)
+    path = wal_files(tmp_path)[-1]
+    with open(path, 'r+b') as f: f.truncate(os.path.getsize(path) - 5)      # 最后一条记录只写了一半
+    restored = RoomStore(str(tmp_path))
+    assert restored.load() == {"R0": record("R0", 1), "R1": record("R1", 2)}
+    restored.put("R2", record("R2", 4))         # 之后的写入进入新段，不接在残缺的尾部之后
+    crash(restored)
+    assert RoomStore(str(tmp_path)).load() == {"R0": record("R0", 1), "R1": record("R1", 2), "R2": record("R2", 4)}
+
+
+def test_replay_skips_crc_bad_tail(tmp_path):
+    store = RoomStore(str(tmp_path))
+    store.load()
+    store.put("R0", record("R0", 1))
+    store.put("R0", record("R0", 2))
+    crash(store)
+    path = wal_files(tmp_path)[-1]
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    assert RoomStore(str(tmp_path)).load() == {"R0": record("R0", 1)}       # 校验失败的修改被丢弃，保留前一条
+
+
+def test_snapshot_then_torn_wal(tmp_path):
+    store = RoomStore(str(tmp_path))
+    store.load()
+    store.put("A", record("A", 1))
+    store.put("B", record("B", 2))
+    assert store.snapshot()
+    store.put("A", None)
+    store.put("C", record("C", 3))
+    crash(store)
+    path = wal_files(tmp_path)[-1]
+    with open(path, 'r+b') as f: f.truncate(os.path.getsize(path) - 1)
+    assert RoomStore(str(tmp_path)).load() == {"B": record("B", 2)}     # 删除 A 已写完整，新增 C 残缺
+
+
+def test_failed_snapshot_keeps_records(tmp_path, monkeypatch):
+    store = RoomStore(str(tmp_path))
+    store.load()
+    store.put("A", record("A", 1))
+    assert store.snapshot()
+    store.put("B", record("B", 2))
+    def disk_full(*args): raise OSError("disk full")
+    monkeypatch.setattr(os, 'replace', disk_full)
+    with pytest.raises(OSError): store.snapshot()
+    monkeypatch.undo()
+    assert store.stats()["dirty"] == 1
+    assert store.snapshot()                     # 下次快照重试成功
+    crash(store)
+    assert RoomStore(str(tmp_path)).load() == {"A": record("A", 1), "B": record("B", 2)}
+
+
+def test_file_io_goes_through_offload(tmp_path):
+    import threading
+    calls = []
+
+    def offload(fn, *args):
+        # 与 eventlet.tpool.execute 一样在另一个 OS 线程中执行并等待结果
+        out = []
+        t = threading.Thread(target=lambda: out.append(fn(*args)))
+        t.start(); t.join()
+        calls.append(getattr(fn, '__name__', fn))
+        return out[0] if out else None
+
+    store = RoomStore(str(tmp_path), offload=offload)
+    store.load()
+    store.put("A", record("A", 1))
+    store.sync()
+    assert store.snapshot()
+    assert calls == ["fsync", "_write_snapshot"]
+    store.close()
+    assert calls == ["fsync", "_write_snapshot"]      # 退出时直接在当前线程写出
+    assert RoomStore(str(tmp_path)).load() == {"A": record("A", 1)}
@@ -0,0 +1,49 @@
+# tests/test_state_channel.py
+import copy, json
+import pytest
+from state_channel import StateChannel, apply_patch, diff
+
+BASE = {"rev": 1, "scores": {"a": 10000, "b": 10000},
+        "match_data": {"id": "m1", "round": 1, "game_data": {"step": "SETUP", "hold": False, "guesses": [1, 2],
+                                                             "public_boxes": [{"id": i, "revealed": False} for i in range(3)]}}}
+
+
+def changed(fn):
+    new = copy.deepcopy(BASE)
+    fn(new)
+    return new
+
+
+@pytest.mark.parametrize("new", [
+    copy.deepcopy(BASE),
+    changed(lambda d: d["scores"].update(a=9220, b=10780)),
+    changed(lambda d: d["match_data"]["game_data"]["public_boxes"][2].update(revealed=True)),
+    changed(lambda d: d["match_data"]["game_data"].update(step="ATTACKING", s4={"stage": 1})),     # 新增键
+    changed(lambda d: d["match_data"]["game_data"].pop("guesses")),                              # 删除键
+    changed(lambda d: d["match_data"]["game_data"]["guesses"].append(3)),                        # 列表变长：整体替换
+    changed(lambda d: d.update(match_data=None)),
+    {"rev": 2},
+])
+def test_apply_patch_reproduces_new(new):
+    old = copy.deepcopy(BASE)
+    ops = diff(old, new)
+    assert apply_patch(copy.deepcopy(old), json.loads(json.dumps(ops))) == new     # 差量经 JSON 往返后仍然有效
+    assert (ops == []) == (old == new)
+
+
+def test_diff_at_root():
+    assert apply_patch([1, 2], diff([1, 2], [1, 2, 3])) == [1, 2, 3]
+    assert apply_patch({"a": 1}, diff({"a": 1}, 5)) == 5
+
+
+def test_publish_chains_patches():
+    channel, client = StateChannel(), None
+    for i, view in enumerate([BASE, changed(lambda d: d["scores"].update(a=1)), changed(lambda d: d.pop("scores"))]):
+        channel.bump()
+        base, rev, ops = channel.publish("p1", view)
+        if ops is None: client = json.loads(json.dumps(view))
+        else:
+            assert base == i
+            client = apply_patch(client, ops)
+        assert client == view and rev == i + 1
+    assert json.loads(channel.snapshot("p1")) == {"rev": 3, "view": client}
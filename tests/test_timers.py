@@ -0,0 +1,101 @@
+# tests/test_timers.py
+import pytest
+from timers import TimerService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fired():
+    return []
+
+
+@pytest.fixture
+def timers(clock):
+    return TimerService(clock=clock)
+
+
+def on_deadline(out, name):
+    out.append(name)
+
+
+def test_fire_due_in_deadline_order(timers, clock, fired):
+    timers.schedule(("R1", "c"), 3, on_deadline, fired, "c")
+    timers.schedule(("R2", "a"), 1, on_deadline, fired, "a")
+    timers.schedule(("R1", "b"), 2, on_deadline, fired, "b")
+    timers.schedule(("R1", "b2"), 2, on_deadline, fired, "b2")     # 同一时刻按调度顺序
+    assert timers.fire_due() == pytest.approx(1) and fired == []
+    clock.now += 2
+    assert timers.fire_due() == pytest.approx(1)                   # 返回距下一个到期的秒数
+    assert fired == ["a", "b", "b2"]
+    clock.now += 5
+    assert timers.fire_due() is None and fired == ["a", "b", "b2", "c"]
+    assert timers.fired == 4 and timers.late_max == pytest.approx(4)
+    assert timers.backlog() == 0 and timers.next_deadline() is None
+
+
+def test_reschedule_replaces(timers, clock, fired):
+    key = ("R1", "match", "m1")
+    timers.schedule(key, 1, on_deadline, fired, "old")
+    assert timers.schedule(key, 5, on_deadline, fired, "new") == clock.now + 5
+    assert timers.backlog() == 1 and timers.deadline_of(key) == clock.now + 5
+    clock.now += 2
+    timers.fire_due()
+    assert fired == []                                             # 旧的到期时间作废
+    assert timers.next_deadline() == clock.now + 3
+    clock.now += 3
+    timers.fire_due()
+    assert fired == ["new"] and timers.deadline_of(key) is None
+
+
+def test_cancel_prevents_fire(timers, clock, fired):
+    timers.schedule(("R1", "a"), 1, on_deadline, fired, "a")
+    timers.schedule(("R1", "b"), 1, on_deadline, fired, "b")
+    timers.schedule(("R2", "c"), 1, on_deadline, fired, "c")
+    assert timers.cancel(("R1", "a")) and not timers.cancel(("R1", "a"))
+    timers.cancel_room("R1")
+    assert timers.pending_timers("R1") == [] and timers.export("R1") == []
+    clock.now += 1
+    timers.fire_due()
+    assert fired == ["c"] and timers.cancelled == 2
+    assert timers.stats()["heap"] == 0                             # 作废的堆条目已丢弃
+
+
+def test_export_contents(timers, clock, fired):
+    timers.schedule(("R1", "reset"), 30, on_deadline, fired, "reset")
+    timers.schedule(("R1", "match", "m1"), 10, on_deadline, fired, "m1")
+    timers.schedule(("R1", "match", "m1"), 20, on_deadline, fired, "m1'")
+    timers.schedule(("R2", "reset"), 5, on_deadline, fired, "other")
+    assert timers.export("R1") == [(("R1", "match", "m1"), clock.now + 20, on_deadline, (fired, "m1'")),
+                                   (("R1", "reset"), clock.now + 30, on_deadline, (fired, "reset"))]
+    assert [t["remaining"] for t in timers.pending_timers("R1")] == [20, 30]
+    # 按导出的到期时间在另一个服务上恢复，触发顺序与时刻不变
+    restored = TimerService(clock=clock)
+    for key, deadline, fn, args in timers.export("R1"): restored.schedule_at(key, deadline, fn, *args)
+    clock.now += 25
+    restored.fire_due()
+    assert fired == ["m1'"] and restored.next_deadline() == clock.now + 5
+
+
+def test_spawn_and_errors(clock, fired):
+    spawned = []
+    timers = TimerService(spawn=lambda fn, *args: spawned.append((fn, args)), clock=clock)
+    timers.schedule(("R1", "a"), 0, on_deadline, fired, "a")
+    timers.fire_due()
+    assert spawned == [(on_deadline, (fired, "a"))] and fired == []       # 回调交给 spawn 执行
+    inline = TimerService(clock=clock)
+    inline.schedule(("R1", "x"), 0, lambda: 1 / 0)
+    inline.schedule(("R1", "y"), 0, on_deadline, fired, "y")
+    inline.fire_due()
+    assert fired == ["y"]                                          # 一个回调出错不影响其余
@@ -0,0 +1,38 @@
+# tests/test_workers.py
+import os
+import pytest
+from workers import PoolSaturated, WorkerPool
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(workers=1, max_pending=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_run_in_worker(pool):
+    assert pool.run(pow, 2, 10) == 1024
+    with pytest.raises(ZeroDivisionError):
+        pool.run(divmod, 1, 0)                              # 任务中的异常原样抛回
+    assert pool.stats()["pending"] == 0
+
+
+def test_crashed_worker_is_reaped_and_replaced(pool):
+    pool.run(abs, -1)
+    old = pool._idle.queue[0]
+    with pytest.raises(EOFError):
+        pool.run(os._exit, 3)                               # 子进程意外退出
+    assert old.tasks.closed and old.results.closed
+    with pytest.raises(ChildProcessError):
+        os.waitpid(old.proc.pid, os.WNOHANG)                # 已回收，不是僵尸进程
+    assert pool._idle.queue[0] is not old
+    assert pool.run(abs, -5) == 5                           # 新进程接着处理任务
+
+
+def test_saturated_and_inline():
+    pool = WorkerPool(workers=1, max_pending=0)
+    with pytest.raises(PoolSaturated):
+        pool.run(abs, -1)
+    assert pool.stats()["rejected"] == 1
+    assert WorkerPool(workers=0).run(abs, -2) == 2          # workers=0 时在当前进程内执行
@@ -0,0 +1,162 @@
+# thumbnails.py
+import hashlib, io, os, threading
+from collections import OrderedDict
+from PIL import Image, features
+from werkzeug.security import safe_join
+
+# 输出格式 -> (扩展名, mimetype)
+FORMATS = {
+    'PNG': ('.png', 'image/png'), 'JPEG': ('.jpg', 'image/jpeg'),
+    'WEBP': ('.webp', 'image/webp'), 'AVIF': ('.avif', 'image/avif'),
+}
+EXT_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP', '.avif': 'AVIF'}
+
+
+def supported_formats():
+    """当前 Pillow 能编码的现代格式"""
+    out = []
+    if features.check('avif'): out.append('AVIF')
+    if features.check('webp'): out.append('WEBP')
+    return out
+
+
+def negotiate_format(accept_header, available=None):
+    """按 Accept 头挑选 AVIF > WEBP；都不接受时返回 None (保持原格式)"""
+    accept = (accept_header or '').lower()
+    for fmt in (available if available is not None else supported_formats()):
+        if FORMATS[fmt][1] in accept: return fmt
+    return None
+
+
+def render_thumbnail(src, dst, width, fmt):
+    """
+    在工作进程中执行：缩放 + 编码 + 原子落盘，返回是否生成了新文件
+    (只回传布尔值，图片字节不经过进程间管道)
+    原图不比目标宽且无需转码时返回 False，由调用方直接使用原文件
+    """
+    img = Image.open(src)
+    src_format = img.format if img.format else 'PNG'
+    fmt = fmt or src_format
+    if img.width <= width and fmt == src_format: return False
+    if img.width > width:
+        h_size = int(float(img.size[1]) * (width / float(img.size[0])))
+        img = img.resize((width, h_size), Image.Resampling.LANCZOS)
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L'): img = img.convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=85)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f: f.write(buf.getvalue())
+    os.replace(tmp, dst)
+    return True
+
+
+class Thumb:
+    """一张可直接下发的缩略图：磁盘路径 + (可选) 内存字节"""
+    __slots__ = ("path", "data", "etag", "mtime", "mimetype")
+
+    def __init__(self, path, data, etag, mtime, mimetype):
+        self.path, self.data, self.etag, self.mtime, self.mimetype = path, data, etag, mtime, mimetype
+
+
+class ThumbnailCache:
+    """
+    卡牌缩略图缓存
+    - 磁盘：每张卡按 (源文件 mtime, 目标宽度, 输出格式) 只渲染一次，之后作为静态文件下发
+    - 内存：已编码字节的 LRU，按总字节预算淘汰
+    - 渲染交给 WorkerPool 在子进程中完成；池满时 PoolSaturated 透传给调用方
+    """
+
+    def __init__(self, src_dir, cache_dir, width=250, max_bytes=16 * 1024 * 1024, pool=None):
+        self.src_dir, self.cache_dir = src_dir, cache_dir
+        self.width, self.max_bytes = width, max_bytes
+        self.pool = pool
+        self._lru = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def source_path(self, filename):
+        path = safe_join(self.src_dir, filename)
+        return path if path and os.path.isfile(path) else None
+
+    def _cache_name(self, filename, mtime_ns, width, fmt):
+        stem = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:16]
+        ext = FORMATS[fmt][0] if fmt else (os.path.splitext(filename)[1].lower() or '.png')
+        return stem, f"{stem}_{mtime_ns}_{width}{ext}"
+
+    def get(self, filename, width=None, fmt=None):
+        """返回 Thumb；源文件不存在时返回 None"""
+        src = self.source_path(filename)
+        if not src: return None
+        width = width or self.width
+        st = os.stat(src)
+        stem, name = self._cache_name(filename, st.st_mtime_ns, width, fmt)
+        key = (filename, st.st_mtime_ns, width, fmt)
+
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit: self._lru.move_to_end(key); return hit
+            # 同一张卡并发未命中时只渲染一次，其余请求等待同一结果
+            ev = self._inflight.get(key)
+            owner = ev is None
+            if owner: ev = self._inflight[key] = threading.Event()
+        if not owner:
+            ev.wait()
+            return self.get(filename, width, fmt)
+        try:
+            thumb = self._load_or_render(src, stem, name, st, width, fmt)
+            self._remember(key, thumb)
+            return thumb
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+            ev.set()
+
+    def _load_or_render(self, src, stem, name, st, width, fmt):
+        dst = os.path.join(self.cache_dir, name)
+        etag = hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]
+        ext = os.path.splitext(name)[1]
+        mimetype = FORMATS[EXT_FORMATS.get(ext, 'PNG')][1]
+        if os.path.isfile(dst):
+            with open(dst, 'rb') as f: data = f.read()
+            return Thumb(dst, data, etag, st.st_mtime, mimetype)
+
+        if self.pool: rendered = self.pool.run(render_thumbnail, src, dst, width, fmt)
+        else: rendered = render_thumbnail(src, dst, width, fmt)
+        if not rendered:
+            # 原图已经足够小：直接以原文件作为缓存结果
+            with open(src, 'rb') as f: data = f.read()
+            return Thumb(src, data, etag, st.st_mtime, mimetype)
+        with open(dst, 'rb') as f: data = f.read()
+
+        # 清理该卡旧 mtime 的同规格缓存
+        for old in os.listdir(self.cache_dir):
+            if old != name and old.startswith(stem + '_') and old.endswith(f"_{width}{ext}"):
+                try: os.remove(os.path.join(self.cache_dir, old))
+                except OSError: pass
+        return Thumb(dst, data, etag, st.st_mtime, mimetype)
+
+    def _remember(self, key, thumb):
+        size = len(thumb.data)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._lru: return
+            self._lru[key] = thumb
+            self._lru_bytes += size
+            while self._lru_bytes > self.max_bytes:
+                _, old = self._lru.popitem(last=False)
+                self._lru_bytes -= len(old.data)
+
+    def warm_up(self, pause=None, variants=None):
+        """启动时预渲染全部卡牌；pause 用于在两张卡之间让出事件循环"""
+        variants = variants or [(self.width, None)]
+        for filename in sorted(os.listdir(self.src_dir)):
+            if not filename.lower().endswith(tuple(EXT_FORMATS)): continue
+            for width, fmt in variants:
+                try: self.get(filename, width, fmt)
+                except Exception as e: print(f"Thumbnail warm-up error ({filename}): {e}")
+                if pause: pause(0)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._lru), "bytes": self._lru_bytes, "max_bytes": self.max_bytes}
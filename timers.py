@@ -0,0 +1,126 @@
+# timers.py
+import heapq, itertools, threading, time
+
+
+class _Timer:
+    __slots__ = ("key", "deadline", "fn", "args", "seq")
+
+    def __init__(self, key, deadline, fn, args, seq):
+        self.key, self.deadline, self.fn, self.args, self.seq = key, deadline, fn, args, seq
+
+
+class TimerService:
+    """
+    全局定时器：一个后台任务 + 最小堆，替代每个回合一个长时间 sleep 的 greenthread
+    - key 为元组，第一个元素是房间号，如 (rid, 'match', match_id)、(rid, 'reset')
+    - 对同一个 key 再次调度即为重新计时，旧的到期时间自动作废
+    - cancel / cancel_room 为真正取消；pending_timers(rid) 可查看房间内尚未触发的定时器
+    到期回调通过 spawn 在独立的短生命周期 greenthread 中执行，不阻塞调度循环
+    """
+
+    def __init__(self, spawn=None, clock=time.time, max_wait=1.0):
+        self.spawn, self.clock, self.max_wait = spawn, clock, max_wait
+        self._heap = []                 # (deadline, seq, key)，取消的条目惰性丢弃
+        self._timers = {}               # key -> _Timer
+        self._by_room = {}              # rid -> set(key)
+        self._seq = itertools.count()
+        self._wake = threading.Event()
+        self._running = False
+        self.fired = self.cancelled = 0
+        self.late_total = self.late_max = 0.0   # 触发时刻晚于到期时间的累计 / 最大秒数 (事件循环繁忙的信号)
+
+    def schedule_at(self, key, deadline, fn, *args):
+        self._drop(key)
+        t = _Timer(key, deadline, fn, args, next(self._seq))
+        self._timers[key] = t
+        self._by_room.setdefault(key[0], set()).add(key)
+        heapq.heappush(self._heap, (deadline, t.seq, key))
+        # 新定时器比当前最早的还早时唤醒循环重新计算等待时间
+        if self._heap[0][1] == t.seq: self._wake.set()
+        return deadline
+
+    def schedule(self, key, delay, fn, *args):
+        return self.schedule_at(key, self.clock() + delay, fn, *args)
+
+    def _drop(self, key):
+        t = self._timers.pop(key, None)
+        if t is None: return False
+        keys = self._by_room.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys: del self._by_room[key[0]]
+        return True
+
+    def cancel(self, key):
+        if self._drop(key):
+            self.cancelled += 1
+            return True
+        return False
+
+    def cancel_room(self, rid):
+        for key in list(self._by_room.get(rid, ())): self.cancel(key)
+
+    def deadline_of(self, key):
+        t = self._timers.get(key)
+        return t.deadline if t else None
+
+    def pending_timers(self, rid):
+        now = self.clock()
+        out = [{"key": t.key, "deadline": t.deadline, "remaining": max(0.0, t.deadline - now), "callback": t.fn.__name__}
+               for t in (self._timers[k] for k in self._by_room.get(rid, ()))]
+        return sorted(out, key=lambda x: x["deadline"])
+
+    def export(self, rid):
+        """房间内尚未触发的定时器 [(key, deadline, fn, args)]，持久化后可按原到期时间重新调度"""
+        return sorted(((t.key, t.deadline, t.fn, t.args) for t in (self._timers[k] for k in self._by_room.get(rid, ()))),
+                      key=lambda x: x[1])
+
+    def next_deadline(self):
+        """最早的未取消定时器的到期时间 (没有时返回 None)；顺带丢弃堆顶已作废的条目"""
+        heap = self._heap
+        while heap:
+            deadline, seq, key = heap[0]
+            t = self._timers.get(key)
+            if t is not None and t.seq == seq: return deadline
+            heapq.heappop(heap)
+        return None
+
+    def backlog(self):
+        return len(self._timers)
+
+    def stats(self):
+        return {"backlog": len(self._timers), "heap": len(self._heap), "fired": self.fired, "cancelled": self.cancelled,
+                "late_avg_ms": self.late_total / (self.fired or 1) * 1000, "late_max_ms": self.late_max * 1000}
+
+    def fire_due(self):
+        """触发所有已到期的定时器，返回距下一个到期的秒数 (没有时返回 None)"""
+        now = self.clock()
+        while self._heap:
+            deadline, seq, key = self._heap[0]
+            t = self._timers.get(key)
+            if t is None or t.seq != seq:
+                heapq.heappop(self._heap)       # 已取消或已重新调度
+                continue
+            if deadline > now: return deadline - now
+            heapq.heappop(self._heap)
+            self._drop(key)
+            self.fired += 1
+            late = now - deadline
+            self.late_total += late
+            if late > self.late_max: self.late_max = late
+            if self.spawn: self.spawn(t.fn, *t.args)
+            else:
+                try: t.fn(*t.args)
+                except Exception as e: print(f"Timer error {key}: {e}")
+        return None
+
+    def run(self):
+        self._running = True
+        while self._running:
+            wait = self.fire_due()
+            self._wake.wait(self.max_wait if wait is None else min(wait, self.max_wait))
+            self._wake.clear()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
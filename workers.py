@@ -0,0 +1,116 @@
+# workers.py
+import multiprocessing, os, queue, threading
+
+
+class PoolSaturated(Exception):
+    """排队任务已达上限，调用方应降级处理 (503 / 返回原图)"""
+
+
+def _worker_main(tasks, results):
+    """子进程主循环：逐个执行 (fn, args)，结果原样回传"""
+    while True:
+        try: msg = tasks.recv()
+        except (EOFError, OSError): break
+        if msg is None: break
+        fn, args = msg
+        try: results.send((True, fn(*args)))
+        except Exception as e: results.send((False, e))
+
+
+class _Worker:
+    __slots__ = ("proc", "tasks", "results")
+
+    def __init__(self, ctx):
+        # 两条单向管道 (os.pipe)，不用双向 Pipe()：它是 socketpair，monkey_patch 后被设为非阻塞，
+        # 该标志与子进程共享，子进程空闲等待下一个任务时 recv 会直接抛 EAGAIN 退出
+        task_out, self.tasks = ctx.Pipe(duplex=False)
+        self.results, result_in = ctx.Pipe(duplex=False)
+        self.proc = ctx.Process(target=_worker_main, args=(task_out, result_in), daemon=True)
+        self.proc.start()
+        task_out.close(); result_in.close()
+
+    def close(self, timeout=1.0):
+        """关闭管道并回收子进程 (仍在运行时先 terminate)，不留僵尸进程与文件描述符"""
+        self.tasks.close(); self.results.close()
+        self.proc.join(0)
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(timeout)
+
+
+class WorkerPool:
+    """
+    CPU 密集任务的进程池 (图片缩放等)
+    - 任务在独立进程中执行，不占用 eventlet 主循环的 GIL
+    - 每个子进程同一时刻只被一个 greenthread 借出，管道读写不会交错
+      (标准库 ProcessPoolExecutor 的内部线程在 monkey_patch 后并发提交会冲突)
+    - 排队 + 执行中的任务数有上限，超出时直接抛 PoolSaturated (背压)
+    - workers=0 时退化为在当前进程内同步执行，便于调试
+    """
+
+    def __init__(self, workers=2, max_pending=8, context='spawn'):
+        self.workers, self.max_pending = workers, max_pending
+        self._ctx = multiprocessing.get_context(context)
+        self._idle = queue.Queue()
+        self._started = False
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.submitted = self.rejected = 0
+
+    def _start(self):
+        # 延迟启动：只导入 app 的工具脚本不会拉起子进程
+        with self._lock:
+            if self._started: return
+            self._started = True
+        for _ in range(self.workers): self._idle.put(_Worker(self._ctx))
+
+    def _acquire_slot(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolSaturated()
+            self._pending += 1
+            self.submitted += 1
+
+    def run(self, fn, *args):
+        """在子进程中执行 fn(*args) 并返回结果；等待期间只挂起当前 greenthread"""
+        if self.workers <= 0: return fn(*args)
+        self._acquire_slot()
+        try:
+            if not self._started: self._start()
+            worker = self._idle.get()
+            try:
+                worker.tasks.send((fn, args))
+                ok, result = worker.results.recv()
+            except (EOFError, OSError):
+                # 子进程意外退出：回收旧进程与管道，补一个新进程，本次任务按失败处理
+                worker.close()
+                worker = _Worker(self._ctx)
+                raise
+            finally:
+                self._idle.put(worker)
+        finally:
+            with self._lock: self._pending -= 1
+        if not ok: raise result
+        return result
+
+    def stats(self):
+        return {"workers": self.workers, "pending": self._pending, "max_pending": self.max_pending,
+                "submitted": self.submitted, "rejected": self.rejected}
+
+    def shutdown(self):
+        while True:
+            try: worker = self._idle.get_nowait()
+            except queue.Empty: break
+            try: worker.tasks.send(None)
+            except OSError: pass
+            worker.proc.join(1)
+            worker.close()
+        self._started = False
+
+
+def pool_from_env(prefix, workers=None, max_pending=None):
+    """从环境变量读取池配置，如 IMAGE_WORKERS / IMAGE_QUEUE"""
+    workers = int(os.environ.get(f'{prefix}_WORKERS', workers if workers is not None else min(2, os.cpu_count() or 1)))
+    max_pending = int(os.environ.get(f'{prefix}_QUEUE', max_pending if max_pending is not None else max(1, workers) * 4))
+    return WorkerPool(workers, max_pending)